@@ -0,0 +1,215 @@
+"""Auction post addon, kept up to date with the auction's bids"""
+
+import asyncio
+import time
+
+from kenar import CreatePostAddonRequest, OauthResourceType
+from kenar.widgets import DescriptionRow, TitleRow, WideButtonBar  # type: ignore
+
+from auction import divar
+from auction._types import PostToken
+from auction.api.outbox import DELETE_POST_ADDON, outbox_worker
+from auction.core import i18n
+from auction.core.config import ConfigurationError, config
+from auction.core.i18n import gettext as _
+from auction.core.i18n import localize_number
+from auction.core.log import logger
+from auction.model import Auction, OutboxMessage
+from auction.repo import AccessTokenRepo, AuctionLoad, AuctionRepo, OutboxRepo
+
+
+def auction_addon_request(
+    post_token: PostToken, auction: Auction
+) -> CreatePostAddonRequest:
+    """the addon widgets of an auction, in the current language"""
+    return_url = f"https://divar.ir/v/{post_token}"
+    auction_button_link = (
+        str(config.project_url).strip("/")
+        + "/intro"
+        + f"?post_token={post_token}&return_url={return_url}"
+    )
+    button = WideButtonBar.Button(title=_("Enter Auction"), link=auction_button_link)
+    description = _(
+        "This post has an ongoing auction starting"
+        " at {starting_price} rials you can bid on"
+    ).format(starting_price=localize_number(auction.starting_price))
+
+    auction_widgets = [
+        TitleRow(text=_("Auction Available")),
+        DescriptionRow(text=description),
+    ]
+    if auction.bids_count and auction.highest_bid_amount is not None:
+        top_bid = _("{bids_count} bids so far, the highest is {amount} rials").format(
+            bids_count=localize_number(auction.bids_count),
+            amount=localize_number(auction.highest_bid_amount),
+        )
+        auction_widgets.append(DescriptionRow(text=top_bid))
+    auction_widgets.append(WideButtonBar(button=button))
+    return CreatePostAddonRequest(token=post_token, widgets=auction_widgets)
+
+
+class TokenBucket:
+    """allows rate calls per second on average, and bursts of up to burst"""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class AddonRefresher:
+    """
+    Republish the addon of auctions whose bids changed. Changes of a post
+    are coalesced for debounce seconds and the auction is read when its
+    addon is sent, so a post gets at most one update per debounce window
+    however many bids it receives. Updates of all posts share one token
+    bucket to stay within divar's quota. An auction removed while its
+    update was sent gets its addon deleted again through the outbox.
+    """
+
+    def __init__(self, debounce: float = 30, rate: float = 2, burst: int = 10):
+        self.debounce = debounce
+        self.bucket = TokenBucket(rate, burst)
+        self.scheduled = 0
+        self.coalesced = 0
+        self.published = 0
+        self.failed = 0
+        self._due: dict[PostToken, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "published": self.published,
+            "failed": self.failed,
+            "pending": len(self._due),
+        }
+
+    def schedule(self, post_token: PostToken) -> None:
+        """the auction of the post changed, refresh its addon"""
+        if post_token in self._due:
+            self.coalesced += 1
+            return
+        self._due[post_token] = time.monotonic() + self.debounce
+        self.scheduled += 1
+        self._wakeup.set()
+
+    def start(self, auction_repo: AuctionRepo, divar_client: divar.DivarClient) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(auction_repo, divar_client))
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(
+        self, auction_repo: AuctionRepo, divar_client: divar.DivarClient
+    ) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            if self._due:
+                timeout = max(0, min(self._due.values()) - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+            await self.refresh_due(auction_repo, divar_client)
+
+    async def refresh_due(
+        self, auction_repo: AuctionRepo, divar_client: divar.DivarClient
+    ) -> None:
+        """send the addons whose debounce window is over, oldest first"""
+        now = time.monotonic()
+        due = sorted(
+            (due_at, post_token)
+            for post_token, due_at in self._due.items()
+            if due_at <= now
+        )
+        for _due_at, post_token in due:
+            await self.bucket.acquire()
+            # changes from now on wait for the next window
+            del self._due[post_token]
+            try:
+                await self.refresh(auction_repo, divar_client, post_token)
+            except Exception:
+                self.failed += 1
+                logger.exception(f"addon refresh of {post_token} failed")
+
+    async def refresh(
+        self,
+        auction_repo: AuctionRepo,
+        divar_client: divar.DivarClient,
+        post_token: PostToken,
+    ) -> None:
+        auction = await auction_repo.read_auction_by_post_token(
+            post_token=post_token, load=AuctionLoad.BARE
+        )
+        if auction is None:
+            return
+        if not isinstance(auction_repo, AccessTokenRepo) or not isinstance(
+            auction_repo, OutboxRepo
+        ):
+            raise ConfigurationError(
+                "addon refresh needs a repo with access tokens and an outbox,"
+                f" not {type(auction_repo).__name__}"
+            )
+        # the task runs in the default language, render in the seller's
+        i18n.set_lang_code(auction.lang_code)
+        access_token = await auction_repo.get_user_access_token_by_scopes(
+            user_id=auction.seller_id,
+            scopes=[f"{OauthResourceType.POST_ADDON_CREATE.value}.{post_token}"],
+        )
+        if access_token is None:
+            # the seller's token expired, the addon keeps its last content
+            self.failed += 1
+            logger.warning(f"addon refresh of {post_token}: no seller access token")
+            return
+        result = await divar_client.addon.create_post_addon(
+            access_token=access_token["access_token"],
+            data=auction_addon_request(post_token, auction),
+        )
+        if result is None:
+            self.failed += 1
+            return
+        self.published += 1
+
+        # the auction may have been removed and its addon deleted while
+        # this update was sent, which brought the addon back
+        current = await auction_repo.read_auction_by_post_token(
+            post_token=post_token, load=AuctionLoad.BARE
+        )
+        if current is None:
+            message = OutboxMessage(kind=DELETE_POST_ADDON, post_token=post_token)
+            await auction_repo.add_outbox_message(message)
+            outbox_worker.notify()
+        elif current.uid != auction.uid:
+            # a new auction on the post, show it instead
+            self.schedule(post_token)
+
+
+addon_refresher = AddonRefresher(
+    debounce=config.addon_refresh_debounce,
+    rate=config.addon_refresh_rate,
+    burst=config.addon_refresh_burst,
+)
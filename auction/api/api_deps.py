@@ -1,18 +1,30 @@
+from functools import lru_cache
+
 from auction._types import DivarReturnUrl, PostToken
+from auction.core.config import config
 from auction.db import get_session
-from auction.repo import AuctionRepo, SQLARepo, auction_repo
+from auction.repo import AuctionRepo, CachedAuctionRepo, SQLARepo, auction_repo
 
 
 async def get_file_repo() -> AuctionRepo:
     return auction_repo
 
 
-async def get_repo() -> AuctionRepo:
-    sessionmaker = get_session()
-    repo = SQLARepo(session=sessionmaker)
+@lru_cache
+def _sqla_repo() -> SQLARepo | CachedAuctionRepo:
+    """one repo per process, it holds the auction cache and token index"""
+    repo = SQLARepo(session=get_session())
+    if config.auction_cache_enabled:
+        return CachedAuctionRepo(
+            repo, max_size=config.auction_cache_size, ttl=config.auction_cache_ttl
+        )
     return repo
 
 
+async def get_repo() -> AuctionRepo:
+    return _sqla_repo()
+
+
 async def get_return_url(
     post_token: PostToken, return_url: DivarReturnUrl | None = None
 ) -> DivarReturnUrl:
@@ -1,6 +1,9 @@
 """HTTP API for auction app"""
 
+import inspect
+
 from contextlib import asynccontextmanager
+from typing import Any, Callable
 
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI, Request
@@ -9,17 +12,50 @@ from fastapi.staticfiles import StaticFiles
 from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 
+from auction import divar
 from auction.api import auction_router
+from auction.api.addon import addon_refresher
+from auction.api.api_deps import get_repo
+from auction.api.outbox import outbox_worker
+from auction.api.sequencer import bid_sequencer
+from auction.api.stats import stats_logger
 from auction.core import exception, i18n
-from auction.core.config import config
+from auction.core.config import ConfigurationError, config
 from auction.core.log import setup_logging
+from auction.divar import divar_http
 from auction.pages.template import templates
+from auction.repo import AccessTokenRepo, AuctionRepo, OutboxRepo, auction_repo
+
+
+async def _resolve(app: FastAPI, dependency: Callable) -> Any:
+    """value of a dependency outside of a request, overrides included"""
+    value = app.dependency_overrides.get(dependency, dependency)()
+    if inspect.isawaitable(value):
+        value = await value
+    return value
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     setup_logging()
+    repo: AuctionRepo = await _resolve(app, get_repo)
+    if not isinstance(repo, OutboxRepo) or not isinstance(repo, AccessTokenRepo):
+        raise ConfigurationError(
+            "the outbox worker and addon refresher need a repo with an outbox"
+            f" and access tokens, not {type(repo).__name__}"
+        )
+    divar_client = await _resolve(app, divar.get_divar_client)
+    divar_http.open()
+    outbox_worker.start(repo, divar_client)
+    addon_refresher.start(repo, divar_client)
+    stats_logger.start(repo, divar_client)
     yield
+    await stats_logger.close()
+    await addon_refresher.close()
+    await outbox_worker.close()
+    await bid_sequencer.close()
+    await auction_repo.close()
+    await divar_http.close()
 
 
 session_middleware_kwargs = {"secret_key": config.secret_key, "https_only": True}
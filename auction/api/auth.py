@@ -72,7 +72,7 @@ async def authorize_user_and_set_session(
         except InvalidToken as e:
             raise exception.InvalidState from e
         context = state_data.get("context", "home")
-        access_token_data = divar_client.oauth.get_access_token(
+        access_token_data = await divar_client.oauth.get_access_token(
             authorization_token=code
         )
         user_data = await divar_client.finder.get_user(access_token_data.access_token)
@@ -175,7 +175,7 @@ async def auction_management_access(
         except InvalidToken as e:
             raise exception.InvalidState from e
         context = state_data.get("context", "home")
-        access_token_data = divar_client.oauth.get_access_token(
+        access_token_data = await divar_client.oauth.get_access_token(
             authorization_token=code
         )
         await auction_repo.add_user_access_token(
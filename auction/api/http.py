@@ -2,7 +2,7 @@
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Form, Request, status
+from fastapi import APIRouter, Depends, Form, Query, Request, status
 from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from pydantic.networks import AnyHttpUrl
 
@@ -14,7 +14,7 @@ from auction.core import exception
 from auction.core.i18n import gettext as _
 from auction.model import AuctionStartInput, PlaceBid, SelectBid
 from auction.pages.template import templates
-from auction.repo import AuctionRepo
+from auction.repo import AuctionRepo, OutboxRepo
 
 
 auction_router = APIRouter(prefix="/auction")
@@ -175,14 +175,20 @@ async def auction_management(
     user_id: Annotated[UserID, Depends(auth.get_user_id_from_session)],
     user_access_token: Annotated[UserID, Depends(auth.auction_management_access)],
     auction_repo: Annotated[AuctionRepo, Depends(get_repo)],
+    cursor: str | None = None,
+    page_size: Annotated[int, Query(ge=1, le=200)] = service.BIDS_PAGE_SIZE,
 ) -> HTMLResponse:
     auction = await service.auction_management(
-        auction_repo=auction_repo, user_id=user_id, post_token=post_token
+        auction_repo=auction_repo,
+        user_id=user_id,
+        post_token=post_token,
+        cursor=cursor,
+        page_size=page_size,
     )
     return templates.TemplateResponse(
         request=request,
         name="auction_seller.html",
-        context={"auction": auction, "return_url": return_url},
+        context={"auction": auction, "return_url": return_url, "page_size": page_size},
     )
 
 
@@ -227,6 +233,7 @@ async def start_auction(
     seller_id: Annotated[UserID, Depends(auth.get_user_id_from_session)],
     user_access_token: Annotated[UserID, Depends(auth.auction_management_access)],
     auction_repo: Annotated[AuctionRepo, Depends(get_repo)],
+    outbox: Annotated[OutboxRepo, Depends(get_repo)],
     divar_client: Annotated[divar.DivarClient, Depends(divar.get_divar_client)],
 ) -> HTMLResponse:
     """
@@ -235,6 +242,7 @@ async def start_auction(
     """
     result = await service.start_auction(
         auction_repo=auction_repo,
+        outbox=outbox,
         divar_client=divar_client,
         seller_id=seller_id,
         auction_data=auction_data,
@@ -281,14 +289,14 @@ async def remove_auction(
     seller_id: Annotated[UserID, Depends(auth.get_user_id_from_session)],
     user_access_token: Annotated[UserID, Depends(auth.auction_management_access)],
     auction_repo: Annotated[AuctionRepo, Depends(get_repo)],
-    divar_client: Annotated[divar.DivarClient, Depends(divar.get_divar_client)],
+    outbox: Annotated[OutboxRepo, Depends(get_repo)],
 ) -> HTMLResponse:
     """
     Remove an Auction, remove addon widget
     """
     result = await service.remove_auction(
         auction_repo=auction_repo,
-        divar_client=divar_client,
+        outbox=outbox,
         seller_id=seller_id,
         user_access_token=user_access_token,
         post_token=post_token,
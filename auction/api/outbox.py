@@ -0,0 +1,161 @@
+"""Background delivery of divar side effects written to the outbox"""
+
+import asyncio
+import random
+import time
+
+from itertools import groupby
+
+from kenar import DeletePostAddonRequest
+
+from auction import divar
+from auction.core.config import config
+from auction.core.log import logger
+from auction.model import OutboxMessage
+from auction.repo import OutboxRepo
+
+
+CREATE_POST_ADDON = "create_post_addon"
+DELETE_POST_ADDON = "delete_post_addon"
+
+
+class OutboxWorker:
+    """
+    Drain the outbox in batches. Messages of different posts are delivered
+    concurrently, at most concurrency at a time, messages of the same post
+    in the order they were written. A failed delivery is retried with an
+    exponential jittered backoff and dead lettered after max_attempts.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        batch_size: int = 20,
+        poll_interval: float = 1,
+        lease: float = 60,
+        max_attempts: int = 8,
+        retry_delay: float = 2,
+        max_retry_delay: float = 600,
+    ) -> None:
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.delivered = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    def start(self, outbox: OutboxRepo, divar_client: divar.DivarClient) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(outbox, divar_client))
+
+    def notify(self) -> None:
+        """a message was committed, deliver it without waiting for the poll"""
+        self._wakeup.set()
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, outbox: OutboxRepo, divar_client: divar.DivarClient) -> None:
+        while True:
+            try:
+                delivered = await self.run_once(outbox, divar_client)
+            except Exception:
+                logger.exception("outbox worker error")
+                delivered = 0
+            if delivered < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def run_once(
+        self, outbox: OutboxRepo, divar_client: divar.DivarClient
+    ) -> int:
+        """deliver one batch of due messages, returns how many were claimed"""
+        messages = await outbox.claim_outbox_messages(self.batch_size, self.lease)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver_post_messages(post_messages: list[OutboxMessage]) -> None:
+            async with semaphore:
+                for message in post_messages:
+                    await self._deliver(outbox, divar_client, message)
+
+        by_post = sorted(messages, key=lambda message: message.post_token)
+        await asyncio.gather(
+            *(
+                deliver_post_messages(sorted(group, key=lambda m: m.created_at))
+                for _, group in groupby(by_post, key=lambda m: m.post_token)
+            )
+        )
+        return len(messages)
+
+    async def _deliver(
+        self,
+        outbox: OutboxRepo,
+        divar_client: divar.DivarClient,
+        message: OutboxMessage,
+    ) -> None:
+        try:
+            result = await _send(divar_client, message)
+            error = None if result is not None else "rejected by divar"
+        except Exception as e:
+            error = repr(e)
+        if error is None:
+            await outbox.complete_outbox_message(message)
+            self.delivered += 1
+            return
+
+        self.failed += 1
+        retry_at = None
+        if message.attempts + 1 < self.max_attempts:
+            backoff = min(self.max_retry_delay, self.retry_delay * 2**message.attempts)
+            retry_at = time.time() + random.uniform(backoff / 2, backoff)
+        else:
+            self.dead_lettered += 1
+            logger.error(f"outbox {message.kind} {message.post_token} dead: {error}")
+        await outbox.fail_outbox_message(message, error, retry_at)
+
+
+async def _send(divar_client: divar.DivarClient, message: OutboxMessage):
+    if message.kind == CREATE_POST_ADDON:
+        return await divar_client.addon.send_post_addon(
+            access_token=message.payload["access_token"],
+            post_token=message.post_token,
+            content=message.payload["content"],
+        )
+    if message.kind == DELETE_POST_ADDON:
+        return await divar_client.addon.delete_post_addon(
+            data=DeletePostAddonRequest(token=message.post_token)
+        )
+    raise ValueError(f"unknown outbox message kind {message.kind}")
+
+
+outbox_worker = OutboxWorker(
+    concurrency=config.outbox_concurrency,
+    batch_size=config.outbox_batch_size,
+    poll_interval=config.outbox_poll_interval,
+    lease=config.outbox_lease,
+    max_attempts=config.outbox_max_attempts,
+    retry_delay=config.outbox_retry_delay,
+    max_retry_delay=config.outbox_max_retry_delay,
+)
@@ -0,0 +1,136 @@
+"""Per auction single writer for bids"""
+
+import asyncio
+
+from dataclasses import dataclass
+from itertools import groupby
+
+from auction._types import AuctionID, Rial, UserID
+from auction.core.config import config
+from auction.core.log import logger
+from auction.model import Bid
+from auction.repo import AuctionRepo
+
+
+@dataclass
+class _PendingBid:
+    auction_repo: AuctionRepo
+    bidder_id: UserID
+    amount: Rial
+    future: asyncio.Future[Bid]
+
+
+class BidSequencer:
+    """
+    Serialize bid writes of each auction through one worker task per auction.
+    Bids that pile up while a write is in progress are written together in a
+    single unit of work and every caller gets its own bid back. If the batch
+    fails its bids are written again one at a time, so only the callers whose
+    own bid failed get an error.
+    Workers of auctions without bids for idle_timeout seconds are evicted,
+    bids on different auctions are written in parallel.
+    """
+
+    def __init__(self, idle_timeout: float = 30, max_batch_size: int = 50) -> None:
+        self.idle_timeout = idle_timeout
+        self.max_batch_size = max_batch_size
+        self._queues: dict[AuctionID, asyncio.Queue[_PendingBid | None]] = {}
+        self._workers: dict[AuctionID, asyncio.Task] = {}
+
+    async def upsert_bid(
+        self,
+        auction_repo: AuctionRepo,
+        auction_id: AuctionID,
+        bidder_id: UserID,
+        amount: Rial,
+    ) -> Bid:
+        loop = asyncio.get_running_loop()
+        worker = self._workers.get(auction_id)
+        if worker is None or worker.done() or worker.get_loop() is not loop:
+            queue: asyncio.Queue[_PendingBid | None] = asyncio.Queue()
+            self._queues[auction_id] = queue
+            self._workers[auction_id] = loop.create_task(self._run(auction_id, queue))
+
+        future: asyncio.Future[Bid] = loop.create_future()
+        pending = _PendingBid(auction_repo, bidder_id, amount, future)
+        self._queues[auction_id].put_nowait(pending)
+        return await future
+
+    async def close(self) -> None:
+        """write the bids already queued, then stop the workers"""
+        workers = list(self._workers.values())
+        for queue in self._queues.values():
+            queue.put_nowait(None)
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run(
+        self, auction_id: AuctionID, queue: asyncio.Queue[_PendingBid | None]
+    ) -> None:
+        closing = False
+        try:
+            while not (closing and queue.empty()):
+                try:
+                    first = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except TimeoutError:
+                    if queue.empty():
+                        return
+                    continue
+                batch = [first]
+                while not queue.empty() and len(batch) < self.max_batch_size:
+                    batch.append(queue.get_nowait())
+                if any(pending is None for pending in batch):
+                    closing = True
+                await self._write(
+                    auction_id, [pending for pending in batch if pending is not None]
+                )
+        finally:
+            if self._queues.get(auction_id) is queue:
+                del self._queues[auction_id]
+                del self._workers[auction_id]
+            while not queue.empty():
+                pending = queue.get_nowait()
+                if pending is not None:
+                    pending.future.cancel()
+
+    async def _write(self, auction_id: AuctionID, batch: list[_PendingBid]) -> None:
+        # callers may pass different repos, each is written in its own batch
+        for _, group in groupby(batch, key=lambda pending: id(pending.auction_repo)):
+            await self._write_batch(auction_id, list(group))
+
+    async def _write_batch(
+        self, auction_id: AuctionID, batch: list[_PendingBid]
+    ) -> None:
+        """write a batch in one transaction, callers see results after commit"""
+        auction_repo = batch[0].auction_repo
+        bids: list[Bid] = []
+        try:
+            async with auction_repo.unit_of_work():
+                for pending in batch:
+                    bid = await auction_repo.upsert_bid(
+                        auction_id=auction_id,
+                        bidder_id=pending.bidder_id,
+                        amount=pending.amount,
+                    )
+                    bids.append(bid)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"bid write error on auction {auction_id}: {e}")
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+            # upserts are idempotent, bids a repo without rollback already
+            # wrote are written again with the same amount
+            logger.warning(f"bid batch write error on auction {auction_id}: {e}")
+            for pending in batch:
+                await self._write_batch(auction_id, [pending])
+            return
+
+        for pending, bid in zip(batch, bids, strict=True):
+            if not pending.future.done():
+                pending.future.set_result(bid)
+
+
+bid_sequencer = BidSequencer(
+    idle_timeout=config.bid_sequencer_idle_timeout,
+    max_batch_size=config.bid_sequencer_max_batch_size,
+)
@@ -1,25 +1,54 @@
 """Auction services"""
 
+import asyncio
+import random
+
+from typing import Awaitable, Callable, TypeVar
+
 from auction import divar
 from auction._types import BidID, DivarReturnUrl, Rial
-from auction.core import exception
-from auction.core.config import config
+from auction.api.addon import addon_refresher, auction_addon_request
+from auction.api.outbox import CREATE_POST_ADDON, DELETE_POST_ADDON, outbox_worker
+from auction.api.sequencer import bid_sequencer
+from auction.core import exception, i18n
 from auction.core.i18n import gettext as _
-from auction.core.i18n import localize_number
 from auction.model import (
     Auction,
     AuctionBidderView,
+    AuctionSellerView,
     AuctionStartInput,
     Bid,
+    BidCursor,
+    OutboxMessage,
     PlaceBid,
     Post,
     PostToken,
     UserID,
 )
-from auction.repo import AuctionRepo
+from auction.repo import AuctionLoad, AuctionRepo, OutboxRepo
 
 
 TOP_BIDS_COUNT = 3
+BIDS_PAGE_SIZE = 50
+CONFLICT_RETRIES = 3
+
+T = TypeVar("T")
+
+
+async def retry_on_conflict(
+    operation: Callable[[], Awaitable[T]], retries: int = CONFLICT_RETRIES
+) -> T:
+    """
+    run operation, and run it again with a short jittered backoff each time it
+    hits a concurrent update, at most retries more times.
+    operation must read the state it changes so every attempt sees fresh data
+    """
+    for attempt in range(retries):
+        try:
+            return await operation()
+        except exception.ConcurrentUpdate:
+            await asyncio.sleep(random.uniform(0, 0.01 * 2**attempt))
+    return await operation()
 
 
 async def auction_intro(
@@ -43,7 +72,9 @@ async def is_auction_seller(
 ) -> bool:
     await divar_client.finder.validate_post(post_token=post_token)
 
-    auction = await auction_repo.read_auction_by_post_token(post_token=post_token)
+    auction = await auction_repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.BARE
+    )
     if auction is None:
         raise exception.AuctionNotFound()
 
@@ -57,7 +88,9 @@ async def auction_bidding(
     post_token: PostToken,
     return_url: DivarReturnUrl,
 ) -> AuctionBidderView:
-    auction = await auction_repo.read_auction_by_post_token(post_token=post_token)
+    auction = await auction_repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.COUNT
+    )
     if auction is None:
         raise exception.AuctionNotFound()
     if auction.seller_id == user_id:
@@ -65,7 +98,9 @@ async def auction_bidding(
 
     last_bid = await auction_repo.find_bid(auction_id=auction.uid, bidder_id=user_id)
     last_bid_amount = last_bid.amount if last_bid else Rial(0)
-    top_bids = sorted(auction.bids)[::-1][:TOP_BIDS_COUNT]
+    top_bids = await auction_repo.read_top_bids(
+        auction_id=auction.uid, n=TOP_BIDS_COUNT
+    )
     return AuctionBidderView(
         post_token=post_token,
         post_title=auction.post_title,
@@ -83,13 +118,39 @@ async def auction_management(
     auction_repo: AuctionRepo,
     user_id: UserID,
     post_token: PostToken,
-) -> Auction:
-    auction = await auction_repo.read_auction_by_post_token(post_token=post_token)
+    cursor: str | None = None,
+    page_size: int = BIDS_PAGE_SIZE,
+) -> AuctionSellerView:
+    try:
+        after = BidCursor.decode(cursor) if cursor else None
+    except ValueError as e:
+        raise exception.InvalidCursor() from e
+
+    auction = await auction_repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.COUNT
+    )
     if auction is None:
         raise exception.AuctionNotFound()
     if auction.seller_id != user_id:
         raise exception.Forbidden()
-    return auction
+
+    # read one extra bid to know if there is a next page
+    bids = await auction_repo.read_bids_page(
+        auction_id=auction.uid, limit=page_size + 1, after=after
+    )
+    next_cursor = None
+    if len(bids) > page_size:
+        bids = bids[:page_size]
+        next_cursor = BidCursor.from_bid(bids[-1]).encode()
+    return AuctionSellerView(
+        post_token=auction.post_token,
+        post_title=auction.post_title,
+        bids_count=auction.bids_count,
+        uid=auction.uid,
+        selected_bid=auction.selected_bid,
+        bids=bids,
+        next_cursor=next_cursor,
+    )
 
 
 async def place_bid(
@@ -100,7 +161,7 @@ async def place_bid(
 ) -> Bid:
     """place a bid on an auction"""
     auction = await auction_repo.read_auction_by_post_token(
-        post_token=bid_data.post_token
+        post_token=bid_data.post_token, load=AuctionLoad.BARE
     )
     if auction is None:
         raise exception.AuctionNotFound()
@@ -121,15 +182,15 @@ async def place_bid(
             _("Bid amount must starting price + multiple of min raise amount")
         )
 
-    bid = None
-    last_bid = await auction_repo.find_bid(auction_id=auction.uid, bidder_id=bidder_id)
-    if last_bid:
-        bid = await auction_repo.change_bid_amount(bid=last_bid, amount=bid_data.amount)
-        await auction_repo.remove_selected_bid(last_bid.uid)
-    else:
-        bid = Bid(bidder_id=bidder_id, auction_id=auction.uid, amount=bid_data.amount)
-        await auction_repo.add_bid(bid=bid)
+    # writes on the same auction go through a single writer
+    bid = await bid_sequencer.upsert_bid(
+        auction_repo=auction_repo,
+        auction_id=auction.uid,
+        bidder_id=bidder_id,
+        amount=bid_data.amount,
+    )
 
+    addon_refresher.schedule(bid_data.post_token)
     # send BID_PLACED event (send new bid in chat, etc)
     return bid
 
@@ -139,7 +200,9 @@ async def remove_bid(
     bidder_id: UserID,
     post_token: PostToken,
 ) -> None:
-    auction = await auction_repo.read_auction_by_post_token(post_token=post_token)
+    auction = await auction_repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.BARE
+    )
     if auction is None:
         raise exception.AuctionNotFound()
 
@@ -149,43 +212,30 @@ async def remove_bid(
         raise exception.BidNotFound()
 
     await auction_repo.remove_bid(bid_id=bid.uid)
+    addon_refresher.schedule(post_token)
 
     return None
 
 
 async def create_auction_addon(
-    divar_client: divar.DivarClient,
+    outbox: OutboxRepo,
     user_access_token: str,
     post_token: PostToken,
     auction: Auction,
 ) -> None:
-    from kenar import CreatePostAddonRequest
-    from kenar.widgets import DescriptionRow, TitleRow, WideButtonBar  # type: ignore
-
+    """queue creating the auction addon, the outbox worker sends it to divar"""
     # access token must have USER_ADDON_CREATE scope access
-    return_url = f"https://divar.ir/v/{post_token}"
-    auction_button_link = (
-        str(config.project_url).strip("/")
-        + "/intro"
-        + f"?post_token={post_token}&return_url={return_url}"
-    )
-    button = WideButtonBar.Button(title=_("Enter Auction"), link=auction_button_link)
-    description = _(
-        "This post has an ongoing auction starting"
-        " at {starting_price} rials you can bid on"
-    ).format(starting_price=localize_number(auction.starting_price))
-
-    auction_widgets = [
-        TitleRow(text=_("Auction Available")),
-        DescriptionRow(text=description),
-        WideButtonBar(button=button),
-    ]
-    create_addon_data = CreatePostAddonRequest(
-        token=post_token, widgets=auction_widgets
-    )
-    await divar_client.addon.create_post_addon(
-        access_token=user_access_token, data=create_addon_data
+    create_addon_data = auction_addon_request(post_token, auction)
+    # widgets are rendered now, in the language of the seller's request
+    message = OutboxMessage(
+        kind=CREATE_POST_ADDON,
+        post_token=post_token,
+        payload={
+            "access_token": user_access_token,
+            "content": create_addon_data.model_dump_json(exclude={"token"}),
+        },
     )
+    await outbox.add_outbox_message(message)
 
 
 async def start_auction_view(
@@ -196,7 +246,7 @@ async def start_auction_view(
 ) -> Post:
     """start a new auction view"""
     auction_is_started = await auction_repo.read_auction_by_post_token(
-        post_token=post_token
+        post_token=post_token, load=AuctionLoad.BARE
     )
     if auction_is_started:
         raise exception.AuctionAlreadyStarted()
@@ -212,6 +262,7 @@ async def start_auction_view(
 
 async def start_auction(
     auction_repo: AuctionRepo,
+    outbox: OutboxRepo,
     divar_client: divar.DivarClient,
     seller_id: UserID,
     auction_data: AuctionStartInput,
@@ -219,11 +270,13 @@ async def start_auction(
 ) -> Auction:
     """start a new auction"""
     auction_is_started = await auction_repo.read_auction_by_post_token(
-        post_token=auction_data.post_token
+        post_token=auction_data.post_token, load=AuctionLoad.BARE
     )
     if auction_is_started:
         raise exception.AuctionAlreadyStarted()
 
+    # the post may be new, don't trust a cached miss from before it existed
+    divar_client.finder.invalidate_post(auction_data.post_token)
     await divar_client.finder.validate_post(post_token=auction_data.post_token)
     post = await divar_client.finder.find_post_from_user_posts(
         post_token=auction_data.post_token, user_access_token=user_access_token
@@ -235,15 +288,17 @@ async def start_auction(
         **auction_data.model_dump(),
         seller_id=seller_id,
         post_title=post.title,
+        lang_code=i18n.get_lang_code(),
     )
-    await auction_repo.add_auction(auction=auction)
-
-    await create_auction_addon(
-        divar_client=divar_client,
-        user_access_token=user_access_token,
-        post_token=auction_data.post_token,
-        auction=auction,
-    )
+    async with auction_repo.unit_of_work():
+        await auction_repo.add_auction(auction=auction)
+        await create_auction_addon(
+            outbox=outbox,
+            user_access_token=user_access_token,
+            post_token=auction_data.post_token,
+            auction=auction,
+        )
+    outbox_worker.notify()
     return auction
 
 
@@ -268,36 +323,49 @@ async def select_bid(
     if not is_post_owner:
         raise exception.Forbidden()
 
-    await auction_repo.select_bid(auction, bid_id=bid_id)
+    async def select_on_latest_auction() -> Auction:
+        # reads in a unit of work skip the auction cache, whose version may
+        # be as stale as the one that conflicted
+        async with auction_repo.unit_of_work():
+            latest_auction = await auction_repo.read_auction_by_id(
+                auction_id=bid.auction_id
+            )
+            if latest_auction is None:
+                raise exception.AuctionNotFound()
+            return await auction_repo.select_bid(latest_auction, bid_id=bid_id)
+
+    try:
+        auction = await auction_repo.select_bid(auction, bid_id=bid_id)
+    except exception.ConcurrentUpdate:
+        auction = await retry_on_conflict(select_on_latest_auction)
     # send BID_SELECTED event
     return auction
 
 
 async def remove_auction(
     auction_repo: AuctionRepo,
-    divar_client: divar.DivarClient,
+    outbox: OutboxRepo,
     seller_id: UserID,
     user_access_token: str,
     post_token: PostToken,
 ) -> Auction:
     """remove an auction"""
-    auction = await auction_repo.read_auction_by_post_token(post_token=post_token)
+    auction = await auction_repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.BARE
+    )
     if auction is None:
         raise exception.AuctionNotFound()
 
     if seller_id != auction.seller_id:
         raise exception.Forbidden()
 
-    # TODO: remove widget on auction removed event
-    remove_addon_data = divar.client.DeletePostAddonRequest(token=post_token)
-    remove_addon_result = await divar_client.addon.delete_post_addon(
-        data=remove_addon_data
-    )
-
-    if remove_addon_result is None:
-        raise exception.AuctionRemoveFailure()
-
-    await auction_repo.remove_auction(auction_id=auction.uid)
-    await auction_repo.remove_bids_by_auction_id(auction_id=auction.uid)
+    async with auction_repo.unit_of_work():
+        await auction_repo.remove_auction(auction_id=auction.uid)
+        await auction_repo.remove_bids_by_auction_id(auction_id=auction.uid)
+        # an addon not created yet must not show up after the removal
+        await outbox.cancel_outbox_messages(post_token, CREATE_POST_ADDON)
+        message = OutboxMessage(kind=DELETE_POST_ADDON, post_token=post_token)
+        await outbox.add_outbox_message(message)
+    outbox_worker.notify()
 
     return auction
@@ -0,0 +1,56 @@
+"""Periodic logging of the in-process caches, breakers and workers"""
+
+import asyncio
+import json
+
+from auction import divar
+from auction.api.addon import addon_refresher
+from auction.api.outbox import outbox_worker
+from auction.core.config import config
+from auction.core.log import logger
+from auction.divar.client import AuctionFinderService
+from auction.repo import AuctionRepo, CachedAuctionRepo
+
+
+class StatsLogger:
+    """log the stats of the app's components every interval seconds"""
+
+    def __init__(self, interval: float = 60) -> None:
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self, auction_repo: AuctionRepo, divar_client: divar.DivarClient) -> None:
+        if self.interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(auction_repo, divar_client))
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(
+        self, auction_repo: AuctionRepo, divar_client: divar.DivarClient
+    ) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            logger.info(f"stats {json.dumps(collect(auction_repo, divar_client))}")
+
+
+def collect(auction_repo: AuctionRepo, divar_client: divar.DivarClient) -> dict:
+    stats: dict = {
+        "outbox": outbox_worker.stats,
+        "addon_refresh": addon_refresher.stats,
+        "divar_breakers": divar.divar_resilience.stats,
+    }
+    if isinstance(auction_repo, CachedAuctionRepo):
+        stats["auction_cache"] = auction_repo.stats
+    if isinstance(divar_client.finder, AuctionFinderService):
+        stats["post_cache"] = divar_client.finder.post_cache.stats
+    return stats
+
+
+stats_logger = StatsLogger(interval=config.stats_log_interval)
@@ -1,6 +1,6 @@
 import secrets
 
-from typing import NewType
+from typing import Literal, NewType
 
 from pydantic import AnyHttpUrl, AnyUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -11,11 +11,26 @@ from auction._types import UserID
 LanguageCode = NewType("LanguageCode", str)
 
 
+class ConfigurationError(Exception):
+    """the configured components can't work together"""
+
+
 class DivarConfig(BaseSettings):
     app_slug: str
     api_key: str
     oauth_secret: str
     oauth_redirect_url: str
+    timeout: float = 1
+    timeouts: dict[str, float] = {}
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30
+    http2: bool = False
+    max_retry: int = 2
+    retry_delay: float = 0.1
+    max_retry_delay: float = 1
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30
 
     model_config = SettingsConfigDict(
         env_file=".env", env_prefix="divar_", extra="allow"
@@ -31,6 +46,37 @@ class Config(BaseSettings):
     templates_dir_path: str = "auction/pages"
     mock_user_id: UserID
     database_url: AnyUrl
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_pre_ping: bool = True
+    database_pool_recycle: int = 1800
+    database_sqlite_wal: bool = True
+    database_sqlite_busy_timeout: int = 5000
+    database_sqlite_mmap_size: int = 268435456
+    database_sqlite_cache_size: int = -65536
+    bid_sequencer_idle_timeout: float = 30
+    bid_sequencer_max_batch_size: int = 50
+    outbox_concurrency: int = 4
+    outbox_batch_size: int = 20
+    outbox_poll_interval: float = 1
+    outbox_lease: float = 60
+    outbox_max_attempts: int = 8
+    outbox_retry_delay: float = 2
+    outbox_max_retry_delay: float = 600
+    addon_refresh_debounce: float = 30
+    addon_refresh_rate: float = 2
+    addon_refresh_burst: int = 10
+    auction_cache_enabled: bool = True
+    auction_cache_size: int = 1024
+    auction_cache_ttl: float = 5
+    post_cache_size: int = 4096
+    post_cache_ttl: float = 60
+    post_cache_negative_ttl: float = 5
+    stats_log_interval: float = 60  # 0 turns the stats log off
+    json_db_write_behind: bool = False
+    json_db_flush_interval: float = 1
+    json_db_flush_max_pending: int = 100
+    json_db_snapshot_format: Literal["json", "binary"] = "json"
 
     model_config = SettingsConfigDict(env_file=".env", extra="allow")
 
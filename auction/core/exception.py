@@ -58,6 +58,13 @@ class InvalidBidAmount(HTTPException):
         super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
 
 
+class InvalidCursor(HTTPException):
+    def __init__(self, detail: str | None = None):
+        if detail is None:
+            detail = _("Invalid page cursor")
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
 class InvalidSession(HTTPException):
     def __init__(self, detail: str | None = None):
         if detail is None:
@@ -86,6 +93,20 @@ class AuctionRemoveFailure(HTTPException):
         super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
 
 
+class ConcurrentUpdate(HTTPException):
+    def __init__(self, detail: str | None = None):
+        if detail is None:
+            detail = _("Auction was changed by another request, please try again")
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+class DivarUnavailable(HTTPException):
+    def __init__(self, detail: str | None = None):
+        if detail is None:
+            detail = _("Divar is not responding, please try again later")
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+
+
 class OAuthRedirect(HTTPException):
     """This class is used to redirect user in a dependency function"""
 
@@ -1,13 +1,24 @@
-from uuid import uuid4
+from uuid import UUID, uuid4
 
-from sqlalchemy import BigInteger, String, Uuid
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Double,
+    Index,
+    String,
+    Text,
+    Uuid,
+    desc,
+    event,
+    false,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, MappedAsDataclass, mapped_column
 from sqlalchemy.schema import PrimaryKeyConstraint
 
 from auction import _types, model
 
 
-__all__ = ["Base", "Auction"]
+__all__ = ["Base", "Auction", "AccessToken", "OutboxMessage"]
 
 
 class Base(DeclarativeBase, MappedAsDataclass):
@@ -22,7 +33,10 @@ class Base(DeclarativeBase, MappedAsDataclass):
 
 class Auction(Base):
     __tablename__ = "auctions"
-    __table_args__ = (PrimaryKeyConstraint("uid", name="auction_pk"),)
+    __table_args__ = (
+        PrimaryKeyConstraint("uid", name="auction_pk"),
+        Index("auction_post_token_idx", "post_token", unique=True),
+    )
 
     post_token: Mapped[_types.PostToken]
     seller_id: Mapped[_types.UserID]
@@ -30,17 +44,82 @@ class Auction(Base):
     starting_price: Mapped[_types.Rial] = mapped_column(default=0)
     post_title: Mapped[str] = mapped_column(String(100), default="")
     uid: Mapped[_types.AuctionID] = mapped_column(default_factory=uuid4)
+    # denormalized bid stats, kept up to date by the repo on every bid write
+    bids_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    highest_bid_amount: Mapped[_types.Rial | None] = mapped_column(default=None)
+    highest_bid_id: Mapped[_types.BidID | None] = mapped_column(default=None)
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
+    lang_code: Mapped[str] = mapped_column(String(8), default="fa", server_default="fa")
 
 
 class Bid(Base):
     __tablename__ = "bids"
-    __table_args__ = (PrimaryKeyConstraint("uid", name="bid_pk"),)
+    __table_args__ = (
+        PrimaryKeyConstraint("uid", name="bid_pk"),
+        Index("bid_auction_bidder_idx", "auction_id", "bidder_id", unique=True),
+        Index("bid_auction_amount_idx", "auction_id", desc("amount"), desc("uid")),
+    )
 
     auction_id: Mapped[_types.AuctionID]
     bidder_id: Mapped[_types.UserID]
     amount: Mapped[_types.Rial]
     uid: Mapped[_types.BidID] = mapped_column(default_factory=uuid4)
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
 
 
-Base.registry.map_imperatively(model.Auction, local_table=Auction.__table__)
-Base.registry.map_imperatively(model.Bid, local_table=Bid.__table__)
+class AccessToken(Base):
+    __tablename__ = "access_tokens"
+    __table_args__ = (
+        PrimaryKeyConstraint("uid", name="access_token_pk"),
+        Index("access_token_user_idx", "user_id", "expires_at"),
+        Index("access_token_expires_at_idx", "expires_at"),
+    )
+
+    user_id: Mapped[_types.UserID]
+    access_token: Mapped[str] = mapped_column(Text)
+    scope: Mapped[str] = mapped_column(Text)
+    expires_at: Mapped[int] = mapped_column(BigInteger)
+    data: Mapped[dict] = mapped_column(JSON)
+    uid: Mapped[UUID] = mapped_column(default_factory=uuid4)
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        PrimaryKeyConstraint("uid", name="outbox_pk"),
+        Index("outbox_due_idx", "dead", "next_attempt_at"),
+        Index("outbox_post_token_idx", "post_token"),
+    )
+
+    kind: Mapped[str] = mapped_column(String(32))
+    post_token: Mapped[_types.PostToken]
+    payload: Mapped[dict] = mapped_column(JSON)
+    next_attempt_at: Mapped[float] = mapped_column(Double)
+    created_at: Mapped[float] = mapped_column(Double)
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0")
+    dead: Mapped[bool] = mapped_column(default=False, server_default=false())
+    last_error: Mapped[str | None] = mapped_column(Text, default=None)
+    uid: Mapped[UUID] = mapped_column(default_factory=uuid4)
+
+
+# orm updates of a stale object (version changed since it was read) raise
+# StaleDataError instead of overwriting the newer row
+Base.registry.map_imperatively(
+    model.Auction,
+    local_table=Auction.__table__,
+    version_id_col=Auction.__table__.c.version,
+)
+Base.registry.map_imperatively(
+    model.Bid,
+    local_table=Bid.__table__,
+    version_id_col=Bid.__table__.c.version,
+)
+
+Base.registry.map_imperatively(model.AccessToken, local_table=AccessToken.__table__)
+Base.registry.map_imperatively(model.OutboxMessage, local_table=OutboxMessage.__table__)
+
+
+@event.listens_for(model.Auction, "load")
+def _init_auction_bids(auction: model.Auction, context) -> None:
+    """loaded auctions skip __init__, give them the bids list default"""
+    auction.bids = []
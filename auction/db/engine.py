@@ -1,6 +1,7 @@
 from functools import lru_cache
+from typing import Any
 
-from sqlalchemy import select
+from sqlalchemy import event, make_url, select
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -12,11 +13,40 @@ from auction.core.config import config
 from auction.db.base import Base
 
 
+def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    """
+    run on every new sqlite connection, WAL lets readers and a writer work
+    concurrently and busy_timeout waits for locks instead of failing
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={config.database_sqlite_busy_timeout}")
+    cursor.execute(f"PRAGMA mmap_size={config.database_sqlite_mmap_size}")
+    cursor.execute(f"PRAGMA cache_size={config.database_sqlite_cache_size}")
+    cursor.close()
+
+
 @lru_cache
 def get_engine(database_url: str | None = None) -> AsyncEngine:
     if database_url is None:
         database_url = str(config.database_url)
-    engine = create_async_engine(database_url, echo=False)
+    url = make_url(database_url)
+    is_sqlite = url.get_backend_name() == "sqlite"
+
+    engine_kwargs: dict[str, Any] = {
+        "echo": False,
+        "pool_pre_ping": config.database_pool_pre_ping,
+        "pool_recycle": config.database_pool_recycle,
+    }
+    # in memory sqlite databases use a static pool without size limits
+    if not (is_sqlite and url.database in (None, "", ":memory:")):
+        engine_kwargs["pool_size"] = config.database_pool_size
+        engine_kwargs["max_overflow"] = config.database_max_overflow
+
+    engine = create_async_engine(url, **engine_kwargs)
+    if is_sqlite and config.database_sqlite_wal:
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
     return engine
 
 
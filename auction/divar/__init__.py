@@ -1,4 +1,10 @@
-from .client import DivarClient, divar_client, get_divar_client
+from .client import (
+    DivarClient,
+    divar_client,
+    divar_http,
+    divar_resilience,
+    get_divar_client,
+)
 from .client_mock import DivarClientMock, divar_client_mock, get_divar_client_mock
 
 
@@ -7,6 +13,8 @@ __all__ = [
     "DivarClientMock",
     "divar_client",
     "divar_client_mock",
+    "divar_http",
+    "divar_resilience",
     "get_divar_client",
     "get_divar_client_mock",
 ]
@@ -0,0 +1,62 @@
+import time
+
+from collections import OrderedDict
+
+from auction._types import PostToken
+
+from .schemas import PostItemResponse
+
+
+class PostCache:
+    """
+    bounded LRU of divar posts by token with a TTL.
+    missing posts are cached too, for a shorter negative_ttl, so a post
+    that gets published shortly after is not hidden for long
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 60, negative_ttl: float = 5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[PostToken, tuple[float, PostItemResponse | None]] = (
+            OrderedDict()
+        )
+
+    @property
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def get(self, post_token: PostToken) -> tuple[bool, PostItemResponse | None]:
+        entry = self._entries.get(post_token)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[post_token]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(post_token)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, post_token: PostToken, post: PostItemResponse | None) -> None:
+        ttl = self.ttl if post is not None else self.negative_ttl
+        self._entries.pop(post_token, None)
+        self._entries[post_token] = (time.monotonic() + ttl, post)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, post_token: PostToken) -> None:
+        self._entries.pop(post_token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
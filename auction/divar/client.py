@@ -1,7 +1,7 @@
 import httpx
 
-from kenar import Client as DivarClient
 from kenar import (
+    AccessTokenResponse,
     ClientConfig,
     CreatePostAddonRequest,
     CreatePostAddonResponse,
@@ -13,16 +13,27 @@ from kenar import (
     GetUserPostsResponse,
     GetUserRequest,
     GetUserResponse,
+    OAuthAccessTokenRequest,
+)
+from kenar import Client as DivarClient
+from kenar.app import (
+    ACCESS_TOKEN_HEADER_NAME,
+    AddonService,
+    FinderService,
+    OAuthService,
 )
-from kenar.app import ACCESS_TOKEN_HEADER_NAME, AddonService, FinderService
 
 from auction import model
 from auction._types import PostToken
 from auction.core.config import config, divar_config
-from auction.core.exception import PostNotFound
+from auction.core.exception import InvalidSession, PostNotFound
 from auction.core.log import logger
 
+from .cache import PostCache
+from .http import DivarHTTPClient
+from .resilience import Resilience
 from .schemas import PostItemResponse
+from .singleflight import SingleFlight
 
 
 client_conf = ClientConfig(
@@ -34,32 +45,76 @@ client_conf = ClientConfig(
 
 divar_client = DivarClient(client_conf)
 
+divar_http = DivarHTTPClient(
+    divar_client._client,
+    max_connections=divar_config.max_connections,
+    max_keepalive_connections=divar_config.max_keepalive_connections,
+    keepalive_expiry=divar_config.keepalive_expiry,
+    timeout=divar_config.timeout,
+    timeouts=divar_config.timeouts,
+    http2=divar_config.http2,
+)
+
+divar_resilience = Resilience(
+    max_retry=divar_config.max_retry,
+    retry_delay=divar_config.retry_delay,
+    max_retry_delay=divar_config.max_retry_delay,
+    failure_threshold=divar_config.breaker_failure_threshold,
+    reset_timeout=divar_config.breaker_reset_timeout,
+)
+
 
 class AuctionAddonService(AddonService):
-    def __init__(self, client: httpx.Client):
+    def __init__(
+        self,
+        client: httpx.Client,
+        resilience: Resilience = divar_resilience,
+        http: DivarHTTPClient = divar_http,
+    ):
         self._client = client
-        self._aclient = httpx.AsyncClient(
-            timeout=1,
-            headers=client.headers,
-            base_url=client.base_url,
-        )
+        self._resilience = resilience
+        self._http = http
+        self._flights = SingleFlight()
         super().__init__(client=client)
 
+    @property
+    def _aclient(self) -> httpx.AsyncClient:
+        return self._http.client
+
     async def create_post_addon(
         self,
         access_token: str,
         data: CreatePostAddonRequest,
-    ) -> CreatePostAddonResponse:
+    ) -> CreatePostAddonResponse | None:
+        return await self.send_post_addon(
+            access_token=access_token,
+            post_token=data.token,
+            content=data.model_dump_json(exclude={"token"}),
+        )
+
+    async def send_post_addon(
+        self, access_token: str, post_token: str, content: str
+    ) -> CreatePostAddonResponse | None:
+        """create_post_addon with an already serialized request body"""
+
         async def send_request():
             return await self._aclient.post(
-                url=f"/v2/open-platform/addons/post/{data.token}",
-                content=data.model_dump_json(exclude={"token"}),
+                url=f"/v2/open-platform/addons/post/{post_token}",
+                timeout=self._http.timeout("create_post_addon"),
+                content=content,
                 headers={ACCESS_TOKEN_HEADER_NAME: access_token},
             )
 
-        rsp = await send_request()
+        key = ("create_post_addon", access_token, post_token, content)
+        rsp = await self._flights.do(
+            key,
+            lambda: self._resilience.call(
+                "create_post_addon", send_request, idempotent=False
+            ),
+        )
         if not rsp.is_success:
             logger.error(f"create_post_addon error: {rsp.status_code} {rsp.text}")
+            return None
         return CreatePostAddonResponse()
 
     async def delete_post_addon(
@@ -69,10 +124,14 @@ class AuctionAddonService(AddonService):
         async def send_request():
             return await self._aclient.delete(
                 url=f"/v1/open-platform/addons/post/{data.token}",
+                timeout=self._http.timeout("delete_post_addon"),
                 params=data.json(),
             )
 
-        rsp = await send_request()
+        key = ("delete_post_addon", data.json())
+        rsp = await self._flights.do(
+            key, lambda: self._resilience.call("delete_post_addon", send_request)
+        )
         if not rsp.is_success:
             logger.error(f"delete_post_addon error: {rsp.status_code} {rsp.text}")
             return None
@@ -82,29 +141,47 @@ class AuctionAddonService(AddonService):
 class AuctionFinderService(FinderService):
     """finder service with some fixes"""
 
-    def __init__(self, client: httpx.Client):
+    def __init__(
+        self,
+        client: httpx.Client,
+        resilience: Resilience = divar_resilience,
+        http: DivarHTTPClient = divar_http,
+    ):
         self._client = client
-        self._aclient = httpx.AsyncClient(
-            timeout=1,
-            headers=client.headers,
-            base_url=client.base_url,
+        self._resilience = resilience
+        self._http = http
+        self.post_cache = PostCache(
+            max_size=config.post_cache_size,
+            ttl=config.post_cache_ttl,
+            negative_ttl=config.post_cache_negative_ttl,
         )
+        self._flights = SingleFlight()
         super().__init__(client=client)
 
+    @property
+    def _aclient(self) -> httpx.AsyncClient:
+        return self._http.client
+
     async def get_post(
         self,
         data: GetPostRequest,
-        max_retry: int = 3,
-        retry_delay: int = 1,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
     ) -> GetPostResponse | None:
         async def send_request():
             return await self._aclient.request(
                 method="GET",
                 url=f"/v1/open-platform/finder/post/{data.token}",
+                timeout=self._http.timeout("get_post"),
                 content=data.json(),
             )
 
-        rsp = await send_request()
+        rsp = await self._flights.do(
+            ("get_post", data.token),
+            lambda: self._resilience.call(
+                "get_post", send_request, max_retry=max_retry, retry_delay=retry_delay
+            ),
+        )
         if rsp.is_success:
             return PostItemResponse(**rsp.json())
         logger.error(f"get_post error: {rsp.status_code} {rsp.text}")
@@ -114,17 +191,24 @@ class AuctionFinderService(FinderService):
         self,
         access_token: str,
         data: GetUserRequest = None,
-        max_retry: int = 3,
-        retry_delay: int = 1,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
     ) -> GetUserResponse:
         async def send_request():
             return await self._aclient.post(
                 url="/v1/open-platform/users",
+                timeout=self._http.timeout("get_user"),
                 content=data.json() if data is not None else "",
                 headers={ACCESS_TOKEN_HEADER_NAME: access_token},
             )
 
-        rsp = await send_request()
+        key = ("get_user", access_token, data.json() if data is not None else "")
+        rsp = await self._flights.do(
+            key,
+            lambda: self._resilience.call(
+                "get_user", send_request, max_retry=max_retry, retry_delay=retry_delay
+            ),
+        )
         if rsp.is_success:
             return GetUserResponse(**rsp.json())
         logger.error(f"get_user error: {rsp.status_code} {rsp.text}")
@@ -138,11 +222,15 @@ class AuctionFinderService(FinderService):
         async def send_request():
             return await self._aclient.get(
                 url="/v1/open-platform/finder/user-posts",
+                timeout=self._http.timeout("get_user_posts"),
                 params=data.json() if data is not None else "",
                 headers={ACCESS_TOKEN_HEADER_NAME: access_token},
             )
 
-        rsp = await send_request()
+        key = ("get_user_posts", access_token, data.json() if data else "")
+        rsp = await self._flights.do(
+            key, lambda: self._resilience.call("get_user_posts", send_request)
+        )
         if rsp.is_success:
             return GetUserPostsResponse(**rsp.json())
         # TODO: log response error
@@ -154,11 +242,18 @@ class AuctionFinderService(FinderService):
             raise PostNotFound()
         if config.debug:
             return PostItemResponse.dummy(post_token=post_token)
-        post = await self.get_post(GetPostRequest(token=post_token))
+        found, post = self.post_cache.get(post_token)
+        if not found:
+            post = await self.get_post(GetPostRequest(token=post_token))
+            self.post_cache.set(post_token, post)
         if post is None:
             raise PostNotFound()
         return post
 
+    def invalidate_post(self, post_token: PostToken) -> None:
+        """forget the cached post, the next validate_post asks divar again"""
+        self.post_cache.invalidate(post_token)
+
     async def find_post_from_user_posts(
         self, post_token: PostToken, user_access_token: str
     ) -> model.Post | None:
@@ -174,10 +269,74 @@ class AuctionFinderService(FinderService):
         return next((post for post in result.posts if post.token == post_token), None)
 
 
+class AuctionOAuthService(OAuthService):
+    """oauth service that exchanges codes on the shared async client"""
+
+    def __init__(
+        self,
+        client: httpx.Client,
+        app_slug: str,
+        oauth_redirect_url: str,
+        oauth_secret: str,
+        resilience: Resilience = divar_resilience,
+        http: DivarHTTPClient = divar_http,
+    ):
+        self._resilience = resilience
+        self._http = http
+        self._flights = SingleFlight()
+        super().__init__(
+            client=client,
+            app_slug=app_slug,
+            oauth_redirect_url=oauth_redirect_url,
+            oauth_secret=oauth_secret,
+        )
+
+    async def get_access_token(  # type: ignore[override]
+        self,
+        authorization_token: str,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
+    ) -> AccessTokenResponse:
+        data = OAuthAccessTokenRequest(
+            client_id=self._app_slug,
+            client_secret=self._oauth_secret,
+            code=authorization_token,
+            redirect_uri=self._oauth_redirect_url,
+        )
+
+        async def send_request():
+            return await self._http.client.post(
+                url="/oauth2/token",
+                timeout=self._http.timeout("get_access_token"),
+                data=data.model_dump(),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+
+        # a code can be exchanged only once, a reload of the oauth callback
+        # joins the exchange in flight instead of failing with a used code
+        rsp = await self._flights.do(
+            ("get_access_token", authorization_token),
+            lambda: self._resilience.call(
+                "get_access_token", send_request, idempotent=False
+            ),
+        )
+        if rsp.is_success:
+            return AccessTokenResponse(**rsp.json())
+        logger.error(f"get_access_token error: {rsp.status_code} {rsp.text}")
+        raise InvalidSession()
+
+
 auction_finder = AuctionFinderService(client=divar_client._client)
 auction_addon = AuctionAddonService(client=divar_client._client)
+auction_oauth = AuctionOAuthService(
+    client=divar_client._client,
+    app_slug=divar_config.app_slug,
+    oauth_redirect_url=divar_config.oauth_redirect_url,
+    oauth_secret=divar_config.oauth_secret,
+)
 divar_client.finder = auction_finder
 divar_client.addon = auction_addon
+divar_client.oauth = auction_oauth
 
 
 async def get_divar_client() -> DivarClient:
@@ -1,5 +1,5 @@
-from kenar import Client as DivarClient
 from kenar import (
+    AccessTokenResponse,
     ClientConfig,
     CreatePostAddonRequest,
     CreatePostAddonResponse,
@@ -10,12 +10,13 @@ from kenar import (
     GetUserRequest,
     GetUserResponse,
 )
+from kenar import Client as DivarClient
 
 from auction._types import PostToken
 from auction.divar import mock_data
 from auction.model import Post
 
-from .client import AuctionAddonService, AuctionFinderService
+from .client import AuctionAddonService, AuctionFinderService, AuctionOAuthService
 from .schemas import PostItemResponse
 
 
@@ -42,7 +43,12 @@ class AuctionAddonServiceMock(AuctionAddonService):
         self,
         access_token: str,
         data: CreatePostAddonRequest,
-    ) -> CreatePostAddonResponse:
+    ) -> CreatePostAddonResponse | None:
+        return CreatePostAddonResponse()
+
+    async def send_post_addon(
+        self, access_token: str, post_token: str, content: str
+    ) -> CreatePostAddonResponse | None:
         return CreatePostAddonResponse()
 
 
@@ -52,8 +58,8 @@ class AuctionFinderServiceMock(AuctionFinderService):
     async def get_post(
         self,
         data: GetPostRequest,
-        max_retry: int = 3,
-        retry_delay: int = 1,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
     ) -> GetPostResponse | None:
         return PostItemResponse()
 
@@ -61,8 +67,8 @@ class AuctionFinderServiceMock(AuctionFinderService):
         self,
         access_token: str,
         data: GetUserRequest = None,
-        max_retry: int = 3,
-        retry_delay: int = 1,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
     ) -> GetUserResponse:
         return GetUserResponse(phone_numbers=[mock_data.SELLER_PHONE_NUMBER])
 
@@ -86,10 +92,34 @@ class AuctionFinderServiceMock(AuctionFinderService):
         return next((post for post in result.posts), None)
 
 
+class AuctionOAuthServiceMock(AuctionOAuthService):
+    """oauth service mock"""
+
+    async def get_access_token(  # type: ignore[override]
+        self,
+        authorization_token: str,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
+    ) -> AccessTokenResponse:
+        return AccessTokenResponse(
+            access_token="access token",
+            token_type="Bearer",
+            expires_in=3600,
+            scope="USER_PHONE",
+        )
+
+
 auction_finder = AuctionFinderServiceMock(client=divar_client_mock._client)
 auction_addon = AuctionAddonServiceMock(client=divar_client_mock._client)
+auction_oauth = AuctionOAuthServiceMock(
+    client=divar_client_mock._client,
+    app_slug=client_conf.app_slug,
+    oauth_redirect_url=client_conf.oauth_redirect_url,
+    oauth_secret=client_conf.oauth_secret,
+)
 divar_client_mock.finder = auction_finder
 divar_client_mock.addon = auction_addon
+divar_client_mock.oauth = auction_oauth
 
 
 async def get_divar_client_mock() -> DivarClientMock:
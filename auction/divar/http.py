@@ -0,0 +1,64 @@
+import importlib.util
+
+import httpx
+
+from auction.core.config import ConfigurationError
+
+
+class DivarHTTPClient:
+    """
+    the pooled async client shared by the divar services.
+    it's opened on first use, or by the app on startup, and closed by the
+    app on shutdown so keep-alive connections are reused between requests
+    """
+
+    def __init__(
+        self,
+        base_client: httpx.Client,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30,
+        timeout: float = 1,
+        timeouts: dict[str, float] | None = None,
+        http2: bool = False,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.base_client = base_client
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.default_timeout = timeout
+        self.timeouts = timeouts or {}
+        self.http2 = http2
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            if self.http2 and importlib.util.find_spec("h2") is None:
+                raise ConfigurationError(
+                    "divar http2 needs the h2 package, install httpx[http2]"
+                )
+            self._client = httpx.AsyncClient(
+                base_url=self.base_client.base_url,
+                headers=self.base_client.headers,
+                limits=self.limits,
+                timeout=self.default_timeout,
+                http2=self.http2,
+                transport=self.transport,
+            )
+        return self._client
+
+    def timeout(self, endpoint: str) -> float:
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+    def open(self) -> httpx.AsyncClient:
+        return self.client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,153 @@
+import asyncio
+import random
+import time
+
+from typing import Awaitable, Callable
+
+import httpx
+
+from auction.core.exception import DivarUnavailable
+from auction.core.log import logger
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _is_failure(rsp: httpx.Response) -> bool:
+    """divar is in trouble, unlike a 4xx that is an answer to our request"""
+    return rsp.status_code >= 500 or rsp.status_code == 429
+
+
+class CircuitBreaker:
+    """
+    stops calling an endpoint after failure_threshold consecutive failures.
+    after reset_timeout seconds one trial call is let through, the breaker
+    closes again if it succeeds and stays open for another round if not
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.opened_count = 0
+        self.rejected_count = 0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    @property
+    def stats(self) -> dict[str, str | int]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened_count,
+            "rejected": self.rejected_count,
+        }
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.rejected_count += 1
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.opened_count += 1
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        """the call was cancelled, neither a success nor a failure"""
+        self._trial_in_flight = False
+
+
+class Resilience:
+    """
+    retries and circuit breakers for calls to divar, one breaker per endpoint.
+    idempotent calls are retried on timeouts, connection errors, 5xx and 429
+    with exponential backoff and full jitter. a call that still fails, or
+    hits an open breaker, raises DivarUnavailable
+    """
+
+    def __init__(
+        self,
+        max_retry: int = 2,
+        retry_delay: float = 0.1,
+        max_retry_delay: float = 1,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+    ):
+        self.max_retry = max_retry
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    @property
+    def stats(self) -> dict[str, dict[str, str | int]]:
+        return {name: breaker.stats for name, breaker in self.breakers.items()}
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self.breakers[endpoint] = breaker
+        return breaker
+
+    async def call(
+        self,
+        endpoint: str,
+        send_request: Callable[[], Awaitable[httpx.Response]],
+        idempotent: bool = True,
+        max_retry: int | None = None,
+        retry_delay: float | None = None,
+    ) -> httpx.Response:
+        breaker = self.breaker(endpoint)
+        retries = self.max_retry if max_retry is None else max_retry
+        delay = self.retry_delay if retry_delay is None else retry_delay
+        attempts = retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            if not breaker.allow():
+                logger.warning(f"divar {endpoint} circuit is open")
+                raise DivarUnavailable()
+            try:
+                rsp = await send_request()
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                logger.warning(f"divar {endpoint} attempt {attempt + 1}: {e!r}")
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                if not _is_failure(rsp):
+                    breaker.record_success()
+                    return rsp
+                breaker.record_failure()
+                logger.warning(
+                    f"divar {endpoint} attempt {attempt + 1}: {rsp.status_code}"
+                )
+            if attempt + 1 < attempts:
+                backoff = min(self.max_retry_delay, delay * 2**attempt)
+                await asyncio.sleep(random.uniform(0, backoff))
+        raise DivarUnavailable()
@@ -0,0 +1,41 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    coalesce concurrent identical calls: while a call for a key is in
+    flight, callers with the same key wait for it instead of making their
+    own, and all of them get its result or its error.
+    a caller that gets cancelled doesn't cancel the call for the others
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        call = self._calls.get(key)
+        if call is None or call.get_loop() is not loop:
+            call = loop.create_task(_run(operation))
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(call)
+
+    def _forget(self, key: Hashable, call: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            # mark the error retrieved when every waiter was cancelled
+            call.exception()
+
+
+async def _run(operation: Callable[[], Awaitable[T]]) -> T:
+    return await operation()
@@ -1,5 +1,8 @@
+import heapq
+import time
+
 from dataclasses import dataclass, field
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 from pydantic import BaseModel, Field
 
@@ -12,6 +15,7 @@ class Bid:
     auction_id: AuctionID
     amount: Rial
     uid: BidID = field(default_factory=uuid4)  # type: ignore
+    version: int = 0
 
     def __lt__(self, other):
         if not isinstance(other, Bid):
@@ -19,6 +23,73 @@ class Bid:
         return self.amount < other.amount
 
 
+@dataclass(frozen=True)
+class BidCursor:
+    """keyset position in a bids listing ordered by amount and uid, descending"""
+
+    amount: Rial
+    uid: BidID
+
+    @classmethod
+    def from_bid(cls, bid: Bid) -> "BidCursor":
+        return cls(amount=bid.amount, uid=bid.uid)
+
+    def encode(self) -> str:
+        return f"{self.amount}_{self.uid.hex}"
+
+    @classmethod
+    def decode(cls, value: str) -> "BidCursor":
+        """raises ValueError on malformed cursors"""
+        amount, uid = value.split("_")
+        return cls(amount=Rial(int(amount)), uid=BidID(UUID(uid)))
+
+
+@dataclass
+class AccessToken:
+    """oauth access token of a user, valid for its scopes until expires_at"""
+
+    user_id: UserID
+    access_token: str
+    scope: str
+    expires_at: int  # unix timestamp
+    data: dict = field(default_factory=dict)
+    uid: UUID = field(default_factory=uuid4)
+
+    @classmethod
+    def from_data(cls, user_id: UserID, data: dict) -> "AccessToken":
+        """build from an oauth access token response"""
+        return cls(
+            user_id=user_id,
+            access_token=data["access_token"],
+            scope=data.get("scope", ""),
+            expires_at=int(time.time()) + int(data.get("expires_in", 0)),
+            data=data,
+        )
+
+    @property
+    def scopes(self) -> frozenset[str]:
+        return frozenset(self.scope.split())
+
+
+@dataclass
+class OutboxMessage:
+    """
+    a divar side effect of a committed change, kind is the addon service
+    method that delivers it. it's written in the change's unit of work and
+    delivered later by the outbox worker, dead ones ran out of attempts
+    """
+
+    kind: str
+    post_token: PostToken
+    payload: dict = field(default_factory=dict)
+    attempts: int = 0
+    next_attempt_at: float = field(default_factory=time.time)  # unix timestamp
+    dead: bool = False
+    last_error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    uid: UUID = field(default_factory=uuid4)
+
+
 @dataclass
 class Auction:
     post_token: PostToken
@@ -29,10 +100,15 @@ class Auction:
     bids: list[Bid] = field(default_factory=list)
     selected_bid: BidID | None = None
     post_title: str | None = None
+    highest_bid_amount: Rial | None = None
+    highest_bid_id: BidID | None = None
+    version: int = 0
+    # language of the seller, the addon is rendered in it
+    lang_code: str = "fa"
 
     @property
     def top_bids(self) -> list[Bid]:
-        return sorted(self.bids)[::-1][:3]
+        return heapq.nlargest(3, self.bids)
 
     @property
     def min_raise_amount(self) -> Rial:
@@ -53,6 +129,16 @@ class AuctionBidderView(BaseModel):
     min_raise_amount: Rial
 
 
+class AuctionSellerView(BaseModel):
+    post_token: PostToken
+    post_title: str | None = None
+    bids_count: int = 0
+    uid: AuctionID
+    selected_bid: BidID | None = None
+    bids: list[Bid] = Field(default_factory=list)
+    next_cursor: str | None = None
+
+
 class AuctionStartInput(BaseModel):
     post_token: PostToken
     starting_price: Rial
@@ -1,12 +1,16 @@
-from .base import AccessTokenRepo, AuctionRepo
+from .base import AccessTokenRepo, AuctionLoad, AuctionRepo, OutboxRepo
+from .cachedrepo import CachedAuctionRepo
 from .jsonfilerepo import JSONFileRepo, auction_repo
 from .sqlarepo import SQLARepo
 
 
 __all__ = [
+    "AuctionLoad",
     "AuctionRepo",
     "JSONFileRepo",
     "auction_repo",
     "SQLARepo",
     "AccessTokenRepo",
+    "OutboxRepo",
+    "CachedAuctionRepo",
 ]
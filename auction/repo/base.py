@@ -1,10 +1,23 @@
 from abc import ABC, abstractmethod
+from contextlib import AbstractAsyncContextManager
+from enum import Enum
 
 from auction._types import AuctionID, BidID, PostToken, Rial, UserID
-from auction.model import Auction, Bid
+from auction.model import Auction, Bid, BidCursor, OutboxMessage
+
+
+class AuctionLoad(Enum):
+    """how much of an auction to load when reading it"""
+
+    BARE = "bare"  # auction row only, bids are not loaded
+    COUNT = "count"  # auction row with bids_count, bids are not loaded
+    FULL = "full"  # auction with its bids and bids_count in one round trip
 
 
 class AuctionRepo(ABC):
+    @abstractmethod
+    def unit_of_work(self) -> AbstractAsyncContextManager[None]: ...
+
     @abstractmethod
     async def add_auction(self, auction: Auction) -> Auction: ...
 
@@ -20,6 +33,11 @@ class AuctionRepo(ABC):
     @abstractmethod
     async def add_bid(self, bid: Bid) -> Bid: ...
 
+    @abstractmethod
+    async def upsert_bid(
+        self, auction_id: AuctionID, bidder_id: UserID, amount: Rial
+    ) -> Bid: ...
+
     @abstractmethod
     async def find_bid(
         self, auction_id: AuctionID, bidder_id: UserID
@@ -34,6 +52,9 @@ class AuctionRepo(ABC):
     @abstractmethod
     async def remove_bids_by_auction_id(self, auction_id: AuctionID) -> None: ...
 
+    @abstractmethod
+    async def repair_auction_stats(self) -> None: ...
+
     @abstractmethod
     async def remove_selected_bid(self, bid_id: BidID) -> None: ...
 
@@ -42,7 +63,7 @@ class AuctionRepo(ABC):
 
     @abstractmethod
     async def read_auction_by_post_token(
-        self, post_token: PostToken
+        self, post_token: PostToken, load: AuctionLoad = AuctionLoad.FULL
     ) -> Auction | None: ...
 
     @abstractmethod
@@ -51,6 +72,27 @@ class AuctionRepo(ABC):
     @abstractmethod
     async def read_bid_by_id(self, bid_id: BidID) -> Bid | None: ...
 
+    @abstractmethod
+    async def read_bids_page(
+        self, auction_id: AuctionID, limit: int, after: BidCursor | None = None
+    ) -> list[Bid]: ...
+
+    @abstractmethod
+    async def read_auctions_by_post_tokens(
+        self, post_tokens: list[PostToken]
+    ) -> dict[PostToken, Auction]: ...
+
+    @abstractmethod
+    async def read_bids_by_ids(self, bid_ids: list[BidID]) -> dict[BidID, Bid]: ...
+
+    @abstractmethod
+    async def find_bids_for_bidder(
+        self, bidder_id: UserID, auction_ids: list[AuctionID]
+    ) -> dict[AuctionID, Bid]: ...
+
+    @abstractmethod
+    async def read_top_bids(self, auction_id: AuctionID, n: int) -> list[Bid]: ...
+
 
 class AccessTokenRepo(ABC):
     @abstractmethod
@@ -67,3 +109,38 @@ class AccessTokenRepo(ABC):
     async def get_user_access_token_by_scopes(
         self, user_id: UserID, scopes: list[str]
     ) -> dict | None: ...
+
+
+class OutboxRepo(ABC):
+    @abstractmethod
+    async def add_outbox_message(self, message: OutboxMessage) -> None: ...
+
+    @abstractmethod
+    async def cancel_outbox_messages(self, post_token: PostToken, kind: str) -> None:
+        """
+        drop due messages of a kind for a post. leased or backed off ones are
+        kept, a worker may be delivering them
+        """
+
+    @abstractmethod
+    async def claim_outbox_messages(
+        self, limit: int, lease: float
+    ) -> list[OutboxMessage]:
+        """
+        due messages, oldest first. they aren't due again for lease seconds
+        so other workers skip them while they are delivered. a message isn't
+        claimed while an older message of its post is still undelivered
+        """
+
+    @abstractmethod
+    async def complete_outbox_message(self, message: OutboxMessage) -> None: ...
+
+    @abstractmethod
+    async def fail_outbox_message(
+        self, message: OutboxMessage, error: str, retry_at: float | None
+    ) -> None:
+        """count a failed attempt, a message without retry_at is dead"""
+
+    @abstractmethod
+    async def count_outbox_messages(self) -> dict[str, int]:
+        """number of pending and dead messages"""
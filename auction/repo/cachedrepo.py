@@ -0,0 +1,340 @@
+import dataclasses
+import time
+
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Iterator
+
+from auction._types import AuctionID, BidID, PostToken, Rial, UserID
+from auction.model import Auction, Bid, BidCursor, OutboxMessage
+from auction.repo.base import AccessTokenRepo, AuctionLoad, AuctionRepo, OutboxRepo
+
+
+CacheKey = tuple[Hashable, ...]
+
+# keys invalidated inside the active unit of work, invalidated again on exit
+# so reads racing with the uncommitted transaction don't stay cached
+_uow_invalidations: ContextVar[set[CacheKey] | None] = ContextVar(
+    "uow_invalidations", default=None
+)
+
+
+class CachedAuctionRepo(AuctionRepo, AccessTokenRepo, OutboxRepo):
+    """
+    read-through cache of auctions in front of another repo.
+    auctions are kept in a bounded LRU with a TTL, keyed by post token
+    and by uid, and every write invalidates the auctions it touches before
+    and after it runs. a read that was in flight while an auction was
+    invalidated isn't cached, so it can't put back the auction as it was
+    before the write. reads inside a unit of work go straight to the
+    wrapped repo.
+    """
+
+    def __init__(self, repo: AuctionRepo, max_size: int = 1024, ttl: float = 5):
+        self.repo = repo
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[CacheKey, tuple[float, Auction | None]] = (
+            OrderedDict()
+        )
+        self._keys_by_auction: dict[Hashable, set[CacheKey]] = {}
+        # generation of the last invalidation of each key and auction, oldest
+        # first. only the ones after the oldest read in flight are kept
+        self._generation = 0
+        self._invalidated_at: OrderedDict[CacheKey, int] = OrderedDict()
+        self._reads_started_at: Counter[int] = Counter()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_auction.clear()
+
+    def _get(self, key: CacheKey) -> tuple[bool, Auction | None]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, _copy(entry[1])
+
+    def _set(self, key: CacheKey, auction: Auction | None) -> None:
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, _copy(auction))
+        if auction is not None:
+            self._keys_by_auction.setdefault(auction.uid, set()).add(key)
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._discard(oldest_key)
+            self.evictions += 1
+
+    def _discard(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[1] is None:
+            return
+        keys = self._keys_by_auction.get(entry[1].uid)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_auction[entry[1].uid]
+
+    def _invalidate_keys(self, keys: set[CacheKey]) -> None:
+        """keys are cache keys or ("auction", uid) for every key of an auction"""
+        self._generation += 1
+        for key in keys:
+            if key[0] == "auction":
+                for auction_key in list(self._keys_by_auction.get(key[1], set())):
+                    self._discard(auction_key)
+            else:
+                self._discard(key)
+            self._invalidated_at[key] = self._generation
+            self._invalidated_at.move_to_end(key)
+        self._prune_invalidations()
+        pending = _uow_invalidations.get()
+        if pending is not None:
+            pending.update(keys)
+
+    def _prune_invalidations(self) -> None:
+        """an invalidation older than every read in flight can't skip a fill"""
+        oldest_read = min(self._reads_started_at, default=self._generation)
+        while self._invalidated_at:
+            key, generation = next(iter(self._invalidated_at.items()))
+            if generation > oldest_read:
+                return
+            del self._invalidated_at[key]
+
+    def _invalidate_auction(
+        self, auction_id: AuctionID, post_token: PostToken | None = None
+    ) -> None:
+        keys: set[CacheKey] = {("auction", auction_id), ("uid", auction_id)}
+        if post_token is not None:
+            keys.update(("post_token", post_token, load) for load in AuctionLoad)
+        self._invalidate_keys(keys)
+
+    def _invalidate_selected_bid(self, bid_id: BidID) -> None:
+        keys: set[CacheKey] = {
+            ("auction", auction.uid)
+            for _, auction in self._entries.values()
+            if auction is not None and auction.selected_bid == bid_id
+        }
+        self._invalidate_keys(keys)
+
+    @contextmanager
+    def _writing(
+        self, auction_id: AuctionID, post_token: PostToken | None = None
+    ) -> Iterator[None]:
+        self._invalidate_auction(auction_id, post_token)
+        try:
+            yield
+        finally:
+            self._invalidate_auction(auction_id, post_token)
+
+    async def _read_through(
+        self, key: CacheKey, read: Callable[[], Awaitable[Auction | None]]
+    ) -> Auction | None:
+        found, auction = self._get(key)
+        if found:
+            return auction
+        started_at = self._generation
+        self._reads_started_at[started_at] += 1
+        try:
+            auction = await read()
+            markers = [key] if auction is None else [key, ("auction", auction.uid)]
+            if all(self._invalidated_at.get(m, 0) <= started_at for m in markers):
+                self._set(key, auction)
+            return auction
+        finally:
+            self._reads_started_at[started_at] -= 1
+            if not self._reads_started_at[started_at]:
+                del self._reads_started_at[started_at]
+            self._prune_invalidations()
+
+    @property
+    def _access_token_repo(self) -> AccessTokenRepo:
+        if not isinstance(self.repo, AccessTokenRepo):
+            raise TypeError(f"{type(self.repo).__name__} doesn't store access tokens")
+        return self.repo
+
+    @property
+    def _outbox_repo(self) -> OutboxRepo:
+        if not isinstance(self.repo, OutboxRepo):
+            raise TypeError(f"{type(self.repo).__name__} has no outbox")
+        return self.repo
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[None]:
+        if _uow_invalidations.get() is not None:
+            async with self.repo.unit_of_work():
+                yield
+            return
+        invalidations: set[CacheKey] = set()
+        token = _uow_invalidations.set(invalidations)
+        try:
+            async with self.repo.unit_of_work():
+                yield
+        finally:
+            _uow_invalidations.reset(token)
+            self._invalidate_keys(invalidations)
+
+    async def read_auction_by_post_token(
+        self, post_token: PostToken, load: AuctionLoad = AuctionLoad.FULL
+    ) -> Auction | None:
+        if _uow_invalidations.get() is not None:
+            return await self.repo.read_auction_by_post_token(post_token, load)
+        return await self._read_through(
+            ("post_token", post_token, load),
+            lambda: self.repo.read_auction_by_post_token(post_token, load),
+        )
+
+    async def read_auction_by_id(self, auction_id: AuctionID) -> Auction | None:
+        if _uow_invalidations.get() is not None:
+            return await self.repo.read_auction_by_id(auction_id)
+        return await self._read_through(
+            ("uid", auction_id), lambda: self.repo.read_auction_by_id(auction_id)
+        )
+
+    async def add_auction(self, auction: Auction) -> Auction:
+        with self._writing(auction.uid, auction.post_token):
+            return await self.repo.add_auction(auction)
+
+    async def remove_auction(self, auction_id: AuctionID) -> None:
+        with self._writing(auction_id):
+            return await self.repo.remove_auction(auction_id)
+
+    async def add_bid(self, bid: Bid) -> Bid:
+        with self._writing(bid.auction_id):
+            return await self.repo.add_bid(bid)
+
+    async def upsert_bid(
+        self, auction_id: AuctionID, bidder_id: UserID, amount: Rial
+    ) -> Bid:
+        with self._writing(auction_id):
+            return await self.repo.upsert_bid(auction_id, bidder_id, amount)
+
+    async def change_bid_amount(self, bid: Bid, amount: Rial) -> Bid:
+        with self._writing(bid.auction_id):
+            return await self.repo.change_bid_amount(bid, amount)
+
+    async def remove_bid(self, bid_id: BidID) -> None:
+        bid = await self.repo.read_bid_by_id(bid_id)
+        if bid is None:
+            return await self.repo.remove_bid(bid_id)
+        with self._writing(bid.auction_id):
+            return await self.repo.remove_bid(bid_id)
+
+    async def remove_bids_by_auction_id(self, auction_id: AuctionID) -> None:
+        with self._writing(auction_id):
+            return await self.repo.remove_bids_by_auction_id(auction_id)
+
+    async def repair_auction_stats(self) -> None:
+        self.clear()
+        return await self.repo.repair_auction_stats()
+
+    async def remove_selected_bid(self, bid_id: BidID) -> None:
+        self._invalidate_selected_bid(bid_id)
+        bid = await self.repo.read_bid_by_id(bid_id)
+        if bid is None:
+            return await self.repo.remove_selected_bid(bid_id)
+        with self._writing(bid.auction_id):
+            return await self.repo.remove_selected_bid(bid_id)
+
+    async def select_bid(self, auction: Auction, bid_id: BidID) -> Auction:
+        with self._writing(auction.uid, auction.post_token):
+            return await self.repo.select_bid(auction, bid_id)
+
+    async def set_bidders_count(self, auction: Auction) -> Auction:
+        return await self.repo.set_bidders_count(auction)
+
+    async def set_bids_on_auction(self, auction: Auction) -> Auction:
+        return await self.repo.set_bids_on_auction(auction)
+
+    async def find_bid(self, auction_id: AuctionID, bidder_id: UserID) -> Bid | None:
+        return await self.repo.find_bid(auction_id, bidder_id)
+
+    async def read_bid_by_id(self, bid_id: BidID) -> Bid | None:
+        return await self.repo.read_bid_by_id(bid_id)
+
+    async def read_bids_page(
+        self, auction_id: AuctionID, limit: int, after: BidCursor | None = None
+    ) -> list[Bid]:
+        return await self.repo.read_bids_page(auction_id, limit, after)
+
+    async def read_auctions_by_post_tokens(
+        self, post_tokens: list[PostToken]
+    ) -> dict[PostToken, Auction]:
+        return await self.repo.read_auctions_by_post_tokens(post_tokens)
+
+    async def read_bids_by_ids(self, bid_ids: list[BidID]) -> dict[BidID, Bid]:
+        return await self.repo.read_bids_by_ids(bid_ids)
+
+    async def find_bids_for_bidder(
+        self, bidder_id: UserID, auction_ids: list[AuctionID]
+    ) -> dict[AuctionID, Bid]:
+        return await self.repo.find_bids_for_bidder(bidder_id, auction_ids)
+
+    async def read_top_bids(self, auction_id: AuctionID, n: int) -> list[Bid]:
+        return await self.repo.read_top_bids(auction_id, n)
+
+    async def add_user_access_token(
+        self, user_id: UserID, access_token_data: dict
+    ) -> None:
+        return await self._access_token_repo.add_user_access_token(
+            user_id, access_token_data
+        )
+
+    async def get_user_access_token_by_scope(
+        self, user_id: UserID, scope: str
+    ) -> dict | None:
+        return await self._access_token_repo.get_user_access_token_by_scope(
+            user_id, scope
+        )
+
+    async def get_user_access_token_by_scopes(
+        self, user_id: UserID, scopes: list[str]
+    ) -> dict | None:
+        return await self._access_token_repo.get_user_access_token_by_scopes(
+            user_id, scopes
+        )
+
+    async def add_outbox_message(self, message: OutboxMessage) -> None:
+        return await self._outbox_repo.add_outbox_message(message)
+
+    async def cancel_outbox_messages(self, post_token: PostToken, kind: str) -> None:
+        return await self._outbox_repo.cancel_outbox_messages(post_token, kind)
+
+    async def claim_outbox_messages(
+        self, limit: int, lease: float
+    ) -> list[OutboxMessage]:
+        return await self._outbox_repo.claim_outbox_messages(limit, lease)
+
+    async def complete_outbox_message(self, message: OutboxMessage) -> None:
+        return await self._outbox_repo.complete_outbox_message(message)
+
+    async def fail_outbox_message(
+        self, message: OutboxMessage, error: str, retry_at: float | None
+    ) -> None:
+        return await self._outbox_repo.fail_outbox_message(message, error, retry_at)
+
+    async def count_outbox_messages(self) -> dict[str, int]:
+        return await self._outbox_repo.count_outbox_messages()
+
+
+def _copy(auction: Auction | None) -> Auction | None:
+    """callers may change the auctions they get, never share cached ones"""
+    if auction is None:
+        return None
+    return dataclasses.replace(auction, bids=list(auction.bids))
@@ -1,177 +1,560 @@
+import asyncio
+import heapq
 import json
+import os
+import threading
 
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from pathlib import Path
+from typing import AsyncIterator, TypeVar
+from uuid import UUID
 
 from pydantic import TypeAdapter
 
 from auction._types import AuctionID, BidID, PostToken, Rial, UserID
-from auction.model import Auction, Bid
-from auction.repo.base import AccessTokenRepo, AuctionRepo
+from auction.core.config import config
+from auction.core.log import logger
+from auction.model import AccessToken, Auction, Bid, BidCursor
+from auction.repo.base import AccessTokenRepo, AuctionLoad, AuctionRepo
+from auction.repo.snapshot import (
+    Snapshot,
+    SnapshotFormat,
+    build,
+    dump_snapshot,
+    init,
+    load_snapshot,
+)
+from auction.repo.tokenindex import AccessTokenIndex
+
+
+_in_uow: ContextVar[bool] = ContextVar("in_uow", default=False)
+
+_record_adapters: dict[str, TypeAdapter] = {
+    "auction": TypeAdapter(Auction),
+    "bid": TypeAdapter(Bid),
+    "access_token": TypeAdapter(AccessToken),
+}
+
+JournalKey = tuple[str, UUID]
+
+T = TypeVar("T")
 
 
 class JSONFileRepo(AuctionRepo, AccessTokenRepo):
-    auctions: list[Auction]
-    bids: list[Bid]
-    access_tokens: dict[UserID, list[dict]]
+    """
+    repository on a json snapshot file and an append-only journal next to it.
+    auctions and bids are kept in dicts by uid with hash indexes by post
+    token, auction and (auction, bidder), updated together on every change.
+    every commit appends the changed auctions, bids and tokens to the journal
+    and loading replays it over the snapshot. when the journal grows past
+    compact_threshold bytes it is rotated and a new snapshot is written in a
+    background thread, a snapshot only replaces the old one by rename.
+    in write_behind mode commits only mark changes pending, a background task
+    appends them every flush_interval seconds or once flush_max_pending
+    objects changed, with the file i/o in a thread. await flush() to wait
+    for durability. snapshots are written as json or in the binary layout
+    of auction.repo.snapshot, loading reads either.
+    """
+
+    auctions: dict[AuctionID, Auction]
+    bids: dict[BidID, Bid]
+    access_tokens: AccessTokenIndex
     db_file_name: str = "db.json"
 
-    def __init__(self, db_file_name: str = "db.json") -> None:
+    def __init__(
+        self,
+        db_file_name: str = "db.json",
+        compact_threshold: int = 1024 * 1024,
+        fsync: bool = True,
+        write_behind: bool = False,
+        flush_interval: float = 1,
+        flush_max_pending: int = 100,
+        snapshot_format: SnapshotFormat = "json",
+    ) -> None:
         self.db_file_name = db_file_name
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_max_pending = flush_max_pending
+        self.snapshot_format = snapshot_format
+        self._flusher: asyncio.Task | None = None
+        self._flush_wakeup: asyncio.Event | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self._pending: dict[JournalKey, Auction | Bid | AccessToken | None] = {}
+        self._journal_size = 0
+        self._compaction: threading.Thread | None = None
         self._load_db_file()
 
+    @property
+    def _db_path(self) -> Path:
+        return Path(self.db_file_name)
+
+    @property
+    def _journal_path(self) -> Path:
+        return Path(f"{self.db_file_name}.journal")
+
+    @property
+    def _rotated_journal_path(self) -> Path:
+        """journal being compacted into the next snapshot"""
+        return Path(f"{self.db_file_name}.journal.1")
+
     def _load_db_file(self) -> None:
-        db_path = Path(self.db_file_name)
-        if db_path.exists():
-            with open(db_path, "r") as db_file:
-                db = json.load(db_file)
-                auctions_adapter = TypeAdapter(list[Auction])
-                self.auctions = auctions_adapter.validate_python(db["auctions"])
-                bids_adapter = TypeAdapter(list[Bid])
-                self.bids = bids_adapter.validate_python(db["bids"])
-                self.access_tokens = {}
-        else:
-            self.auctions = []
-            self.bids = []
-            self.access_tokens = {}
+        auctions: dict[UUID, Auction] = {}
+        bids: dict[UUID, Bid] = {}
+        tokens: dict[UUID, AccessToken] = {}
+        if self._db_path.exists():
+            snapshot = load_snapshot(self._db_path)
+            auctions = {auction.uid: auction for auction in snapshot.auctions}
+            bids = {bid.uid: bid for bid in snapshot.bids}
+            tokens = {token.uid: token for token in snapshot.access_tokens}
+
+        tables: dict[str, dict] = {
+            "auction": auctions,
+            "bid": bids,
+            "access_token": tokens,
+        }
+        for journal_path in [self._rotated_journal_path, self._journal_path]:
+            self._replay_journal(journal_path, tables)
+
+        self._build_indexes(list(auctions.values()), list(bids.values()))
+        self.access_tokens = AccessTokenIndex()
+        for token in tokens.values():
+            self.access_tokens.add(token)
+
+        if self._rotated_journal_path.exists():
+            # a compaction was interrupted, finish it before taking writes
+            self.compact()
+        elif self._journal_path.exists():
+            self._journal_size = self._journal_path.stat().st_size
+
+    def _replay_journal(self, journal_path: Path, tables: dict[str, dict]) -> None:
+        if not journal_path.exists():
+            return
+        with open(journal_path, "rb+") as journal:
+            content = journal.read()
+            # drop a record torn by a crash in the middle of an append
+            valid_size = content.rfind(b"\n") + 1
+            if valid_size < len(content):
+                journal.truncate(valid_size)
+        for line in content[:valid_size].splitlines():
+            record = json.loads(line)
+            table = tables[record["type"]]
+            uid = UUID(record["uid"])
+            if record["data"] is None:
+                table.pop(uid, None)
+            else:
+                adapter = _record_adapters[record["type"]]
+                table[uid] = init(adapter.validate_python(record["data"]))
+
+    def _build_indexes(self, auctions: list[Auction], bids: list[Bid]) -> None:
+        self.auctions = {}
+        self.bids = {}
+        self._auctions_by_post_token: dict[PostToken, Auction] = {}
+        self._bids_by_auction: dict[AuctionID, dict[BidID, Bid]] = {}
+        self._bids_by_bidder: dict[tuple[AuctionID, UserID], Bid] = {}
+        for auction in auctions:
+            self._index_auction(auction)
+        for bid in bids:
+            self._index_bid(bid)
+
+    def _index_auction(self, auction: Auction) -> None:
+        self.auctions[auction.uid] = auction
+        self._auctions_by_post_token[auction.post_token] = auction
+
+    def _unindex_auction(self, auction: Auction) -> None:
+        del self.auctions[auction.uid]
+        if self._auctions_by_post_token.get(auction.post_token) is auction:
+            del self._auctions_by_post_token[auction.post_token]
+
+    def _index_bid(self, bid: Bid) -> None:
+        self.bids[bid.uid] = bid
+        self._bids_by_auction.setdefault(bid.auction_id, {})[bid.uid] = bid
+        self._bids_by_bidder[(bid.auction_id, bid.bidder_id)] = bid
+
+    def _unindex_bid(self, bid: Bid) -> None:
+        del self.bids[bid.uid]
+        auction_bids = self._bids_by_auction[bid.auction_id]
+        del auction_bids[bid.uid]
+        if not auction_bids:
+            del self._bids_by_auction[bid.auction_id]
+        if self._bids_by_bidder.get((bid.auction_id, bid.bidder_id)) is bid:
+            del self._bids_by_bidder[(bid.auction_id, bid.bidder_id)]
+
+    def _auction_bids(self, auction_id: AuctionID) -> list[Bid]:
+        return list(self._bids_by_auction.get(auction_id, {}).values())
+
+    def _journal(self, record_type: str, uid: UUID, obj=None) -> None:
+        """record the latest state of an object, None for removed ones"""
+        self._pending[(record_type, uid)] = obj
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[None]:
+        """append to the journal once on exit instead of on every change"""
+        if _in_uow.get():
+            yield
+            return
+        token = _in_uow.set(True)
+        try:
+            yield
+        finally:
+            _in_uow.reset(token)
+            self._commit()
 
     def _commit(self) -> None:
-        db_path = Path(self.db_file_name)
-        with open(db_path, "w") as db_file:
-            auctions_adapter = TypeAdapter(list[Auction])
-            auctions = auctions_adapter.dump_python(self.auctions, mode="json")
-            bids_adapter = TypeAdapter(list[Bid])
-            bids = bids_adapter.dump_python(self.bids, mode="json")
-            db_data = {"auctions": auctions, "bids": bids}
-            db_file.write(json.dumps(db_data))
+        if _in_uow.get():
+            return
+        if self.write_behind and self._schedule_flush():
+            return
+        self._append_journal()
+        if self._journal_size >= self.compact_threshold:
+            self.compact(wait=False)
+
+    def _schedule_flush(self) -> bool:
+        """start the flusher of the running loop, False outside of a loop"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if (
+            self._flusher is None
+            or self._flusher.done()
+            or self._flusher.get_loop() is not loop
+        ):
+            self._flush_wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flusher = loop.create_task(self._run_flusher(self._flush_wakeup))
+        if len(self._pending) >= self.flush_max_pending:
+            assert self._flush_wakeup is not None
+            self._flush_wakeup.set()
+        return True
+
+    async def _run_flusher(self, wakeup: asyncio.Event) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.flush_interval)
+            except TimeoutError:
+                if not self._pending:
+                    return
+            wakeup.clear()
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.error(f"json repo flush error: {e}")
+
+    async def flush(self) -> None:
+        """append pending changes to the journal, returns once they are durable"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if pending:
+                try:
+                    await asyncio.to_thread(self._write_journal, _dump(pending))
+                except BaseException:
+                    # keep failed changes unless they changed again meanwhile
+                    for key, obj in pending.items():
+                        self._pending.setdefault(key, obj)
+                    raise
+            if self._journal_size >= self.compact_threshold:
+                self.compact(wait=False)
+
+    async def close(self) -> None:
+        """flush pending changes and stop the flusher"""
+        await self.flush()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def _append_journal(self) -> None:
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._write_journal(_dump(pending))
+
+    def _write_journal(self, content: bytes) -> None:
+        with open(self._journal_path, "ab") as journal:
+            journal.write(content)
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+        self._journal_size += len(content)
+
+    def compact(self, wait: bool = True) -> None:
+        """
+        write the current state as the new snapshot and drop the journal,
+        new commits go to a fresh journal while the snapshot is written.
+        only a copy of the objects is taken on the caller's thread, they are
+        serialized and written in the background thread
+        """
+        if self._compaction is not None and self._compaction.is_alive():
+            if not wait:
+                return
+            self._compaction.join()
+        self._append_journal()
+        snapshot = self._copy_snapshot()
+        if self._journal_path.exists():
+            if self._rotated_journal_path.exists():
+                # the last compaction failed, keep its journal for replay
+                with open(self._rotated_journal_path, "ab") as rotated:
+                    rotated.write(self._journal_path.read_bytes())
+                self._journal_path.unlink()
+            else:
+                os.replace(self._journal_path, self._rotated_journal_path)
+        self._journal_size = 0
+        self._compaction = threading.Thread(
+            target=self._write_snapshot, args=(snapshot,), daemon=True
+        )
+        self._compaction.start()
+        if wait:
+            self._compaction.join()
+
+    def _copy_snapshot(self) -> Snapshot:
+        """objects are changed in place, the snapshot gets copies of them"""
+        return Snapshot(
+            auctions=[_clone(auction) for auction in self.auctions.values()],
+            bids=[_clone(bid) for bid in self.bids.values()],
+            access_tokens=[_clone(token) for token in self.access_tokens.tokens()],
+        )
+
+    def _write_snapshot(self, snapshot: Snapshot) -> None:
+        try:
+            _atomic_write(self._db_path, dump_snapshot(snapshot, self.snapshot_format))
+            self._rotated_journal_path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.error(f"json repo compaction error: {e}")
 
     async def add_auction(self, auction: Auction) -> Auction:
-        self.auctions.append(auction)
+        self._index_auction(auction)
+        self._journal("auction", auction.uid, auction)
         self._commit()
         return auction
 
     async def remove_auction(self, auction_id: AuctionID) -> None:
-        for auction in self.auctions:
-            if auction.uid == auction_id:
-                self.auctions.remove(auction)
-                self._commit()
+        auction = self.auctions.get(auction_id)
+        if auction is not None:
+            self._unindex_auction(auction)
+            self._journal("auction", auction_id)
+            self._commit()
         return None
 
     async def set_bidders_count(self, auction: Auction) -> Auction:
-        auction.bids_count = sum(
-            [1 for bid in self.bids if bid.auction_id == auction.uid]
-        )
+        auction.bids_count = len(self._bids_by_auction.get(auction.uid, {}))
         return auction
 
     async def set_bids_on_auction(self, auction: Auction) -> Auction:
-        auction.bids = [bid for bid in self.bids if bid.auction_id == auction.uid]
+        auction.bids = self._auction_bids(auction.uid)
         return auction
 
     async def add_bid(self, bid: Bid) -> Bid:
-        self.bids.append(bid)
+        self._index_bid(bid)
+        self._journal("bid", bid.uid, bid)
+        self._update_auction_stats(bid.auction_id)
         self._commit()
         return bid
 
-    async def find_bid(self, auction_id: AuctionID, bidder_id: UserID) -> Bid | None:
-        bid = next(
-            (
-                bid
-                for bid in self.bids
-                if (bid.bidder_id == bidder_id and bid.auction_id == auction_id)
-            ),
-            None,
-        )
-        if not bid:
-            return None
+    async def upsert_bid(
+        self, auction_id: AuctionID, bidder_id: UserID, amount: Rial
+    ) -> Bid:
+        bid = await self.find_bid(auction_id=auction_id, bidder_id=bidder_id)
+        if bid:
+            bid.amount = amount
+            auction = self.auctions.get(auction_id)
+            if auction is not None and auction.selected_bid == bid.uid:
+                auction.selected_bid = None
+        else:
+            bid = Bid(bidder_id=bidder_id, auction_id=auction_id, amount=amount)
+            self._index_bid(bid)
+        self._journal("bid", bid.uid, bid)
+        self._update_auction_stats(auction_id)
+        self._commit()
         return bid
 
+    async def find_bid(self, auction_id: AuctionID, bidder_id: UserID) -> Bid | None:
+        return self._bids_by_bidder.get((auction_id, bidder_id))
+
     async def change_bid_amount(self, bid: Bid, amount: Rial) -> Bid:
         bid.amount = amount
+        self._journal("bid", bid.uid, bid)
+        self._update_auction_stats(bid.auction_id)
+        self._commit()
         return bid
 
     async def remove_bid(self, bid_id: BidID) -> None:
-        for bid in self.bids:
-            if bid.uid == bid_id:
-                self.bids.remove(bid)
-                self._commit()
+        bid = self.bids.get(bid_id)
+        if bid is not None:
+            self._unindex_bid(bid)
+            self._journal("bid", bid_id)
+            self._update_auction_stats(bid.auction_id)
+            self._commit()
         return None
 
     async def remove_bids_by_auction_id(self, auction_id: AuctionID) -> None:
-        for bid in self.bids:
-            if bid.auction_id == auction_id:
-                self.bids.remove(bid)
+        for bid in self._auction_bids(auction_id):
+            self._unindex_bid(bid)
+            self._journal("bid", bid.uid)
+        self._update_auction_stats(auction_id)
         self._commit()
         return None
 
+    async def repair_auction_stats(self) -> None:
+        for auction_id in self.auctions:
+            self._update_auction_stats(auction_id)
+        self._commit()
+
+    def _update_auction_stats(self, auction_id: AuctionID) -> None:
+        """recompute denormalized bids_count and highest bid of an auction"""
+        auction = self.auctions.get(auction_id)
+        if auction is None:
+            return
+        bids = self._bids_by_auction.get(auction_id, {}).values()
+        highest_bid = max(bids, key=lambda bid: (bid.amount, bid.uid), default=None)
+        auction.bids_count = len(bids)
+        auction.highest_bid_amount = highest_bid.amount if highest_bid else None
+        auction.highest_bid_id = highest_bid.uid if highest_bid else None
+        self._journal("auction", auction.uid, auction)
+
     async def remove_selected_bid(self, bid_id: BidID) -> None:
-        for auction in self.auctions:
+        bid = self.bids.get(bid_id)
+        if bid is not None:
+            # the auction may be removed before its bids
+            auction = self.auctions.get(bid.auction_id)
+            auctions = [auction] if auction is not None else []
+        else:
+            auctions = list(self.auctions.values())
+        for auction in auctions:
             if auction.selected_bid == bid_id:
                 auction.selected_bid = None
+                self._journal("auction", auction.uid, auction)
                 self._commit()
                 break
         return None
 
     async def select_bid(self, auction: Auction, bid_id: BidID) -> Auction:
         auction.selected_bid = bid_id
+        self._journal("auction", auction.uid, auction)
         self._commit()
         return auction
 
-    async def read_auction_by_post_token(self, post_token: PostToken) -> Auction | None:
-        auction = next(
-            (auction for auction in self.auctions if auction.post_token == post_token),
-            None,
-        )
-        if auction:
+    async def read_auction_by_post_token(
+        self, post_token: PostToken, load: AuctionLoad = AuctionLoad.FULL
+    ) -> Auction | None:
+        auction = self._auctions_by_post_token.get(post_token)
+        if auction and load in (AuctionLoad.COUNT, AuctionLoad.FULL):
             await self.set_bidders_count(auction)
+        if auction and load == AuctionLoad.FULL:
             await self.set_bids_on_auction(auction)
         return auction
 
     async def read_auction_by_id(self, auction_id: AuctionID) -> Auction | None:
-        auction = next(
-            (auction for auction in self.auctions if auction.uid == auction_id), None
-        )
+        auction = self.auctions.get(auction_id)
         if auction:
             await self.set_bidders_count(auction)
             await self.set_bids_on_auction(auction)
         return auction
 
     async def read_bid_by_id(self, bid_id: BidID) -> Bid | None:
-        bid = next((bid for bid in self.bids if bid.uid == bid_id), None)
-        return bid
+        return self.bids.get(bid_id)
+
+    async def read_bids_page(
+        self, auction_id: AuctionID, limit: int, after: BidCursor | None = None
+    ) -> list[Bid]:
+        bids = iter(self._auction_bids(auction_id))
+        if after is not None:
+            bids = (
+                bid for bid in bids if (bid.amount, bid.uid) < (after.amount, after.uid)
+            )
+        return heapq.nlargest(limit, bids, key=lambda bid: (bid.amount, bid.uid))
+
+    async def read_auctions_by_post_tokens(
+        self, post_tokens: list[PostToken]
+    ) -> dict[PostToken, Auction]:
+        return {
+            post_token: self._auctions_by_post_token[post_token]
+            for post_token in post_tokens
+            if post_token in self._auctions_by_post_token
+        }
+
+    async def read_bids_by_ids(self, bid_ids: list[BidID]) -> dict[BidID, Bid]:
+        return {bid_id: self.bids[bid_id] for bid_id in bid_ids if bid_id in self.bids}
+
+    async def find_bids_for_bidder(
+        self, bidder_id: UserID, auction_ids: list[AuctionID]
+    ) -> dict[AuctionID, Bid]:
+        return {
+            auction_id: self._bids_by_bidder[(auction_id, bidder_id)]
+            for auction_id in auction_ids
+            if (auction_id, bidder_id) in self._bids_by_bidder
+        }
+
+    async def read_top_bids(self, auction_id: AuctionID, n: int) -> list[Bid]:
+        return heapq.nlargest(n, self._auction_bids(auction_id))
 
     async def add_user_access_token(
         self, user_id: UserID, access_token_data: dict
     ) -> None:
-        db_data: list[dict] = self.access_tokens.get(user_id, [])
-        if db_data:
-            db_data.append(access_token_data)
-            return
-        self.access_tokens[user_id] = [access_token_data]
+        self.access_tokens.evict_expired()
+        token = AccessToken.from_data(user_id, access_token_data)
+        self.access_tokens.add(token)
+        self._journal("access_token", token.uid, token)
+        self._commit()
 
     async def get_user_access_token_by_scope(
         self, user_id: UserID, scope: str
     ) -> dict | None:
-        user_access_tokens = self.access_tokens.get(user_id)
-        if user_access_tokens is None:
-            return None
-        return next(
-            (data for data in user_access_tokens if scope in data["scope"]), None
-        )
+        return await self.get_user_access_token_by_scopes(user_id, [scope])
 
     async def get_user_access_token_by_scopes(
         self, user_id: UserID, scopes: list[str]
     ) -> dict | None:
-        user_access_tokens = self.access_tokens.get(user_id)
-        if user_access_tokens is None:
+        token = self.access_tokens.find(user_id, scopes)
+        if token is None:
             return None
-        for data in user_access_tokens:
-            found_all = True
-            for scope in scopes:
-                if scope not in data["scope"]:
-                    found_all = False
-                    break
-            if found_all:
-                return data
-        return None
+        return token.data
+
+
+def _dump(pending: dict[JournalKey, Auction | Bid | AccessToken | None]) -> bytes:
+    """journal records of pending changes, one json object per line"""
+    lines = []
+    for (record_type, uid), obj in pending.items():
+        data = None
+        if isinstance(obj, Auction):
+            data = _record_adapters[record_type].dump_python(
+                obj, mode="json", exclude={"bids"}
+            )
+        elif obj is not None:
+            data = _record_adapters[record_type].dump_python(obj, mode="json")
+        record = {"type": record_type, "uid": str(uid), "data": data}
+        lines.append(json.dumps(record) + "\n")
+    return "".join(lines).encode()
+
+
+def _clone(obj: T) -> T:
+    """shallow copy without the orm state of the original"""
+    values = {k: v for k, v in vars(obj).items() if not k.startswith("_sa_")}
+    return build(type(obj), **values)
+
+
+def _atomic_write(path: Path, content: bytes) -> None:
+    """write to a temp file, fsync it and rename it over path"""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "wb") as tmp_file:
+        tmp_file.write(content)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
 
 
-auction_repo = JSONFileRepo()
+auction_repo = JSONFileRepo(
+    write_behind=config.json_db_write_behind,
+    flush_interval=config.json_db_flush_interval,
+    flush_max_pending=config.json_db_flush_max_pending,
+    snapshot_format=config.json_db_snapshot_format,
+)
@@ -0,0 +1,404 @@
+"""
+Snapshot files of JSONFileRepo, in json or in a columnar binary layout.
+
+The binary layout is a magic, a small json header and one column per field,
+each aligned to 8 bytes: uuids as 16 bytes (zeros for None), integers as
+int64 (-1 for None amounts) and strings as int64 offsets into a utf-8 blob.
+Loading memory-maps the file and builds models straight from the columns,
+without intermediate dicts or validation.
+"""
+
+import json
+import mmap
+import struct
+import sys
+import time
+
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Literal, TypeVar
+from uuid import UUID, uuid4
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm.instrumentation import ClassManager, opt_manager_of_class
+
+from auction._types import BidID, PostToken, Rial, UserID
+from auction.model import AccessToken, Auction, Bid
+
+
+SnapshotFormat = Literal["json", "binary"]
+
+MAGIC = b"AUCSNAP1"
+_HEADER_SIZE = struct.Struct("<I")
+_NIL_UUID = bytes(16)
+
+_auctions_adapter = TypeAdapter(list[Auction])
+_bids_adapter = TypeAdapter(list[Bid])
+_tokens_adapter = TypeAdapter(list[AccessToken])
+
+T = TypeVar("T")
+
+_class_managers: dict[type, ClassManager | None] = {}
+
+
+@dataclass
+class Snapshot:
+    auctions: list[Auction] = field(default_factory=list)
+    bids: list[Bid] = field(default_factory=list)
+    access_tokens: list[AccessToken] = field(default_factory=list)
+
+
+def build(cls: type[T], **values: Any) -> T:
+    """
+    create a model with all its fields the way orm loading does, skipping
+    the attribute events of the mapped __init__ that dominate the cost of
+    creating many objects
+    """
+    manager = _class_manager(cls)
+    if manager is None:
+        return cls(**values)
+    obj = manager.new_instance()
+    obj.__dict__.update(values)
+    return obj
+
+
+def _class_manager(cls: type) -> ClassManager | None:
+    if cls not in _class_managers:
+        _class_managers[cls] = opt_manager_of_class(cls)
+    return _class_managers[cls]
+
+
+def init(obj: T) -> T:
+    """
+    pydantic fills dataclasses without calling __init__, which leaves orm
+    mapped models without their instrumentation state
+    """
+    return build(type(obj), **vars(obj))
+
+
+def dump_snapshot(snapshot: Snapshot, snapshot_format: SnapshotFormat) -> bytes:
+    if snapshot_format == "binary":
+        return dump_binary(snapshot)
+    return dump_json(snapshot)
+
+
+def load_snapshot(path: Path) -> Snapshot:
+    """load a snapshot file of either format, told apart by the magic"""
+    with open(path, "rb") as snapshot_file:
+        if snapshot_file.read(len(MAGIC)) == MAGIC:
+            return load_binary(path)
+    return load_json(path)
+
+
+def dump_json(snapshot: Snapshot) -> bytes:
+    # bids of an auction are stored once, in the bids list
+    auctions = _auctions_adapter.dump_python(
+        snapshot.auctions, mode="json", exclude={"__all__": {"bids"}}
+    )
+    bids = _bids_adapter.dump_python(snapshot.bids, mode="json")
+    tokens = _tokens_adapter.dump_python(snapshot.access_tokens, mode="json")
+    db_data = {"auctions": auctions, "bids": bids, "access_tokens": tokens}
+    return json.dumps(db_data).encode()
+
+
+def load_json(path: Path) -> Snapshot:
+    with open(path, "r") as db_file:
+        db = json.load(db_file)
+    auctions = _auctions_adapter.validate_python(db["auctions"])
+    bids = _bids_adapter.validate_python(db["bids"])
+    tokens = _tokens_adapter.validate_python(db.get("access_tokens", []))
+    return Snapshot(
+        auctions=[init(auction) for auction in auctions],
+        bids=[init(bid) for bid in bids],
+        access_tokens=[init(token) for token in tokens],
+    )
+
+
+class _ColumnWriter:
+    def __init__(self) -> None:
+        self.columns: list[dict[str, Any]] = []
+        self.chunks: list[bytes] = []
+        self.offset = 0
+
+    def _add(self, name: str, column_type: str, content: bytes) -> None:
+        self.columns.append(
+            {
+                "name": name,
+                "type": column_type,
+                "offset": self.offset,
+                "size": len(content),
+            }
+        )
+        padding = -len(content) % 8
+        self.chunks.append(content + bytes(padding))
+        self.offset += len(content) + padding
+
+    def uuids(self, name: str, values: list[UUID | None]) -> None:
+        content = b"".join(
+            _NIL_UUID if value is None else value.bytes for value in values
+        )
+        self._add(name, "uuid", content)
+
+    def ints(self, name: str, values: list[int | None]) -> None:
+        column = array("q", (-1 if value is None else value for value in values))
+        self._add(name, "int", column.tobytes())
+
+    def strs(self, name: str, values: list[str | None]) -> None:
+        encoded = [b"" if value is None else value.encode() for value in values]
+        offsets = array("q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        self._add(f"{name}.offsets", "int", offsets.tobytes())
+        self._add(name, "str", b"".join(encoded))
+        if any(value is None for value in values):
+            nulls = bytes(value is None for value in values)
+            self._add(f"{name}.nulls", "null", nulls)
+
+
+class _ColumnReader:
+    def __init__(self, body: memoryview, header: dict[str, Any]) -> None:
+        self.body = body
+        self.columns = {column["name"]: column for column in header["columns"]}
+        self.swap = header["byteorder"] != sys.byteorder
+
+    def _raw(self, name: str) -> memoryview:
+        column = self.columns[name]
+        return self.body[column["offset"] : column["offset"] + column["size"]]
+
+    def uuids(self, name: str) -> Iterator[UUID | None]:
+        raw = self._raw(name)
+        for start in range(0, len(raw), 16):
+            value = raw[start : start + 16]
+            yield None if value == _NIL_UUID else UUID(bytes=bytes(value))
+
+    def ints(self, name: str) -> list[int]:
+        if self.swap:
+            column = array("q", bytes(self._raw(name)))
+            column.byteswap()
+            return column.tolist()
+        return self._raw(name).cast("q").tolist()
+
+    def strs(self, name: str) -> Iterator[str | None]:
+        offsets = self.ints(f"{name}.offsets")
+        blob = bytes(self._raw(name))
+        nulls = b""
+        if f"{name}.nulls" in self.columns:
+            nulls = bytes(self._raw(f"{name}.nulls"))
+        for i in range(len(offsets) - 1):
+            if nulls and nulls[i]:
+                yield None
+            else:
+                yield blob[offsets[i] : offsets[i + 1]].decode()
+
+
+def dump_binary(snapshot: Snapshot) -> bytes:
+    writer = _ColumnWriter()
+    auctions, bids = snapshot.auctions, snapshot.bids
+    writer.uuids("auction.uid", [auction.uid for auction in auctions])
+    writer.strs("auction.post_token", [auction.post_token for auction in auctions])
+    writer.strs("auction.seller_id", [auction.seller_id for auction in auctions])
+    writer.strs("auction.post_title", [auction.post_title for auction in auctions])
+    writer.ints(
+        "auction.starting_price", [auction.starting_price for auction in auctions]
+    )
+    writer.ints("auction.bids_count", [auction.bids_count for auction in auctions])
+    writer.uuids("auction.selected_bid", [auction.selected_bid for auction in auctions])
+    writer.ints(
+        "auction.highest_bid_amount",
+        [auction.highest_bid_amount for auction in auctions],
+    )
+    writer.uuids(
+        "auction.highest_bid_id", [auction.highest_bid_id for auction in auctions]
+    )
+    writer.ints("auction.version", [auction.version for auction in auctions])
+    writer.strs("auction.lang_code", [auction.lang_code for auction in auctions])
+    writer.uuids("bid.uid", [bid.uid for bid in bids])
+    writer.uuids("bid.auction_id", [bid.auction_id for bid in bids])
+    writer.strs("bid.bidder_id", [bid.bidder_id for bid in bids])
+    writer.ints("bid.amount", [bid.amount for bid in bids])
+    writer.ints("bid.version", [bid.version for bid in bids])
+
+    # a handful per user, not worth columns
+    tokens = _tokens_adapter.dump_python(snapshot.access_tokens, mode="json")
+    header = {
+        "byteorder": sys.byteorder,
+        "auctions": len(auctions),
+        "bids": len(bids),
+        "access_tokens": tokens,
+        "columns": writer.columns,
+    }
+    header_content = json.dumps(header).encode()
+    header_content += b" " * (-(len(MAGIC) + 4 + len(header_content)) % 8)
+    return b"".join(
+        [
+            MAGIC,
+            _HEADER_SIZE.pack(len(header_content)),
+            header_content,
+            *writer.chunks,
+        ]
+    )
+
+
+def load_binary(path: Path) -> Snapshot:
+    with open(path, "rb") as snapshot_file:
+        if path.stat().st_size == 0:
+            raise ValueError(f"empty snapshot file {path}")
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            content = memoryview(mapped)
+            try:
+                return _load_binary(content)
+            finally:
+                content.release()
+
+
+def _load_binary(content: memoryview) -> Snapshot:
+    if bytes(content[: len(MAGIC)]) != MAGIC:
+        raise ValueError("not a binary snapshot")
+    (header_size,) = _HEADER_SIZE.unpack_from(content, len(MAGIC))
+    header_start = len(MAGIC) + _HEADER_SIZE.size
+    header = json.loads(bytes(content[header_start : header_start + header_size]))
+    body = content[header_start + header_size :]
+    try:
+        reader = _ColumnReader(body, header)
+        auctions = [
+            build(
+                Auction,
+                uid=uid,
+                post_token=post_token,
+                seller_id=seller_id,
+                post_title=post_title,
+                starting_price=starting_price,
+                bids_count=bids_count,
+                selected_bid=selected_bid,
+                highest_bid_amount=None if highest < 0 else highest,
+                highest_bid_id=highest_bid_id,
+                version=version,
+                lang_code=lang_code,
+                bids=[],
+            )
+            for (
+                uid,
+                post_token,
+                seller_id,
+                post_title,
+                starting_price,
+                bids_count,
+                selected_bid,
+                highest,
+                highest_bid_id,
+                version,
+                lang_code,
+            ) in zip(
+                reader.uuids("auction.uid"),
+                reader.strs("auction.post_token"),
+                reader.strs("auction.seller_id"),
+                reader.strs("auction.post_title"),
+                reader.ints("auction.starting_price"),
+                reader.ints("auction.bids_count"),
+                reader.uuids("auction.selected_bid"),
+                reader.ints("auction.highest_bid_amount"),
+                reader.uuids("auction.highest_bid_id"),
+                reader.ints("auction.version"),
+                # snapshots from before auctions had a language
+                reader.strs("auction.lang_code")
+                if "auction.lang_code" in reader.columns
+                else ["fa"] * header["auctions"],
+                strict=True,
+            )
+        ]
+        bids = [
+            build(
+                Bid,
+                uid=uid,
+                auction_id=auction_id,
+                bidder_id=bidder_id,
+                amount=amount,
+                version=version,
+            )
+            for uid, auction_id, bidder_id, amount, version in zip(
+                reader.uuids("bid.uid"),
+                reader.uuids("bid.auction_id"),
+                reader.strs("bid.bidder_id"),
+                reader.ints("bid.amount"),
+                reader.ints("bid.version"),
+                strict=True,
+            )
+        ]
+    finally:
+        body.release()
+    tokens = _tokens_adapter.validate_python(header["access_tokens"])
+    return Snapshot(
+        auctions=auctions,
+        bids=bids,
+        access_tokens=[init(token) for token in tokens],
+    )
+
+
+def convert(source: Path, target: Path, snapshot_format: SnapshotFormat) -> None:
+    snapshot = load_snapshot(source)
+    target.write_bytes(dump_snapshot(snapshot, snapshot_format))
+
+
+def _fake_snapshot(auctions_count: int, bids_per_auction: int) -> Snapshot:
+    snapshot = Snapshot()
+    for i in range(auctions_count):
+        auction = Auction(
+            post_token=PostToken(f"post{i}"),
+            seller_id=UserID("09120000000"),
+            starting_price=Rial(1000000),
+            post_title=f"title {i}",
+        )
+        snapshot.auctions.append(auction)
+        for j in range(bids_per_auction):
+            bid = Bid(
+                bidder_id=UserID(f"0912{j:07}"),
+                auction_id=auction.uid,
+                amount=Rial(1000000 + j * 1000),
+                uid=BidID(uuid4()),
+            )
+            snapshot.bids.append(bid)
+    return snapshot
+
+
+def bench(auctions_count: int, bids_per_auction: int, directory: Path) -> None:
+    """print dump and load times and file sizes of both formats"""
+    snapshot = _fake_snapshot(auctions_count, bids_per_auction)
+    print(f"{len(snapshot.auctions)} auctions, {len(snapshot.bids)} bids")
+    snapshot_formats: list[SnapshotFormat] = ["json", "binary"]
+    for snapshot_format in snapshot_formats:
+        path = directory / f"bench.{snapshot_format}"
+        started = time.perf_counter()
+        content = dump_snapshot(snapshot, snapshot_format)
+        dump_time = time.perf_counter() - started
+        path.write_bytes(content)
+        started = time.perf_counter()
+        load_snapshot(path)
+        load_time = time.perf_counter() - started
+        print(
+            f"{snapshot_format:>6}: dump {dump_time:.3f}s, load {load_time:.3f}s, "
+            f"{len(content) / 1024 / 1024:.1f} MiB"
+        )
+        path.unlink()
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="convert a snapshot file")
+    convert_parser.add_argument("source", type=Path)
+    convert_parser.add_argument("target", type=Path)
+    convert_parser.add_argument("--to", choices=["json", "binary"], required=True)
+    bench_parser = commands.add_parser("bench", help="compare snapshot formats")
+    bench_parser.add_argument("--auctions", type=int, default=10000)
+    bench_parser.add_argument("--bids-per-auction", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.source, args.target, args.to)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            bench(args.auctions, args.bids_per_auction, Path(directory))
@@ -1,44 +1,98 @@
-from sqlalchemy import delete, func, select, update
+import time
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable
+from uuid import uuid4
+
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.exc import StaleDataError
 
 from auction import db
 from auction._types import AuctionID, BidID, PostToken, Rial, UserID
-from auction.model import Auction, Bid
-from auction.repo.base import AccessTokenRepo, AuctionRepo
+from auction.core import exception
+from auction.model import AccessToken, Auction, Bid, BidCursor, OutboxMessage
+from auction.repo.base import AccessTokenRepo, AuctionLoad, AuctionRepo, OutboxRepo
+from auction.repo.tokenindex import AccessTokenIndex
 
 
-class SQLARepo(AuctionRepo, AccessTokenRepo):
-    """repository for sqlalchemy"""
+_uow_session: ContextVar[AsyncSession | None] = ContextVar("uow_session", default=None)
+
+
+def _dialect_insert(sess: AsyncSession) -> Callable:
+    """insert construct of the session's dialect, supporting ON CONFLICT"""
+    if sess.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
 
-    access_tokens: dict[UserID, list[dict]]
-    _instance = None
+
+class SQLARepo(AuctionRepo, AccessTokenRepo, OutboxRepo):
+    """repository for sqlalchemy"""
 
     def __init__(self, session: async_sessionmaker[AsyncSession]) -> None:
         self.session = session
+        self.access_tokens = AccessTokenIndex()
 
-    def __new__(cls, *args, **kwargs) -> "SQLARepo":
-        if cls._instance is None:
-            cls.access_tokens = {}
-            cls._instance = super().__new__(cls)
-        return cls._instance
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[None]:
+        """
+        share one session between every repo call inside this context
+        and commit once on exit, roll back everything on error
+        """
+        if _uow_session.get() is not None:
+            yield
+            return
+        async with self.session() as sess:
+            token = _uow_session.set(sess)
+            try:
+                yield
+                await sess.commit()
+            finally:
+                _uow_session.reset(token)
 
-    async def add_auction(self, auction: Auction) -> Auction:
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        """session of the active unit of work or a new one"""
+        sess = _uow_session.get()
+        if sess is not None:
+            yield sess
+            return
         async with self.session() as sess:
-            sess.add(auction)
+            yield sess
+
+    async def _flush(self, sess: AsyncSession) -> None:
+        """raises ConcurrentUpdate when an updated object was stale"""
+        try:
+            await sess.flush()
+        except StaleDataError as e:
+            raise exception.ConcurrentUpdate() from e
+
+    async def _commit(self, sess: AsyncSession) -> None:
+        """flush inside a unit of work, it commits once on exit"""
+        await self._flush(sess)
+        if _uow_session.get() is not sess:
             await sess.commit()
+
+    async def add_auction(self, auction: Auction) -> Auction:
+        async with self._session() as sess:
+            sess.add(auction)
+            await self._commit(sess)
             await sess.refresh(auction)
             sess.expunge(auction)
         return auction
 
     async def remove_auction(self, auction_id: AuctionID) -> None:
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = delete(Auction).where(db.base.Auction.uid == auction_id)
             await sess.execute(query)
-            await sess.commit()
+            await self._commit(sess)
 
     async def set_bidders_count(self, auction: Auction) -> Auction:
         count = 0
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = select(func.count(db.base.Bid.uid)).where(
                 db.base.Bid.auction_id == auction.uid,
             )
@@ -49,7 +103,7 @@ class SQLARepo(AuctionRepo, AccessTokenRepo):
 
     async def set_bids_on_auction(self, auction: Auction) -> Auction:
         bids: list[Bid] = []
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = select(Bid).where(
                 db.base.Bid.auction_id == auction.uid,
             )
@@ -62,16 +116,63 @@ class SQLARepo(AuctionRepo, AccessTokenRepo):
         return auction
 
     async def add_bid(self, bid: Bid) -> Bid:
-        async with self.session() as sess:
+        async with self._session() as sess:
             sess.add(bid)
-            await sess.commit()
+            await self._flush(sess)
+            await self._bid_added(sess, bid.auction_id, bid.uid, bid.amount)
+            await self._commit(sess)
             await sess.refresh(bid)
             sess.expunge(bid)
         return bid
 
+    async def upsert_bid(
+        self, auction_id: AuctionID, bidder_id: UserID, amount: Rial
+    ) -> Bid:
+        """
+        place or change a bidder's bid and unselect it in one transaction,
+        relies on the unique (auction_id, bidder_id) index
+        """
+        new_bid_id = uuid4()
+        async with self._session() as sess:
+            insert = _dialect_insert(sess)
+            query = insert(db.base.Bid).values(
+                uid=new_bid_id,
+                auction_id=auction_id,
+                bidder_id=bidder_id,
+                amount=amount,
+            )
+            query = query.on_conflict_do_update(
+                index_elements=[db.base.Bid.auction_id, db.base.Bid.bidder_id],
+                set_={
+                    db.base.Bid.amount: query.excluded.amount,
+                    db.base.Bid.version: db.base.Bid.version + 1,
+                },
+            ).returning(db.base.Bid.uid)
+            res = await sess.execute(query)
+            bid_id = res.scalar_one()
+            if bid_id == new_bid_id:
+                await self._bid_added(sess, auction_id, bid_id, amount)
+            else:
+                await self._update_auction_stats(sess, auction_id)
+            query = (
+                update(db.base.Auction)
+                .where(db.base.Auction.selected_bid == bid_id)
+                .values(
+                    {
+                        db.base.Auction.selected_bid: None,
+                        db.base.Auction.version: db.base.Auction.version + 1,
+                    }
+                )
+            )
+            await sess.execute(query)
+            await self._commit(sess)
+        return Bid(
+            bidder_id=bidder_id, auction_id=auction_id, amount=amount, uid=bid_id
+        )
+
     async def find_bid(self, auction_id: AuctionID, bidder_id: UserID) -> Bid | None:
         bid = None
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = select(Bid).where(
                 db.base.Bid.auction_id == auction_id,
                 db.base.Bid.bidder_id == bidder_id,
@@ -83,60 +184,176 @@ class SQLARepo(AuctionRepo, AccessTokenRepo):
         return bid
 
     async def change_bid_amount(self, bid: Bid, amount: Rial) -> Bid:
-        async with self.session() as sess:
-            bid.amount = amount
-            sess.add(bid)
-            await sess.commit()
-            await sess.refresh(bid)
-            sess.expunge(bid)
-            return bid
+        async with self._session() as sess:
+            query = (
+                update(db.base.Bid)
+                .where(db.base.Bid.uid == bid.uid, db.base.Bid.version == bid.version)
+                .values(amount=amount, version=db.base.Bid.version + 1)
+                .returning(db.base.Bid.version)
+            )
+            res = await sess.execute(query)
+            version = res.scalar()
+            if version is None:
+                raise exception.ConcurrentUpdate()
+            await self._update_auction_stats(sess, bid.auction_id)
+            await self._commit(sess)
+        bid.amount = amount
+        bid.version = version
+        return bid
 
     async def remove_bid(self, bid_id: BidID) -> None:
-        async with self.session() as sess:
-            query = delete(Bid).where(db.base.Bid.uid == bid_id)
-            await sess.execute(query)
-            await sess.commit()
+        async with self._session() as sess:
+            query = (
+                delete(db.base.Bid)
+                .where(db.base.Bid.uid == bid_id)
+                .returning(db.base.Bid.auction_id)
+            )
+            res = await sess.execute(query)
+            auction_id = res.scalar()
+            if auction_id is not None:
+                await self._update_auction_stats(sess, auction_id)
+            await self._commit(sess)
 
     async def remove_bids_by_auction_id(self, auction_id: AuctionID) -> None:
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = delete(Bid).where(db.base.Bid.auction_id == auction_id)
             await sess.execute(query)
-            await sess.commit()
+            reset_stats = (
+                update(db.base.Auction)
+                .where(db.base.Auction.uid == auction_id)
+                .values(bids_count=0, highest_bid_amount=None, highest_bid_id=None)
+            )
+            await sess.execute(reset_stats)
+            await self._commit(sess)
+
+    async def repair_auction_stats(self) -> None:
+        async with self._session() as sess:
+            await self._update_auction_stats(sess)
+            await self._commit(sess)
+
+    async def _bid_added(
+        self, sess: AsyncSession, auction_id: AuctionID, bid_id: BidID, amount: Rial
+    ) -> None:
+        """count a new bid in and make it the highest bid if it tops the current"""
+        auction = db.base.Auction
+        is_highest = or_(
+            auction.highest_bid_amount.is_(None),
+            auction.highest_bid_amount < amount,
+            and_(
+                auction.highest_bid_amount == amount,
+                auction.highest_bid_id < bid_id,
+            ),
+        )
+        query = (
+            update(auction)
+            .where(auction.uid == auction_id)
+            .values(
+                bids_count=auction.bids_count + 1,
+                highest_bid_amount=case(
+                    (is_highest, amount), else_=auction.highest_bid_amount
+                ),
+                highest_bid_id=case((is_highest, bid_id), else_=auction.highest_bid_id),
+            )
+        )
+        await sess.execute(query)
+
+    async def _update_auction_stats(
+        self, sess: AsyncSession, auction_id: AuctionID | None = None
+    ) -> None:
+        """
+        recompute bids_count and highest bid of one auction, or of every
+        auction when auction_id is None, from the bids table
+        """
+        auction = db.base.Auction
+        bid = aliased(db.base.Bid)
+        auction_bids = select(bid).where(bid.auction_id == auction.uid)
+        highest_bid = auction_bids.order_by(bid.amount.desc(), bid.uid.desc()).limit(1)
+        query = update(auction).values(
+            bids_count=select(func.count(bid.uid))
+            .where(bid.auction_id == auction.uid)
+            .scalar_subquery(),
+            highest_bid_amount=highest_bid.with_only_columns(
+                bid.amount
+            ).scalar_subquery(),
+            highest_bid_id=highest_bid.with_only_columns(bid.uid).scalar_subquery(),
+        )
+        if auction_id is not None:
+            query = query.where(auction.uid == auction_id)
+        await sess.execute(query)
 
     async def remove_selected_bid(self, bid_id: BidID) -> None:
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = (
                 update(db.base.Auction)
                 .where(db.base.Auction.selected_bid == bid_id)
-                .values({db.base.Auction.selected_bid: None})
+                .values(
+                    {
+                        db.base.Auction.selected_bid: None,
+                        db.base.Auction.version: db.base.Auction.version + 1,
+                    }
+                )
             )
             await sess.execute(query)
-            await sess.commit()
+            await self._commit(sess)
 
     async def select_bid(self, auction: Auction, bid_id: BidID) -> Auction:
-        async with self.session() as sess:
-            auction.selected_bid = bid_id
-            sess.add(auction)
-            await sess.commit()
-            await sess.refresh(auction)
-            sess.expunge(auction)
-            return auction
+        async with self._session() as sess:
+            query = (
+                update(db.base.Auction)
+                .where(
+                    db.base.Auction.uid == auction.uid,
+                    db.base.Auction.version == auction.version,
+                )
+                .values(selected_bid=bid_id, version=db.base.Auction.version + 1)
+                .returning(db.base.Auction.version)
+            )
+            res = await sess.execute(query)
+            version = res.scalar()
+            if version is None:
+                raise exception.ConcurrentUpdate()
+            await self._commit(sess)
+        auction.selected_bid = bid_id
+        auction.version = version
+        return auction
+
+    async def read_auction_by_post_token(
+        self, post_token: PostToken, load: AuctionLoad = AuctionLoad.FULL
+    ) -> Auction | None:
+        if load == AuctionLoad.FULL:
+            return await self._read_full_auction_by_post_token(post_token)
 
-    async def read_auction_by_post_token(self, post_token: PostToken) -> Auction | None:
+        # bids_count is stored on the auction row
         auction = None
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = select(Auction).where(db.base.Auction.post_token == post_token)
             res = await sess.execute(query)
             auction = res.scalar()
             if auction:
                 sess.expunge(auction)
-                await self.set_bids_on_auction(auction)
-                await self.set_bidders_count(auction)
+        return auction
+
+    async def _read_full_auction_by_post_token(
+        self, post_token: PostToken
+    ) -> Auction | None:
+        """read auction and its bids in a single statement"""
+        query = (
+            select(Auction, Bid)
+            .outerjoin(Bid, db.base.Bid.auction_id == db.base.Auction.uid)
+            .where(db.base.Auction.post_token == post_token)
+        )
+        auction = None
+        async with self._session() as sess:
+            res = await sess.execute(query)
+            rows = res.all()
+            if rows:
+                sess.expunge_all()
+                auction = rows[0][0]
+                auction.bids = [bid for _, bid in rows if bid is not None]
         return auction
 
     async def read_auction_by_id(self, auction_id: AuctionID) -> Auction | None:
         auction = None
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = select(Auction).where(db.base.Auction.uid == auction_id)
             res = await sess.execute(query)
             auction = res.scalar()
@@ -146,7 +363,7 @@ class SQLARepo(AuctionRepo, AccessTokenRepo):
 
     async def read_bid_by_id(self, bid_id: BidID) -> Bid | None:
         bid = None
-        async with self.session() as sess:
+        async with self._session() as sess:
             query = select(Bid).where(db.base.Bid.uid == bid_id)
             res = await sess.execute(query)
             bid = res.scalar()
@@ -154,37 +371,241 @@ class SQLARepo(AuctionRepo, AccessTokenRepo):
                 sess.expunge(bid)
         return bid
 
+    async def read_bids_page(
+        self, auction_id: AuctionID, limit: int, after: BidCursor | None = None
+    ) -> list[Bid]:
+        query = (
+            select(Bid)
+            .where(db.base.Bid.auction_id == auction_id)
+            .order_by(db.base.Bid.amount.desc(), db.base.Bid.uid.desc())
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(
+                or_(
+                    db.base.Bid.amount < after.amount,
+                    and_(
+                        db.base.Bid.amount == after.amount,
+                        db.base.Bid.uid < after.uid,
+                    ),
+                )
+            )
+        async with self._session() as sess:
+            res = await sess.execute(query)
+            bids = list(res.scalars())
+            sess.expunge_all()
+        return bids
+
+    async def read_auctions_by_post_tokens(
+        self, post_tokens: list[PostToken]
+    ) -> dict[PostToken, Auction]:
+        if not post_tokens:
+            return {}
+        async with self._session() as sess:
+            query = select(Auction).where(
+                db.base.Auction.post_token.in_(set(post_tokens))
+            )
+            res = await sess.execute(query)
+            auctions = list(res.scalars())
+            sess.expunge_all()
+        return {auction.post_token: auction for auction in auctions}
+
+    async def read_bids_by_ids(self, bid_ids: list[BidID]) -> dict[BidID, Bid]:
+        if not bid_ids:
+            return {}
+        async with self._session() as sess:
+            query = select(Bid).where(db.base.Bid.uid.in_(set(bid_ids)))
+            res = await sess.execute(query)
+            bids = list(res.scalars())
+            sess.expunge_all()
+        return {bid.uid: bid for bid in bids}
+
+    async def find_bids_for_bidder(
+        self, bidder_id: UserID, auction_ids: list[AuctionID]
+    ) -> dict[AuctionID, Bid]:
+        if not auction_ids:
+            return {}
+        async with self._session() as sess:
+            query = select(Bid).where(
+                db.base.Bid.bidder_id == bidder_id,
+                db.base.Bid.auction_id.in_(set(auction_ids)),
+            )
+            res = await sess.execute(query)
+            bids = list(res.scalars())
+            sess.expunge_all()
+        return {bid.auction_id: bid for bid in bids}
+
+    async def read_top_bids(self, auction_id: AuctionID, n: int) -> list[Bid]:
+        async with self._session() as sess:
+            query = (
+                select(Bid)
+                .where(db.base.Bid.auction_id == auction_id)
+                .order_by(db.base.Bid.amount.desc())
+                .limit(n)
+            )
+            res = await sess.execute(query)
+            bids = list(res.scalars())
+            sess.expunge_all()
+        return bids
+
     async def add_user_access_token(
         self, user_id: UserID, access_token_data: dict
     ) -> None:
-        db_data: list[dict] = self.access_tokens.get(user_id, [])
-        if db_data:
-            db_data.append(access_token_data)
-            return
-        self.access_tokens[user_id] = [access_token_data]
+        token = AccessToken.from_data(user_id, access_token_data)
+        async with self._session() as sess:
+            query = delete(AccessToken).where(
+                db.base.AccessToken.expires_at <= int(time.time())
+            )
+            await sess.execute(query)
+            sess.add(token)
+            await self._commit(sess)
+            await sess.refresh(token)
+            sess.expunge(token)
+        self.access_tokens.add(token)
 
     async def get_user_access_token_by_scope(
         self, user_id: UserID, scope: str
     ) -> dict | None:
-        user_access_tokens = self.access_tokens.get(user_id)
-        if user_access_tokens is None:
-            return None
-        return next(
-            (data for data in user_access_tokens if scope in data["scope"]), None
-        )
+        return await self.get_user_access_token_by_scopes(user_id, [scope])
 
     async def get_user_access_token_by_scopes(
         self, user_id: UserID, scopes: list[str]
     ) -> dict | None:
-        user_access_tokens = self.access_tokens.get(user_id)
-        if user_access_tokens is None:
+        token = self.access_tokens.find(user_id, scopes)
+        if token is None:
+            # tokens added by other workers or before a restart
+            await self._load_user_access_tokens(user_id)
+            token = self.access_tokens.find(user_id, scopes)
+        if token is None:
             return None
-        for data in user_access_tokens:
-            found_all = True
-            for scope in scopes:
-                if scope not in data["scope"]:
-                    found_all = False
-                    break
-            if found_all:
-                return data
-        return None
+        return token.data
+
+    async def _load_user_access_tokens(self, user_id: UserID) -> None:
+        async with self._session() as sess:
+            query = select(AccessToken).where(
+                db.base.AccessToken.user_id == user_id,
+                db.base.AccessToken.expires_at > int(time.time()),
+            )
+            res = await sess.execute(query)
+            tokens = list(res.scalars())
+            sess.expunge_all()
+        for token in tokens:
+            self.access_tokens.add(token)
+
+    async def add_outbox_message(self, message: OutboxMessage) -> None:
+        async with self._session() as sess:
+            sess.add(message)
+            await self._commit(sess)
+            sess.expunge(message)
+
+    async def cancel_outbox_messages(self, post_token: PostToken, kind: str) -> None:
+        # a message that isn't due may be leased and on its way, it's kept
+        # and the messages added after it wait for its delivery
+        async with self._session() as sess:
+            query = delete(OutboxMessage).where(
+                db.base.OutboxMessage.post_token == post_token,
+                db.base.OutboxMessage.kind == kind,
+                db.base.OutboxMessage.dead.is_(False),
+                db.base.OutboxMessage.next_attempt_at <= time.time(),
+            )
+            await sess.execute(query)
+            await self._commit(sess)
+
+    async def claim_outbox_messages(
+        self, limit: int, lease: float
+    ) -> list[OutboxMessage]:
+        now = time.time()
+        table = db.base.OutboxMessage
+        # a message waits for the older messages of its post, even the
+        # ones backed off or leased, so a post's messages go out in order
+        older = table.__table__.alias("older")
+        older_pending = (
+            select(older.c.uid)
+            .where(
+                older.c.post_token == table.post_token,
+                older.c.dead.is_(False),
+                older.c.created_at < table.created_at,
+            )
+            .exists()
+        )
+        claimed: list[OutboxMessage] = []
+        async with self._session() as sess:
+            query = (
+                select(OutboxMessage)
+                .where(
+                    table.dead.is_(False),
+                    table.next_attempt_at <= now,
+                    ~older_pending,
+                )
+                .order_by(table.next_attempt_at, table.created_at)
+                .limit(limit)
+            )
+            res = await sess.execute(query)
+            messages = list(res.scalars())
+            sess.expunge_all()
+            for message in messages:
+                # compare and set, a message claimed by another worker
+                # in the meantime has moved its next_attempt_at
+                update_query = (
+                    update(table)
+                    .where(
+                        table.uid == message.uid,
+                        table.next_attempt_at == message.next_attempt_at,
+                    )
+                    .values(next_attempt_at=now + lease)
+                    .returning(table.uid)
+                )
+                res = await sess.execute(update_query)
+                if res.scalar() is not None:
+                    message.next_attempt_at = now + lease
+                    claimed.append(message)
+            await self._commit(sess)
+        return claimed
+
+    async def complete_outbox_message(self, message: OutboxMessage) -> None:
+        async with self._session() as sess:
+            query = delete(OutboxMessage).where(
+                db.base.OutboxMessage.uid == message.uid
+            )
+            await sess.execute(query)
+            await self._commit(sess)
+
+    async def fail_outbox_message(
+        self, message: OutboxMessage, error: str, retry_at: float | None
+    ) -> None:
+        message.attempts += 1
+        message.last_error = error
+        message.dead = retry_at is None
+        if retry_at is not None:
+            message.next_attempt_at = retry_at
+        async with self._session() as sess:
+            query = (
+                update(db.base.OutboxMessage)
+                .where(db.base.OutboxMessage.uid == message.uid)
+                .values(
+                    attempts=message.attempts,
+                    last_error=message.last_error,
+                    dead=message.dead,
+                    next_attempt_at=message.next_attempt_at,
+                )
+            )
+            await sess.execute(query)
+            await self._commit(sess)
+
+    async def count_outbox_messages(self) -> dict[str, int]:
+        async with self._session() as sess:
+            query = select(
+                db.base.OutboxMessage.dead, func.count(db.base.OutboxMessage.uid)
+            ).group_by(db.base.OutboxMessage.dead)
+            res = await sess.execute(query)
+            counts = {bool(dead): count for dead, count in res.all()}
+        return {"pending": counts.get(False, 0), "dead": counts.get(True, 0)}
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from auction.db import get_session
+
+    # recompute denormalized auction bid stats from the bids table
+    asyncio.run(SQLARepo(session=get_session()).repair_auction_stats())
@@ -0,0 +1,81 @@
+import heapq
+import time
+
+from uuid import UUID
+
+from auction._types import UserID
+from auction.model import AccessToken
+
+
+class AccessTokenIndex:
+    """
+    in memory index of unexpired access tokens by (user_id, scope).
+    scope lookups intersect the token sets of each scope instead of
+    scanning every token of the user, expired tokens are evicted in
+    expiry order.
+    """
+
+    def __init__(self) -> None:
+        self._tokens: dict[UUID, AccessToken] = {}
+        self._by_user: dict[UserID, set[UUID]] = {}
+        self._by_scope: dict[tuple[UserID, str], set[UUID]] = {}
+        self._expiry: list[tuple[int, UUID]] = []
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def tokens(self) -> list[AccessToken]:
+        return list(self._tokens.values())
+
+    def add(self, token: AccessToken) -> None:
+        if token.uid in self._tokens or token.expires_at <= time.time():
+            return
+        self._tokens[token.uid] = token
+        self._by_user.setdefault(token.user_id, set()).add(token.uid)
+        for scope in token.scopes:
+            self._by_scope.setdefault((token.user_id, scope), set()).add(token.uid)
+        heapq.heappush(self._expiry, (token.expires_at, token.uid))
+
+    def remove(self, uid: UUID) -> None:
+        token = self._tokens.pop(uid, None)
+        if token is None:
+            return
+        _discard(self._by_user, token.user_id, uid)
+        for scope in token.scopes:
+            _discard(self._by_scope, (token.user_id, scope), uid)
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        evicted = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, uid = heapq.heappop(self._expiry)
+            if uid in self._tokens:
+                self.remove(uid)
+                evicted += 1
+        return evicted
+
+    def find(self, user_id: UserID, scopes: list[str]) -> AccessToken | None:
+        """unexpired token of the user holding all scopes, the longest lived one"""
+        self.evict_expired()
+        if not scopes:
+            candidates = self._by_user.get(user_id, set())
+        else:
+            scope_sets = sorted(
+                (self._by_scope.get((user_id, scope), set()) for scope in scopes),
+                key=len,
+            )
+            candidates = scope_sets[0].intersection(*scope_sets[1:])
+        if not candidates:
+            return None
+        return max(
+            (self._tokens[uid] for uid in candidates), key=lambda t: t.expires_at
+        )
+
+
+def _discard(index: dict, key: object, uid: UUID) -> None:
+    uids = index.get(key)
+    if uids is None:
+        return
+    uids.discard(uid)
+    if not uids:
+        del index[key]
@@ -0,0 +1,348 @@
+"""
+Stream auctions, bids and access tokens between storage backends.
+
+    python -m auction.repo.transfer SOURCE TARGET [--batch-size N] [--checkpoint F]
+
+SOURCE and TARGET are json:PATH (a JSONFileRepo db file), ndjson:PATH (one
+journal record per line) or sql[:URL] (the configured database by default).
+A json source is only read, its journal is replayed in memory and never
+truncated or compacted.
+Rows move in batches as plain column dicts, sql targets insert each batch as
+one multi-row insert in its own transaction. After every committed batch the
+checkpoint file records how far each table got, rerunning with the same
+checkpoint resumes from there. json targets are written once at the end
+and take no checkpoint.
+"""
+
+import json
+import sys
+import time
+
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterable, Iterator
+from uuid import UUID
+
+from sqlalchemy import Table, Uuid, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from auction import db
+from auction.model import AccessToken, Auction, Bid
+from auction.repo.jsonfilerepo import _atomic_write, _record_adapters
+from auction.repo.snapshot import Snapshot, build, dump_snapshot, init, load_snapshot
+
+
+Row = dict[str, Any]
+
+TABLES: dict[str, Table] = {
+    "auction": db.base.Auction.__table__,  # type: ignore[dict-item]
+    "bid": db.base.Bid.__table__,  # type: ignore[dict-item]
+    "access_token": db.base.AccessToken.__table__,  # type: ignore[dict-item]
+}
+SNAPSHOT_TABLES = {
+    "auction": "auctions",
+    "bid": "bids",
+    "access_token": "access_tokens",
+}
+MODELS: dict[str, type] = {
+    "auction": Auction,
+    "bid": Bid,
+    "access_token": AccessToken,
+}
+
+
+def _uuid_columns(table: Table) -> list[str]:
+    return [column.name for column in table.columns if isinstance(column.type, Uuid)]
+
+
+def _batches(rows: Iterable[Row], batch_size: int) -> Iterator[list[Row]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+@dataclass
+class Checkpoint:
+    """rows of each table already written to the target"""
+
+    path: Path | None
+    counts: dict[str, int] = field(default_factory=dict)
+    last_uids: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path | None) -> "Checkpoint":
+        if path is None or not path.exists():
+            return cls(path=path)
+        data = json.loads(path.read_text())
+        return cls(path=path, counts=data["counts"], last_uids=data["last_uids"])
+
+    def advance(self, record_type: str, rows: list[Row]) -> None:
+        self.counts[record_type] = self.counts.get(record_type, 0) + len(rows)
+        self.last_uids[record_type] = str(rows[-1]["uid"])
+        if self.path is not None:
+            data = {"counts": self.counts, "last_uids": self.last_uids}
+            _atomic_write(self.path, json.dumps(data).encode())
+
+
+class Progress:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.counts: dict[str, int] = {}
+
+    def report(self, record_type: str, rows: int) -> None:
+        self.counts[record_type] = self.counts.get(record_type, 0) + rows
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.counts.values())
+        print(
+            f"\r{record_type}: {self.counts[record_type]} rows, "
+            f"{total / elapsed:,.0f} rows/s",
+            end="",
+            file=sys.stderr,
+        )
+
+    def finish(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.counts.values())
+        counts = ", ".join(f"{count} {name}" for name, count in self.counts.items())
+        print(
+            f"\ntransferred {counts} in {elapsed:.1f}s "
+            f"({total / max(elapsed, 1e-9):,.0f} rows/s)",
+            file=sys.stderr,
+        )
+
+
+class JSONSource:
+    """
+    a JSONFileRepo db file read without opening the repo. the snapshot is
+    loaded once and each of its tables is dropped after it's read, journal
+    records of a table are applied on top while it's streamed
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._snapshot: Snapshot | None = None
+
+    def objects(self, record_type: str) -> Iterator[Any]:
+        if self._snapshot is None:
+            self._snapshot = (
+                load_snapshot(self.path) if self.path.exists() else Snapshot()
+            )
+        changes = self._journal_changes(record_type)
+        table = SNAPSHOT_TABLES[record_type]
+        objects = getattr(self._snapshot, table)
+        setattr(self._snapshot, table, [])
+        for obj in objects:
+            if obj.uid in changes:
+                obj = changes.pop(obj.uid)
+            if obj is not None:
+                yield obj
+        # objects added after the snapshot
+        for obj in changes.values():
+            if obj is not None:
+                yield obj
+
+    def _journal_changes(self, record_type: str) -> dict[UUID, Any]:
+        """latest journal state of the table's objects, None for removed ones"""
+        changes: dict[UUID, Any] = {}
+        adapter = _record_adapters[record_type]
+        for suffix in [".journal.1", ".journal"]:
+            journal_path = Path(f"{self.path}{suffix}")
+            if not journal_path.exists():
+                continue
+            with open(journal_path, "rb") as journal:
+                for line in journal:
+                    if not line.endswith(b"\n"):
+                        break  # torn by a crash in the middle of an append
+                    record = json.loads(line)
+                    if record["type"] != record_type:
+                        continue
+                    data = record["data"]
+                    changes[UUID(record["uid"])] = (
+                        None if data is None else init(adapter.validate_python(data))
+                    )
+        return changes
+
+
+async def read_json(
+    source: JSONSource, record_type: str, checkpoint: Checkpoint, batch_size: int
+) -> AsyncIterator[list[Row]]:
+    names = TABLES[record_type].columns.keys()
+    objects = source.objects(record_type)
+    rows = ({name: getattr(obj, name) for name in names} for obj in objects)
+    skipped = islice(rows, checkpoint.counts.get(record_type, 0), None)
+    for batch in _batches(skipped, batch_size):
+        yield batch
+
+
+async def read_ndjson(
+    path: Path, record_type: str, checkpoint: Checkpoint, batch_size: int
+) -> AsyncIterator[list[Row]]:
+    uuid_columns = _uuid_columns(TABLES[record_type])
+
+    def rows() -> Iterator[Row]:
+        with open(path, "r") as ndjson_file:
+            for line in ndjson_file:
+                record = json.loads(line)
+                if record["type"] != record_type or record["data"] is None:
+                    continue
+                row = record["data"]
+                for name in uuid_columns:
+                    if row.get(name) is not None:
+                        row[name] = UUID(row[name])
+                yield row
+
+    skipped = islice(rows(), checkpoint.counts.get(record_type, 0), None)
+    for batch in _batches(skipped, batch_size):
+        yield batch
+
+
+async def read_sql(
+    engine: AsyncEngine, record_type: str, checkpoint: Checkpoint, batch_size: int
+) -> AsyncIterator[list[Row]]:
+    """keyset ordered by uid, a resumed read starts after the last copied uid"""
+    table = TABLES[record_type]
+    query = select(table).order_by(table.c.uid)
+    last_uid = checkpoint.last_uids.get(record_type)
+    if last_uid is not None:
+        query = query.where(table.c.uid > UUID(last_uid))
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.mappings().partitions(batch_size):
+            yield [dict(row) for row in partition]
+
+
+class JSONTarget:
+    """collects everything and writes one snapshot, it can't resume"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.snapshot = Snapshot()
+
+    async def write(self, record_type: str, rows: list[Row]) -> None:
+        extra: Row = {"bids": []} if record_type == "auction" else {}
+        objects: list[Any] = [
+            build(MODELS[record_type], **row, **extra) for row in rows
+        ]
+        if record_type == "auction":
+            self.snapshot.auctions.extend(objects)
+        elif record_type == "bid":
+            self.snapshot.bids.extend(objects)
+        else:
+            self.snapshot.access_tokens.extend(objects)
+
+    async def close(self) -> None:
+        _atomic_write(self.path, dump_snapshot(self.snapshot, "json"))
+
+
+class NDJSONTarget:
+    def __init__(self, path: Path, append: bool) -> None:
+        self.file = open(path, "a" if append else "w")
+
+    async def write(self, record_type: str, rows: list[Row]) -> None:
+        lines = [
+            json.dumps(
+                {"type": record_type, "uid": str(row["uid"]), "data": row},
+                default=str,
+            )
+            + "\n"
+            for row in rows
+        ]
+        self.file.writelines(lines)
+        self.file.flush()
+
+    async def close(self) -> None:
+        self.file.close()
+
+
+class SQLTarget:
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+
+    async def write(self, record_type: str, rows: list[Row]) -> None:
+        table = TABLES[record_type]
+        if record_type == "auction":
+            for row in rows:
+                row["post_title"] = row["post_title"] or ""
+        dialect_insert = (
+            postgresql.insert
+            if self.engine.dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        # rows of a batch committed before a crash are skipped on resume
+        query = dialect_insert(table).on_conflict_do_nothing()
+        async with self.engine.begin() as conn:
+            await conn.execute(query, rows)
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+
+
+def _sql_engine(location: str) -> AsyncEngine:
+    return db.get_engine(location or None)
+
+
+def _target_writer(
+    target: str, checkpoint: Checkpoint
+) -> JSONTarget | NDJSONTarget | SQLTarget:
+    target_kind, _, target_location = target.partition(":")
+    if target_kind == "json":
+        if checkpoint.path is not None:
+            # nothing is on disk before close, a resumed run would lose the
+            # batches the checkpoint counts as written
+            raise ValueError("a json target can't resume, run without --checkpoint")
+        return JSONTarget(Path(target_location))
+    if target_kind == "ndjson":
+        append = bool(checkpoint.counts)
+        return NDJSONTarget(Path(target_location), append=append)
+    if target_kind == "sql":
+        return SQLTarget(_sql_engine(target_location))
+    raise ValueError(f"unknown target {target}")
+
+
+async def transfer(
+    source: str, target: str, batch_size: int, checkpoint_path: Path | None
+) -> None:
+    checkpoint = Checkpoint.load(checkpoint_path)
+    source_kind, _, source_location = source.partition(":")
+    if source_kind not in ("json", "ndjson", "sql"):
+        raise ValueError(f"unknown source {source}")
+    target_writer = _target_writer(target, checkpoint)
+
+    json_source = JSONSource(Path(source_location))
+    source_engine = _sql_engine(source_location) if source_kind == "sql" else None
+    progress = Progress()
+    try:
+        for record_type in TABLES:
+            if source_engine is not None:
+                batches = read_sql(source_engine, record_type, checkpoint, batch_size)
+            elif source_kind == "json":
+                batches = read_json(json_source, record_type, checkpoint, batch_size)
+            else:
+                batches = read_ndjson(
+                    Path(source_location), record_type, checkpoint, batch_size
+                )
+            async for batch in batches:
+                await target_writer.write(record_type, batch)
+                checkpoint.advance(record_type, batch)
+                progress.report(record_type, len(batch))
+    finally:
+        if source_engine is not None:
+            await source_engine.dispose()
+    await target_writer.close()
+    progress.finish()
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", help="json:PATH, ndjson:PATH or sql[:URL]")
+    parser.add_argument("target", help="json:PATH, ndjson:PATH or sql[:URL]")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--checkpoint", type=Path, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(transfer(args.source, args.target, args.batch_size, args.checkpoint))
@@ -0,0 +1,141 @@
+import time
+
+from types import SimpleNamespace
+
+import pytest
+
+from kenar import CreatePostAddonRequest
+
+from auction._types import PostToken
+from auction.api.addon import AddonRefresher, TokenBucket
+from auction.api.outbox import DELETE_POST_ADDON
+from auction.core import i18n
+from auction.model import Auction
+from auction.repo import AccessTokenRepo, AuctionRepo, OutboxRepo
+from tests.api.test_auction import start_auction, start_auction_with_bids
+
+
+class FakeAddonService:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, CreatePostAddonRequest]] = []
+
+    async def create_post_addon(
+        self, access_token: str, data: CreatePostAddonRequest
+    ) -> object:
+        self.calls.append((access_token, data))
+        return object()
+
+
+async def add_seller_token(auc_repo: AuctionRepo, auction: Auction) -> None:
+    assert isinstance(auc_repo, AccessTokenRepo)
+    await auc_repo.add_user_access_token(
+        user_id=auction.seller_id,
+        access_token_data={
+            "access_token": "seller token",
+            "scope": f"POST_ADDON_CREATE.{auction.post_token}",
+            "expires_in": 3600,
+        },
+    )
+
+
+def test_refresher_coalesces_changes_of_a_post() -> None:
+    refresher = AddonRefresher(debounce=30)
+    for _ in range(5):
+        refresher.schedule(PostToken("A"))
+    refresher.schedule(PostToken("B"))
+    assert refresher.stats == {
+        "scheduled": 2,
+        "coalesced": 4,
+        "published": 0,
+        "failed": 0,
+        "pending": 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_refresher_publishes_once_per_window(auc_repo: AuctionRepo) -> None:
+    await add_seller_token(auc_repo, await start_auction_with_bids(auc_repo))
+    addon = FakeAddonService()
+    divar_client = SimpleNamespace(addon=addon)
+
+    refresher = AddonRefresher(debounce=60)
+    for _ in range(3):
+        refresher.schedule(PostToken("A"))
+    # the window is still open
+    await refresher.refresh_due(auc_repo, divar_client)  # type: ignore
+    assert addon.calls == []
+
+    refresher = AddonRefresher(debounce=0)
+    for _ in range(3):
+        refresher.schedule(PostToken("A"))
+    await refresher.refresh_due(auc_repo, divar_client)  # type: ignore
+    assert len(addon.calls) == 1
+    access_token, data = addon.calls[0]
+    assert access_token == "seller token"
+    assert data.token == "A"
+    assert len(data.widgets) == 4  # with the top bid row
+    assert refresher.stats["published"] == 1
+    assert refresher.stats["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_refresher_renders_in_seller_language(auc_repo: AuctionRepo) -> None:
+    auction = await start_auction_with_bids(auc_repo, lang_code="en")
+    await add_seller_token(auc_repo, auction)
+    addon = FakeAddonService()
+    refresher = AddonRefresher(debounce=0)
+    refresher.schedule(auction.post_token)
+
+    # refreshes run in the background, in the default language
+    i18n.set_lang_code("fa")
+    await refresher.refresh_due(auc_repo, SimpleNamespace(addon=addon))  # type: ignore
+    _, data = addon.calls[0]
+    assert data.widgets[0].text == "Auction Available"
+
+
+@pytest.mark.asyncio
+async def test_refresher_deletes_addon_of_removed_auction(
+    auc_repo: AuctionRepo,
+) -> None:
+    auction = await start_auction_with_bids(auc_repo)
+    await add_seller_token(auc_repo, auction)
+    addon = FakeAddonService()
+    create_post_addon = addon.create_post_addon
+
+    async def removed_while_sent(
+        access_token: str, data: CreatePostAddonRequest
+    ) -> object:
+        await auc_repo.remove_auction(auction.uid)
+        return await create_post_addon(access_token, data)
+
+    addon.create_post_addon = removed_while_sent  # type: ignore[method-assign]
+    refresher = AddonRefresher(debounce=0)
+    refresher.schedule(auction.post_token)
+    await refresher.refresh_due(auc_repo, SimpleNamespace(addon=addon))  # type: ignore
+
+    assert isinstance(auc_repo, OutboxRepo)
+    messages = await auc_repo.claim_outbox_messages(limit=10, lease=60)
+    assert [(m.kind, m.post_token) for m in messages] == [
+        (DELETE_POST_ADDON, auction.post_token)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_refresher_without_seller_token(auc_repo: AuctionRepo) -> None:
+    await start_auction(auc_repo)
+    addon = FakeAddonService()
+    refresher = AddonRefresher(debounce=0)
+    refresher.schedule(PostToken("A"))
+    await refresher.refresh_due(auc_repo, SimpleNamespace(addon=addon))  # type: ignore
+    assert addon.calls == []
+    assert refresher.stats["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate() -> None:
+    bucket = TokenBucket(rate=100, burst=2)
+    started_at = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    # the burst is free, the next two wait for 1/100s each
+    assert time.monotonic() - started_at >= 0.015
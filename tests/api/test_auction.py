@@ -9,12 +9,21 @@ from fastapi.testclient import TestClient
 
 from auction import divar
 from auction._types import AuctionID, PostToken, Rial, UserID
+from auction.api import service
+from auction.api.outbox import outbox_worker
 from auction.divar import mock_data as divar_mock_data
-from auction.model import Auction, AuctionStartInput, Bid, PlaceBid, SelectBid
-from auction.repo import AuctionRepo
-
-
-async def start_auction(auc_repo: AuctionRepo) -> Auction:
+from auction.model import (
+    Auction,
+    AuctionStartInput,
+    Bid,
+    BidCursor,
+    PlaceBid,
+    SelectBid,
+)
+from auction.repo import AuctionRepo, CachedAuctionRepo, OutboxRepo
+
+
+async def start_auction(auc_repo: AuctionRepo, lang_code: str = "fa") -> Auction:
     auction_id = AuctionID(uuid4())
     user_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
     auction = Auction(
@@ -23,13 +32,16 @@ async def start_auction(auc_repo: AuctionRepo) -> Auction:
         seller_id=user_id,
         starting_price=Rial(1000),
         post_title="Test Post",
+        lang_code=lang_code,
     )
     auction = await auc_repo.add_auction(auction)
     return auction
 
 
-async def start_auction_with_bids(auc_repo: AuctionRepo) -> Auction:
-    auction = await start_auction(auc_repo)
+async def start_auction_with_bids(
+    auc_repo: AuctionRepo, lang_code: str = "fa"
+) -> Auction:
+    auction = await start_auction(auc_repo, lang_code)
     bidder_id = UserID(divar_mock_data.BIDDER_PHONE_NUMBER)
     bids = [
         Bid(bidder_id=UserID("2"), auction_id=auction.uid, amount=Rial(11000)),
@@ -59,6 +71,9 @@ async def test_seller_start_auction(
     assert response.status_code == 200
     auction = await auc_repo.read_auction_by_post_token(post_token=post_token)
     assert auction is not None
+    assert auction.lang_code == "en"
+    assert isinstance(auc_repo, OutboxRepo)
+    assert await auc_repo.count_outbox_messages() == {"pending": 1, "dead": 0}
 
 
 @pytest.mark.asyncio
@@ -86,10 +101,16 @@ async def test_seller_remove_auction(
 
     assert response.status_code == 200
     assert removed_auction is None
+    assert first_bid is None
+
+    # the addon is deleted after the response, by the outbox worker
+    divar_mock.addon.delete_post_addon.assert_not_called()
+    assert isinstance(auc_repo, OutboxRepo)
+    assert await outbox_worker.run_once(auc_repo, divar_mock) == 1
     divar_mock.addon.delete_post_addon.assert_called_with(
         data=expected_addon_delete_input
     )
-    assert first_bid is None
+    assert await auc_repo.count_outbox_messages() == {"pending": 0, "dead": 0}
 
 
 @pytest.mark.asyncio
@@ -240,3 +261,67 @@ async def test_bidder_remove_bid(
     assert "Bid removed" in response.text
     remove_bid = await auc_repo.read_bid_by_id(bid_id=bid.uid)
     assert remove_bid is None
+
+
+@pytest.mark.asyncio
+async def test_select_bid_retries_past_the_auction_cache(auc_repo: AuctionRepo) -> None:
+    cached_repo = CachedAuctionRepo(auc_repo)
+    auction = await start_auction_with_bids(auc_repo)
+    await cached_repo.read_auction_by_id(auction.uid)
+
+    # another process changes the auction behind the cache, every cached
+    # read has a stale version now
+    stored_auction = await auc_repo.read_auction_by_id(auction.uid)
+    assert stored_auction is not None
+    await auc_repo.select_bid(stored_auction, bid_id=auction.top_bids[1].uid)
+    await auc_repo.select_bid(stored_auction, bid_id=auction.top_bids[2].uid)
+
+    # the retry must not depend on the cache dropping the stale auction
+    with mock.patch.object(cached_repo, "_invalidate_auction"):
+        selected_auction = await service.select_bid(
+            auction_repo=cached_repo,
+            divar_client=await divar.get_divar_client_mock(),
+            seller_id=auction.seller_id,
+            bid_id=auction.top_bids[0].uid,
+            user_access_token="token",
+        )
+    assert selected_auction.selected_bid == auction.top_bids[0].uid
+    stored_auction = await auc_repo.read_auction_by_id(auction.uid)
+    assert stored_auction is not None
+    assert stored_auction.selected_bid == auction.top_bids[0].uid
+
+
+@pytest.mark.asyncio
+async def test_seller_sees_paginated_bids(
+    seller_client: TestClient, auc_repo: AuctionRepo
+) -> None:
+    auction = await start_auction_with_bids(auc_repo)
+    params = {"hl": "en", "return_url": "https://divar.ir", "page_size": "3"}
+    response = seller_client.get(f"/auction/{auction.post_token}", params=params)
+
+    assert response.status_code == 200
+    assert "14,000" in response.text
+    assert "11,000" not in response.text
+    assert "cursor=" in response.text
+    # the next page keeps the page size
+    assert "page_size=3" in response.text
+
+    cursor = BidCursor(amount=Rial(12000), uid=auction.top_bids[2].uid).encode()
+    params["cursor"] = cursor
+    response = seller_client.get(f"/auction/{auction.post_token}", params=params)
+
+    assert response.status_code == 200
+    assert "11,000" in response.text
+    assert "12,000" not in response.text
+    assert "cursor=" not in response.text
+
+
+@pytest.mark.asyncio
+async def test_seller_bids_invalid_cursor(
+    seller_client: TestClient, auc_repo: AuctionRepo
+) -> None:
+    auction = await start_auction_with_bids(auc_repo)
+    params = {"hl": "en", "return_url": "https://divar.ir", "cursor": "invalid"}
+    response = seller_client.get(f"/auction/{auction.post_token}", params=params)
+
+    assert response.status_code == 400
@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+from auction._types import PostToken
+from auction.api.api_deps import get_repo
+from auction.api.app import app
+from auction.api.outbox import CREATE_POST_ADDON, DELETE_POST_ADDON, OutboxWorker
+from auction.core.config import ConfigurationError
+from auction.model import OutboxMessage
+from auction.repo import AuctionRepo, JSONFileRepo, OutboxRepo
+
+
+class FakeAddonService:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls: list[tuple[str, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _call(self, kind: str, post_token: str):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.calls.append((kind, post_token))
+        if self.failures:
+            self.failures -= 1
+            return None
+        return object()
+
+    async def send_post_addon(self, access_token: str, post_token: str, content: str):
+        return await self._call(CREATE_POST_ADDON, post_token)
+
+    async def delete_post_addon(self, data):
+        return await self._call(DELETE_POST_ADDON, data.token)
+
+
+def create_message(post_token: str, created_at: float = 0) -> OutboxMessage:
+    return OutboxMessage(
+        kind=CREATE_POST_ADDON,
+        post_token=PostToken(post_token),
+        payload={"access_token": "token", "content": "{}"},
+        next_attempt_at=0,
+        created_at=created_at,
+    )
+
+
+@pytest.mark.asyncio
+async def test_outbox_delivers_in_order_with_bounded_concurrency(
+    auc_repo: AuctionRepo,
+) -> None:
+    assert isinstance(auc_repo, OutboxRepo)
+    for i in range(6):
+        await auc_repo.add_outbox_message(create_message(str(i)))
+    delete = OutboxMessage(
+        kind=DELETE_POST_ADDON, post_token=PostToken("0"), next_attempt_at=0
+    )
+    await auc_repo.add_outbox_message(delete)
+
+    addon = FakeAddonService()
+    worker = OutboxWorker(concurrency=2, batch_size=10)
+    divar_client = SimpleNamespace(addon=addon)
+    # the delete of post 0 waits for its create
+    assert await worker.run_once(auc_repo, divar_client) == 6  # type: ignore
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+
+    assert addon.max_in_flight == 2
+    post_calls = [call for call in addon.calls if call[1] == "0"]
+    assert post_calls == [(CREATE_POST_ADDON, "0"), (DELETE_POST_ADDON, "0")]
+    assert worker.stats["delivered"] == 7
+    assert await auc_repo.count_outbox_messages() == {"pending": 0, "dead": 0}
+
+
+@pytest.mark.asyncio
+async def test_outbox_retries_then_dead_letters(auc_repo: AuctionRepo) -> None:
+    assert isinstance(auc_repo, OutboxRepo)
+    await auc_repo.add_outbox_message(create_message("A"))
+    addon = FakeAddonService(failures=2)
+    divar_client = SimpleNamespace(addon=addon)
+
+    # a failed message waits for its retry
+    worker = OutboxWorker(max_attempts=2, retry_delay=60)
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+    assert await worker.run_once(auc_repo, divar_client) == 0  # type: ignore
+    assert await auc_repo.count_outbox_messages() == {"pending": 1, "dead": 0}
+
+    # without a retry delay it's due right away and delivered on the retry
+    await auc_repo.add_outbox_message(create_message("B"))
+    worker = OutboxWorker(max_attempts=2, retry_delay=0)
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+    assert [call[1] for call in addon.calls] == ["A", "B", "B"]
+    assert worker.stats == {"delivered": 1, "failed": 1, "dead_lettered": 0}
+    assert await auc_repo.count_outbox_messages() == {"pending": 1, "dead": 0}
+
+
+@pytest.mark.asyncio
+async def test_outbox_dead_letters(auc_repo: AuctionRepo) -> None:
+    assert isinstance(auc_repo, OutboxRepo)
+    await auc_repo.add_outbox_message(create_message("A"))
+    divar_client = SimpleNamespace(addon=FakeAddonService(failures=2))
+    worker = OutboxWorker(max_attempts=2, retry_delay=0)
+
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+    assert await worker.run_once(auc_repo, divar_client) == 0  # type: ignore
+    assert await auc_repo.count_outbox_messages() == {"pending": 0, "dead": 1}
+    assert worker.stats == {"delivered": 0, "failed": 2, "dead_lettered": 1}
+
+
+@pytest.mark.asyncio
+async def test_outbox_keeps_post_order_across_retries(auc_repo: AuctionRepo) -> None:
+    assert isinstance(auc_repo, OutboxRepo)
+    delete = OutboxMessage(
+        kind=DELETE_POST_ADDON, post_token=PostToken("A"), next_attempt_at=0
+    )
+    await auc_repo.add_outbox_message(delete)
+    addon = FakeAddonService(failures=1)
+    divar_client = SimpleNamespace(addon=addon)
+    worker = OutboxWorker(retry_delay=60)
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+
+    # a new auction on the post waits for the backed off delete
+    await auc_repo.add_outbox_message(create_message("A", created_at=time.time()))
+    await auc_repo.add_outbox_message(create_message("B", created_at=time.time()))
+    assert await worker.run_once(auc_repo, divar_client) == 1  # type: ignore
+    assert [call[1] for call in addon.calls] == ["A", "B"]
+    assert await auc_repo.count_outbox_messages() == {"pending": 2, "dead": 0}
+
+
+@pytest.mark.asyncio
+async def test_outbox_cancel(auc_repo: AuctionRepo) -> None:
+    assert isinstance(auc_repo, OutboxRepo)
+    await auc_repo.add_outbox_message(create_message("A"))
+    await auc_repo.add_outbox_message(create_message("B"))
+    await auc_repo.cancel_outbox_messages(PostToken("A"), CREATE_POST_ADDON)
+    messages = await auc_repo.claim_outbox_messages(limit=10, lease=60)
+    assert [message.post_token for message in messages] == ["B"]
+    # claimed messages are leased
+    assert await auc_repo.claim_outbox_messages(limit=10, lease=60) == []
+
+
+@pytest.mark.asyncio
+async def test_outbox_cancel_keeps_a_claimed_message(auc_repo: AuctionRepo) -> None:
+    assert isinstance(auc_repo, OutboxRepo)
+    await auc_repo.add_outbox_message(create_message("A"))
+    [create] = await auc_repo.claim_outbox_messages(limit=10, lease=60)
+
+    # the auction is removed while the create is being sent
+    await auc_repo.cancel_outbox_messages(PostToken("A"), CREATE_POST_ADDON)
+    await auc_repo.add_outbox_message(
+        OutboxMessage(kind=DELETE_POST_ADDON, post_token=PostToken("A"))
+    )
+    assert await auc_repo.claim_outbox_messages(limit=10, lease=60) == []
+    assert await auc_repo.count_outbox_messages() == {"pending": 2, "dead": 0}
+
+    # the delete goes out after the create is delivered
+    await auc_repo.complete_outbox_message(create)
+    messages = await auc_repo.claim_outbox_messages(limit=10, lease=60)
+    assert [message.kind for message in messages] == [DELETE_POST_ADDON]
+
+
+def test_app_needs_a_repo_with_an_outbox(tmp_path: Path) -> None:
+    repo = JSONFileRepo(db_file_name=str(tmp_path / "db.json"))
+    app.dependency_overrides[get_repo] = lambda: repo
+    try:
+        with pytest.raises(ConfigurationError), TestClient(app):
+            pass
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,136 @@
+import asyncio
+
+from unittest import mock
+
+import pytest
+
+from auction._types import PostToken, Rial, UserID
+from auction.api.sequencer import BidSequencer
+from auction.divar import mock_data as divar_mock_data
+from auction.model import Auction, Bid
+from auction.repo import AuctionRepo
+
+
+async def add_auction(auc_repo: AuctionRepo, post_token: str) -> Auction:
+    auction = Auction(
+        post_token=PostToken(post_token),
+        seller_id=UserID(divar_mock_data.SELLER_PHONE_NUMBER),
+        starting_price=Rial(1000),
+        post_title="Test Post",
+    )
+    return await auc_repo.add_auction(auction)
+
+
+@pytest.mark.asyncio
+async def test_sequencer_batches_bids_per_auction(auc_repo: AuctionRepo) -> None:
+    auction = await add_auction(auc_repo, "A")
+    sequencer = BidSequencer(idle_timeout=1, max_batch_size=50)
+
+    with mock.patch.object(
+        auc_repo, "unit_of_work", wraps=auc_repo.unit_of_work
+    ) as unit_of_work:
+        bids = await asyncio.gather(
+            *[
+                sequencer.upsert_bid(
+                    auction_repo=auc_repo,
+                    auction_id=auction.uid,
+                    bidder_id=UserID(str(bidder_id)),
+                    amount=Rial(2000 + bidder_id),
+                )
+                for bidder_id in range(20)
+            ]
+        )
+    await sequencer.close()
+
+    assert [bid.bidder_id for bid in bids] == [str(i) for i in range(20)]
+    assert [bid.amount for bid in bids] == [2000 + i for i in range(20)]
+    assert unit_of_work.call_count < 20
+    found_auction = await auc_repo.read_auction_by_post_token(auction.post_token)
+    assert found_auction is not None
+    assert found_auction.bids_count == 20
+    assert found_auction.highest_bid_amount == 2019
+
+
+@pytest.mark.asyncio
+async def test_sequencer_evicts_idle_workers(auc_repo: AuctionRepo) -> None:
+    first_auction = await add_auction(auc_repo, "A")
+    second_auction = await add_auction(auc_repo, "B")
+    sequencer = BidSequencer(idle_timeout=0.05)
+
+    for auction in [first_auction, second_auction]:
+        await sequencer.upsert_bid(
+            auction_repo=auc_repo,
+            auction_id=auction.uid,
+            bidder_id=UserID("1"),
+            amount=Rial(2000),
+        )
+    assert len(sequencer._workers) == 2
+
+    await asyncio.sleep(0.2)
+    assert sequencer._workers == {}
+
+
+@pytest.mark.asyncio
+async def test_sequencer_delivers_errors(auc_repo: AuctionRepo) -> None:
+    auction = await add_auction(auc_repo, "A")
+    sequencer = BidSequencer(idle_timeout=1)
+
+    with mock.patch.object(auc_repo, "upsert_bid", side_effect=RuntimeError()):
+        results = await asyncio.gather(
+            sequencer.upsert_bid(auc_repo, auction.uid, UserID("1"), Rial(2000)),
+            sequencer.upsert_bid(auc_repo, auction.uid, UserID("2"), Rial(3000)),
+            return_exceptions=True,
+        )
+    await sequencer.close()
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_sequencer_fails_only_the_failed_bid(auc_repo: AuctionRepo) -> None:
+    auction = await add_auction(auc_repo, "A")
+    sequencer = BidSequencer(idle_timeout=1)
+    upsert_bid = auc_repo.upsert_bid
+
+    async def fail_second_bidder(auction_id, bidder_id, amount):
+        if bidder_id == "2":
+            raise RuntimeError()
+        return await upsert_bid(auction_id, bidder_id, amount)
+
+    with mock.patch.object(auc_repo, "upsert_bid", side_effect=fail_second_bidder):
+        results = await asyncio.gather(
+            *[
+                sequencer.upsert_bid(
+                    auc_repo, auction.uid, UserID(str(bidder_id)), Rial(2000)
+                )
+                for bidder_id in range(1, 4)
+            ],
+            return_exceptions=True,
+        )
+    await sequencer.close()
+
+    first, second, third = results
+    assert isinstance(second, RuntimeError)
+    assert isinstance(first, Bid) and first.bidder_id == "1"
+    assert isinstance(third, Bid) and third.bidder_id == "3"
+    found_auction = await auc_repo.read_auction_by_post_token(auction.post_token)
+    assert found_auction is not None
+    assert found_auction.bids_count == 2
+
+
+@pytest.mark.asyncio
+async def test_sequencer_close_writes_queued_bids(auc_repo: AuctionRepo) -> None:
+    auction = await add_auction(auc_repo, "A")
+    sequencer = BidSequencer(idle_timeout=1)
+
+    bids = [
+        asyncio.create_task(
+            sequencer.upsert_bid(auc_repo, auction.uid, UserID(str(i)), Rial(2000))
+        )
+        for i in range(5)
+    ]
+    await asyncio.sleep(0)
+    await sequencer.close()
+
+    assert [(await bid).bidder_id for bid in bids] == [str(i) for i in range(5)]
+    assert sequencer._workers == {}
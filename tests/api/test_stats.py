@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from auction import divar
+from auction.api.stats import StatsLogger, collect
+from auction.repo import AuctionRepo, CachedAuctionRepo
+
+
+@pytest.mark.asyncio
+async def test_stats_collects_caches_and_breakers(auc_repo: AuctionRepo) -> None:
+    divar_client = await divar.get_divar_client_mock()
+    stats = collect(CachedAuctionRepo(auc_repo), divar_client)
+    assert set(stats) == {
+        "outbox",
+        "addon_refresh",
+        "divar_breakers",
+        "auction_cache",
+        "post_cache",
+    }
+    # an uncached repo has no auction cache stats
+    assert "auction_cache" not in collect(auc_repo, divar_client)
+
+
+@pytest.mark.asyncio
+async def test_stats_logger_logs_periodically(
+    auc_repo: AuctionRepo, caplog: pytest.LogCaptureFixture
+) -> None:
+    divar_client = await divar.get_divar_client_mock()
+    stats_logger = StatsLogger(interval=0.01)
+    with caplog.at_level("INFO", logger="auction"):
+        stats_logger.start(auc_repo, divar_client)
+        await asyncio.sleep(0.05)
+        await stats_logger.close()
+    assert any(record.message.startswith("stats ") for record in caplog.records)
+
+    # a zero interval turns it off
+    stats_logger = StatsLogger(interval=0)
+    stats_logger.start(auc_repo, divar_client)
+    assert stats_logger._task is None
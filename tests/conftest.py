@@ -41,6 +41,7 @@ async def sqla_session() -> AsyncGenerator[async_sessionmaker[AsyncSession], Non
 
     sessionmaker = db.get_session(engine=engine)
     yield sessionmaker
+    await engine.dispose()
 
 
 def authorize_seller_user() -> UserID:
@@ -87,9 +88,11 @@ def bidder_client(auc_repo: AuctionRepo):
 
 @pytest.fixture(autouse=True)
 def remove_db_file():
-    db_file = "test.db"
-    if os.path.exists(db_file):
-        os.remove(db_file)
+    db_files = ["test.db", "test.db-wal", "test.db-shm"]
+    for db_file in db_files:
+        if os.path.exists(db_file):
+            os.remove(db_file)
     yield
-    if os.path.exists(db_file):
-        os.remove(db_file)
+    for db_file in db_files:
+        if os.path.exists(db_file):
+            os.remove(db_file)
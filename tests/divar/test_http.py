@@ -0,0 +1,48 @@
+from unittest import mock
+
+import httpx
+import pytest
+
+from auction.core.config import ConfigurationError
+from auction.divar import divar_client_mock
+from auction.divar.client import AuctionAddonService, AuctionFinderService
+from auction.divar.http import DivarHTTPClient
+
+
+@pytest.mark.asyncio
+async def test_services_share_one_pooled_client() -> None:
+    timeouts: dict[str, float | None] = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        timeouts[request.url.path] = request.extensions["timeout"]["read"]
+        return httpx.Response(200, json={"phone_numbers": ["09120000000"]})
+
+    http = DivarHTTPClient(
+        divar_client_mock._client,
+        max_keepalive_connections=5,
+        timeout=1,
+        timeouts={"get_user": 3},
+        transport=httpx.MockTransport(handler),
+    )
+    base_client = divar_client_mock._client
+    finder = AuctionFinderService(client=base_client, http=http)
+    addon = AuctionAddonService(client=base_client, http=http)
+    assert finder._aclient is addon._aclient is http.open()
+
+    await finder.get_user(access_token="token")
+    assert timeouts == {"/v1/open-platform/users": 3}
+
+    await http.close()
+    assert http._client is None
+    # used again after a close, e.g. by a script, it reopens
+    assert not finder._aclient.is_closed
+    await http.close()
+
+
+def test_http2_needs_h2() -> None:
+    http = DivarHTTPClient(divar_client_mock._client, http2=True)
+    with (
+        mock.patch("importlib.util.find_spec", return_value=None),
+        pytest.raises(ConfigurationError),
+    ):
+        http.open()
@@ -0,0 +1,50 @@
+import asyncio
+
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from auction.core import exception
+from auction.divar import divar_client_mock
+from auction.divar.client import AuctionOAuthService
+from auction.divar.http import DivarHTTPClient
+
+
+@pytest.mark.asyncio
+async def test_get_access_token_is_async_and_coalesced() -> None:
+    codes: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        form = parse_qs(request.content.decode())
+        codes.append(form["code"][0])
+        await asyncio.sleep(0.01)
+        if form["code"][0] == "used":
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        token = {
+            "access_token": "token",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "scope": "USER_PHONE",
+        }
+        return httpx.Response(200, json=token)
+
+    http = DivarHTTPClient(
+        divar_client_mock._client, transport=httpx.MockTransport(handler)
+    )
+    oauth = AuctionOAuthService(
+        client=divar_client_mock._client,
+        app_slug="app",
+        oauth_redirect_url="http://127.0.0.1:8000",
+        oauth_secret="secret",
+        http=http,
+    )
+    tokens = await asyncio.gather(
+        *(oauth.get_access_token(authorization_token="code") for _ in range(3))
+    )
+    assert codes == ["code"]
+    assert all(token.access_token == "token" for token in tokens)
+
+    with pytest.raises(exception.InvalidSession):
+        await oauth.get_access_token(authorization_token="used")
+    await http.close()
@@ -0,0 +1,58 @@
+import pytest
+
+from auction._types import PostToken
+from auction.core import exception
+from auction.core.config import config
+from auction.divar import divar_client_mock
+from auction.divar.cache import PostCache
+from auction.divar.client import AuctionFinderService
+from auction.divar.schemas import PostItemResponse
+
+
+def test_post_cache_ttl_and_eviction(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 100.0
+    monkeypatch.setattr("auction.divar.cache.time.monotonic", lambda: now)
+    cache = PostCache(max_size=2, ttl=60, negative_ttl=5)
+    post = PostItemResponse.dummy(post_token="A")
+
+    cache.set(PostToken("A"), post)
+    cache.set(PostToken("B"), None)
+    assert cache.get(PostToken("A")) == (True, post)
+    assert cache.get(PostToken("B")) == (True, None)
+
+    now = 110.0
+    assert cache.get(PostToken("B")) == (False, None)
+    assert cache.get(PostToken("A")) == (True, post)
+
+    cache.set(PostToken("C"), None)
+    cache.set(PostToken("D"), None)
+    assert cache.get(PostToken("A")) == (False, None)
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["hit_rate"] == 0.6
+
+
+@pytest.mark.asyncio
+async def test_validate_post_is_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "debug", False)
+    finder = AuctionFinderService(client=divar_client_mock._client)
+    requested: list[str] = []
+
+    async def get_post(data, max_retry=3, retry_delay=1):
+        requested.append(data.token)
+        if data.token == "missing":
+            return None
+        return PostItemResponse.dummy(post_token=data.token)
+
+    monkeypatch.setattr(finder, "get_post", get_post)
+
+    for _ in range(3):
+        post = await finder.validate_post(PostToken("A"))
+        assert post.token == "A"
+        with pytest.raises(exception.PostNotFound):
+            await finder.validate_post(PostToken("missing"))
+    assert requested == ["A", "missing"]
+
+    finder.invalidate_post(PostToken("A"))
+    await finder.validate_post(PostToken("A"))
+    assert requested == ["A", "missing", "A"]
+    assert finder.post_cache.stats["hits"] == 4
@@ -0,0 +1,75 @@
+import httpx
+import pytest
+
+from auction.core import exception
+from auction.divar.resilience import CLOSED, HALF_OPEN, OPEN, Resilience
+
+
+def responder(*status_codes: int):
+    calls: list[int] = []
+
+    async def send_request() -> httpx.Response:
+        status_code = status_codes[min(len(calls), len(status_codes) - 1)]
+        calls.append(status_code)
+        if status_code == 0:
+            raise httpx.ConnectTimeout("timeout")
+        return httpx.Response(status_code)
+
+    return send_request, calls
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_failures() -> None:
+    resilience = Resilience(max_retry=2, retry_delay=0)
+
+    send_request, calls = responder(503, 0, 200)
+    rsp = await resilience.call("get_post", send_request)
+    assert rsp.status_code == 200
+    assert calls == [503, 0, 200]
+
+    # an answer from divar is not retried, and not a breaker failure
+    send_request, calls = responder(404)
+    rsp = await resilience.call("get_post", send_request)
+    assert rsp.status_code == 404
+    assert calls == [404]
+    assert resilience.stats["get_post"]["failures"] == 0
+
+    send_request, calls = responder(503)
+    with pytest.raises(exception.DivarUnavailable):
+        await resilience.call("create_post_addon", send_request, idempotent=False)
+    assert calls == [503]
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 100.0
+    monkeypatch.setattr("auction.divar.resilience.time.monotonic", lambda: now)
+    resilience = Resilience(
+        max_retry=1, retry_delay=0, failure_threshold=3, reset_timeout=30
+    )
+    breaker = resilience.breaker("get_user")
+
+    send_request, calls = responder(500)
+    for _ in range(2):
+        with pytest.raises(exception.DivarUnavailable):
+            await resilience.call("get_user", send_request)
+    # the third failure opened the breaker, the fourth attempt failed fast
+    assert len(calls) == 3
+    assert breaker.state == OPEN
+    assert breaker.stats["rejected"] == 1
+
+    # other endpoints have their own breaker
+    ok, _ = responder(200)
+    assert (await resilience.call("get_post", ok)).status_code == 200
+
+    now += 30
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(exception.DivarUnavailable):
+        await resilience.call("get_user", send_request)
+    assert len(calls) == 4
+    assert breaker.state == OPEN
+
+    now += 30
+    assert (await resilience.call("get_user", ok)).status_code == 200
+    assert breaker.state == CLOSED
+    assert breaker.stats["opened"] == 1
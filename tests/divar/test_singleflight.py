@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+import pytest
+
+from kenar import GetPostRequest
+
+from auction.divar import divar_client_mock
+from auction.divar.client import AuctionFinderService
+from auction.divar.http import DivarHTTPClient
+from auction.divar.schemas import PostItemResponse
+from auction.divar.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_result_and_error() -> None:
+    flights = SingleFlight()
+    calls = 0
+
+    async def operation() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flights.do("key", operation) for _ in range(10)))
+    assert results == [1] * 10
+    assert len(flights) == 0
+
+    async def failing() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("divar is down")
+
+    errors = await asyncio.gather(
+        *(flights.do("key", failing) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(error, ValueError) for error in errors)
+
+    # a cancelled waiter leaves the call running for the others
+    first = asyncio.ensure_future(flights.do("key", operation))
+    second = asyncio.ensure_future(flights.do("key", operation))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 2
+
+
+@pytest.mark.asyncio
+async def test_get_post_coalesces_requests() -> None:
+    requests: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        post = PostItemResponse.dummy(post_token="A")
+        return httpx.Response(200, content=post.model_dump_json())
+
+    http = DivarHTTPClient(
+        divar_client_mock._client, transport=httpx.MockTransport(handler)
+    )
+    finder = AuctionFinderService(client=divar_client_mock._client, http=http)
+    posts = await asyncio.gather(
+        *(finder.get_post(GetPostRequest(token="A")) for _ in range(20))
+    )
+    assert len(requests) == 1
+    assert all(post is not None and post.token == "A" for post in posts)
+    await http.close()
@@ -0,0 +1,168 @@
+import asyncio
+
+from unittest import mock
+
+import pytest
+
+from auction._types import PostToken, Rial, UserID
+from auction.divar import mock_data as divar_mock_data
+from auction.model import Auction
+from auction.repo import AuctionLoad, AuctionRepo, CachedAuctionRepo
+
+
+async def add_auction(repo: AuctionRepo, post_token: str) -> Auction:
+    auction = Auction(
+        post_token=PostToken(post_token),
+        post_title="title",
+        seller_id=UserID(divar_mock_data.SELLER_PHONE_NUMBER),
+        starting_price=Rial(1000),
+    )
+    return await repo.add_auction(auction)
+
+
+@pytest.mark.asyncio
+async def test_cached_read_hits(auc_repo: AuctionRepo) -> None:
+    repo = CachedAuctionRepo(auc_repo)
+    auction = await add_auction(repo, "A")
+
+    with mock.patch.object(
+        auc_repo,
+        "read_auction_by_post_token",
+        wraps=auc_repo.read_auction_by_post_token,
+    ) as read:
+        first = await repo.read_auction_by_post_token(auction.post_token)
+        second = await repo.read_auction_by_post_token(auction.post_token)
+        missing = await repo.read_auction_by_post_token(PostToken("B"))
+        missing_again = await repo.read_auction_by_post_token(PostToken("B"))
+
+    assert read.call_count == 2
+    assert first is not None and second is not None
+    assert first is not second
+    assert first.uid == second.uid == auction.uid
+    assert missing is None and missing_again is None
+    assert repo.stats["hits"] == 2
+    assert repo.stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidated_on_write(auc_repo: AuctionRepo) -> None:
+    repo = CachedAuctionRepo(auc_repo)
+    auction = await add_auction(repo, "A")
+    await repo.read_auction_by_post_token(auction.post_token, AuctionLoad.BARE)
+    await repo.read_auction_by_post_token(auction.post_token)
+
+    bid = await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    found_auction = await repo.read_auction_by_post_token(
+        auction.post_token, AuctionLoad.BARE
+    )
+    assert found_auction is not None
+    assert found_auction.bids_count == 1
+    assert found_auction.highest_bid_amount == 2000
+
+    selected_auction = await repo.select_bid(found_auction, bid.uid)
+    found_auction = await repo.read_auction_by_post_token(auction.post_token)
+    assert found_auction is not None
+    assert found_auction.selected_bid == bid.uid
+    assert [b.uid for b in found_auction.bids] == [bid.uid]
+
+    await repo.remove_selected_bid(bid.uid)
+    found_auction = await repo.read_auction_by_post_token(auction.post_token)
+    assert found_auction is not None
+    assert found_auction.selected_bid is None
+
+    await repo.remove_auction(selected_auction.uid)
+    assert await repo.read_auction_by_post_token(auction.post_token) is None
+
+
+@pytest.mark.asyncio
+async def test_cache_skips_reads_racing_a_write(auc_repo: AuctionRepo) -> None:
+    repo = CachedAuctionRepo(auc_repo)
+    auction = await add_auction(repo, "A")
+    read_auction_by_id = auc_repo.read_auction_by_id
+    write_done = asyncio.Event()
+
+    async def slow_read(auction_id):
+        found_auction = await read_auction_by_id(auction_id)
+        await write_done.wait()
+        return found_auction
+
+    with mock.patch.object(auc_repo, "read_auction_by_id", side_effect=slow_read):
+        read = asyncio.create_task(repo.read_auction_by_id(auction.uid))
+        await asyncio.sleep(0.01)
+        await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+        write_done.set()
+        stale_auction = await read
+    assert stale_auction is not None
+    assert stale_auction.bids_count == 0
+
+    # the stale read wasn't cached
+    assert repo.stats["size"] == 0
+    found_auction = await repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidations_are_pruned_under_steady_reads(
+    auc_repo: AuctionRepo,
+) -> None:
+    repo = CachedAuctionRepo(auc_repo)
+    auction = await add_auction(repo, "A")
+    read_auction_by_id = auc_repo.read_auction_by_id
+    releases: list[asyncio.Event] = []
+
+    async def slow_read(auction_id):
+        release = asyncio.Event()
+        releases.append(release)
+        found_auction = await read_auction_by_id(auction_id)
+        await release.wait()
+        return found_auction
+
+    with mock.patch.object(auc_repo, "read_auction_by_id", side_effect=slow_read):
+        reads = [asyncio.create_task(repo.read_auction_by_id(auction.uid))]
+        for i in range(50):
+            # a new read starts before the previous one ends, some read is
+            # always in flight
+            reads.append(asyncio.create_task(repo.read_auction_by_id(auction.uid)))
+            await asyncio.sleep(0.01)
+            await repo.upsert_bid(auction.uid, UserID(str(i)), Rial(2000 + i))
+            releases[i].set()
+            await reads[i]
+            assert len(repo._invalidated_at) <= 4
+        releases[-1].set()
+        await reads[-1]
+    assert len(repo._invalidated_at) == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_unit_of_work(auc_repo: AuctionRepo) -> None:
+    repo = CachedAuctionRepo(auc_repo)
+    auction = await add_auction(repo, "A")
+    await repo.read_auction_by_id(auction.uid)
+
+    async with repo.unit_of_work():
+        await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+        found_auction = await repo.read_auction_by_id(auction.uid)
+        assert found_auction is not None
+        assert found_auction.bids_count == 1
+    assert repo.stats["size"] == 0
+
+    found_auction = await repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_eviction_and_ttl(auc_repo: AuctionRepo) -> None:
+    repo = CachedAuctionRepo(auc_repo, max_size=2)
+    auctions = [await add_auction(repo, token) for token in "ABC"]
+    for auction in auctions:
+        await repo.read_auction_by_id(auction.uid)
+    assert repo.stats["size"] == 2
+    assert repo.stats["evictions"] == 1
+
+    repo = CachedAuctionRepo(auc_repo, ttl=0)
+    await repo.read_auction_by_id(auctions[0].uid)
+    await repo.read_auction_by_id(auctions[0].uid)
+    assert repo.stats["hits"] == 0
+    assert repo.stats["misses"] == 2
@@ -0,0 +1,164 @@
+import asyncio
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from auction._types import PostToken, Rial, UserID
+from auction.divar import mock_data as divar_mock_data
+from auction.model import Auction
+from auction.repo import JSONFileRepo
+from auction.repo.snapshot import Snapshot
+
+
+def add_auction_data(post_token: str) -> Auction:
+    return Auction(
+        post_token=PostToken(post_token),
+        post_title="title",
+        seller_id=UserID(divar_mock_data.SELLER_PHONE_NUMBER),
+        starting_price=Rial(1000),
+    )
+
+
+@pytest.mark.asyncio
+async def test_journal_replay(tmp_path: Path) -> None:
+    db_file_name = str(tmp_path / "db.json")
+    repo = JSONFileRepo(db_file_name=db_file_name)
+    auction = await repo.add_auction(add_auction_data("A"))
+    first_bid = await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    second_bid = await repo.upsert_bid(auction.uid, UserID("2"), Rial(3000))
+    await repo.select_bid(auction, second_bid.uid)
+    await repo.remove_bid(first_bid.uid)
+
+    assert not Path(db_file_name).exists()
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    found_auction = await reloaded_repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.selected_bid == second_bid.uid
+    assert found_auction.bids_count == 1
+    assert [bid.uid for bid in found_auction.bids] == [second_bid.uid]
+
+
+@pytest.mark.asyncio
+async def test_journal_compaction(tmp_path: Path) -> None:
+    db_file_name = str(tmp_path / "db.json")
+    repo = JSONFileRepo(db_file_name=db_file_name, compact_threshold=4096)
+    auction = await repo.add_auction(add_auction_data("A"))
+    for bidder_id in range(50):
+        await repo.upsert_bid(auction.uid, UserID(str(bidder_id)), Rial(2000))
+    repo.compact()
+
+    assert Path(db_file_name).exists()
+    assert not Path(f"{db_file_name}.journal.1").exists()
+    assert not Path(f"{db_file_name}.journal").exists()
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    found_auction = await reloaded_repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 50
+
+
+@pytest.mark.asyncio
+async def test_compaction_writes_a_copy(tmp_path: Path) -> None:
+    repo = JSONFileRepo(db_file_name=str(tmp_path / "db.json"))
+    auction = await repo.add_auction(add_auction_data("A"))
+    await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    snapshots: list[Snapshot] = []
+    with mock.patch.object(repo, "_write_snapshot", side_effect=snapshots.append):
+        repo.compact()
+
+    # changes after compaction started don't leak into the snapshot
+    await repo.upsert_bid(auction.uid, UserID("1"), Rial(3000))
+    assert [bid.amount for bid in snapshots[0].bids] == [2000]
+
+
+@pytest.mark.asyncio
+async def test_journal_torn_record(tmp_path: Path) -> None:
+    db_file_name = str(tmp_path / "db.json")
+    repo = JSONFileRepo(db_file_name=db_file_name)
+    auction = await repo.add_auction(add_auction_data("A"))
+    journal_path = Path(f"{db_file_name}.journal")
+    with open(journal_path, "ab") as journal:
+        journal.write(b'{"type": "bid", "uid"')
+
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    await reloaded_repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    found_auction = await reloaded_repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 1
+
+
+@pytest.mark.asyncio
+async def test_indexes(tmp_path: Path) -> None:
+    repo = JSONFileRepo(db_file_name=str(tmp_path / "db.json"))
+    auction = await repo.add_auction(add_auction_data("A"))
+    other_auction = await repo.add_auction(add_auction_data("B"))
+    for bidder_id in range(10):
+        await repo.upsert_bid(auction.uid, UserID(str(bidder_id)), Rial(2000))
+    other_bid = await repo.upsert_bid(other_auction.uid, UserID("1"), Rial(2000))
+
+    assert await repo.read_auction_by_post_token(PostToken("B")) is other_auction
+    bid = await repo.find_bid(auction.uid, UserID("3"))
+    assert bid is not None
+    assert await repo.read_bid_by_id(bid.uid) is bid
+    assert await repo.find_bids_for_bidder(
+        UserID("1"), [auction.uid, other_auction.uid]
+    ) == {
+        auction.uid: await repo.find_bid(auction.uid, UserID("1")),
+        other_auction.uid: other_bid,
+    }
+
+    await repo.remove_bids_by_auction_id(auction.uid)
+    assert await repo.find_bid(auction.uid, UserID("3")) is None
+    assert await repo.read_bid_by_id(bid.uid) is None
+    assert list(repo.bids) == [other_bid.uid]
+    assert auction.bids_count == 0
+
+
+@pytest.mark.asyncio
+async def test_write_behind(tmp_path: Path) -> None:
+    db_file_name = str(tmp_path / "db.json")
+    journal_path = Path(f"{db_file_name}.journal")
+    repo = JSONFileRepo(
+        db_file_name=db_file_name,
+        write_behind=True,
+        flush_interval=60,
+        flush_max_pending=5,
+    )
+    auction = await repo.add_auction(add_auction_data("A"))
+    await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    assert not journal_path.exists()
+
+    await repo.flush()
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    found_auction = await reloaded_repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 1
+
+    # enough changes wake the flusher before the interval passes
+    for bidder_id in range(2, 8):
+        await repo.upsert_bid(auction.uid, UserID(str(bidder_id)), Rial(2000))
+    for _ in range(100):
+        if not repo._pending:
+            break
+        await asyncio.sleep(0.01)
+    assert not repo._pending
+    await repo.close()
+
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    found_auction = await reloaded_repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 7
+
+
+@pytest.mark.asyncio
+async def test_remove_selected_bid_of_removed_auction(tmp_path: Path) -> None:
+    repo = JSONFileRepo(db_file_name=str(tmp_path / "db.json"))
+    auction = await repo.add_auction(add_auction_data("A"))
+    bid = await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    await repo.select_bid(auction, bid.uid)
+    await repo.remove_auction(auction.uid)
+
+    await repo.remove_selected_bid(bid.uid)
+    assert await repo.read_auction_by_id(auction.uid) is None
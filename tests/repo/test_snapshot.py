@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import pytest
+
+from auction._types import PostToken, Rial, UserID
+from auction.model import AccessToken, Auction, Bid
+from auction.repo import JSONFileRepo
+from auction.repo.snapshot import MAGIC, Snapshot, convert, dump_snapshot, load_snapshot
+
+
+def make_snapshot() -> Snapshot:
+    auction = Auction(
+        post_token=PostToken("A"),
+        seller_id=UserID("09120000000"),
+        starting_price=Rial(1000),
+        post_title="عنوان",
+    )
+    untitled_auction = Auction(
+        post_token=PostToken("B"),
+        seller_id=UserID("09120000000"),
+        starting_price=Rial(0),
+        lang_code="en",
+    )
+    bids = [
+        Bid(bidder_id=UserID(str(i)), auction_id=auction.uid, amount=Rial(2000 + i))
+        for i in range(3)
+    ]
+    auction.selected_bid = bids[0].uid
+    auction.bids_count = 3
+    auction.highest_bid_amount = bids[2].amount
+    auction.highest_bid_id = bids[2].uid
+    token = AccessToken.from_data(
+        UserID("09120000000"),
+        {"access_token": "token", "scope": "USER_PHONE", "expires_in": 3600},
+    )
+    return Snapshot(
+        auctions=[auction, untitled_auction], bids=bids, access_tokens=[token]
+    )
+
+
+def test_binary_snapshot_round_trip(tmp_path: Path) -> None:
+    snapshot = make_snapshot()
+    path = tmp_path / "db.snapshot"
+    path.write_bytes(dump_snapshot(snapshot, "binary"))
+    assert path.read_bytes().startswith(MAGIC)
+
+    loaded = load_snapshot(path)
+    assert loaded.auctions == snapshot.auctions
+    assert loaded.bids == snapshot.bids
+    assert loaded.access_tokens == snapshot.access_tokens
+    assert loaded.auctions[1].post_title is None
+    assert loaded.auctions[1].highest_bid_amount is None
+
+    # loaded models stay usable as mapped instances
+    loaded.bids[0].amount = Rial(5000)
+    assert loaded.bids[0].amount == 5000
+
+
+def test_snapshot_convert(tmp_path: Path) -> None:
+    snapshot = make_snapshot()
+    json_path = tmp_path / "db.json"
+    json_path.write_bytes(dump_snapshot(snapshot, "json"))
+
+    binary_path = tmp_path / "db.snapshot"
+    convert(json_path, binary_path, "binary")
+    back_path = tmp_path / "back.json"
+    convert(binary_path, back_path, "json")
+    assert back_path.read_bytes() == json_path.read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_repo_binary_snapshot(tmp_path: Path) -> None:
+    db_file_name = str(tmp_path / "db.json")
+    repo = JSONFileRepo(db_file_name=db_file_name, snapshot_format="binary")
+    auction = await repo.add_auction(make_snapshot().auctions[0])
+    await repo.upsert_bid(auction.uid, UserID("1"), Rial(2000))
+    repo.compact()
+    assert Path(db_file_name).read_bytes().startswith(MAGIC)
+
+    reloaded_repo = JSONFileRepo(db_file_name=db_file_name)
+    found_auction = await reloaded_repo.read_auction_by_id(auction.uid)
+    assert found_auction is not None
+    assert found_auction.bids_count == 1
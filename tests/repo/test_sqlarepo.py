@@ -1,11 +1,13 @@
 import pytest
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from auction._types import PostToken, Rial, UserID
+from auction.core import exception
 from auction.divar import mock_data as divar_mock_data
-from auction.model import Auction, Bid
-from auction.repo import SQLARepo
+from auction.model import Auction, Bid, BidCursor
+from auction.repo import AuctionLoad, SQLARepo
 
 
 @pytest.mark.asyncio
@@ -210,3 +212,402 @@ async def test_change_bid_amount(
     updated_bid = await repo.read_bid_by_id(bid_id=bid.uid)
     assert updated_bid is not None
     assert updated_bid.amount == new_bid_amount
+
+
+@pytest.mark.asyncio
+async def test_read_auction_by_post_token_load(
+    sqla_session: async_sessionmaker[AsyncSession],
+) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    post_token = PostToken("A")
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=post_token,
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    await repo.add_auction(auction)
+    empty_auction = await repo.read_auction_by_post_token(post_token=post_token)
+    assert empty_auction is not None
+    assert empty_auction.bids == []
+    assert empty_auction.bids_count == 0
+
+    for bidder_id in ["1", "2", "3"]:
+        bid = Bid(
+            bidder_id=UserID(bidder_id), auction_id=auction.uid, amount=Rial(2000)
+        )
+        await repo.add_bid(bid)
+
+    full_auction = await repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.FULL
+    )
+    assert full_auction is not None
+    assert full_auction.bids_count == 3
+    assert {bid.bidder_id for bid in full_auction.bids} == {"1", "2", "3"}
+
+    bare_auction = await repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.BARE
+    )
+    assert bare_auction is not None
+    assert bare_auction.uid == auction.uid
+
+    counted_auction = await repo.read_auction_by_post_token(
+        post_token=post_token, load=AuctionLoad.COUNT
+    )
+    assert counted_auction is not None
+    assert counted_auction.bids_count == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "query, index_name",
+    [
+        (
+            "SELECT * FROM auctions WHERE post_token = 'A'",
+            "auction_post_token_idx",
+        ),
+        (
+            "SELECT * FROM bids WHERE auction_id = 'A' AND bidder_id = 'B'",
+            "bid_auction_bidder_idx",
+        ),
+        (
+            "SELECT count(uid) FROM bids WHERE auction_id = 'A'",
+            "bid_auction_",
+        ),
+        (
+            "SELECT * FROM bids WHERE auction_id = 'A' ORDER BY amount DESC LIMIT 3",
+            "bid_auction_amount_idx",
+        ),
+        (
+            "SELECT * FROM bids WHERE auction_id = 'A'"
+            " AND (amount < 5 OR (amount = 5 AND uid < 'B'))"
+            " ORDER BY amount DESC, uid DESC LIMIT 50",
+            "bid_auction_amount_idx",
+        ),
+    ],
+)
+async def test_hot_queries_use_indexes(
+    sqla_session: async_sessionmaker[AsyncSession], query: str, index_name: str
+) -> None:
+    async with sqla_session() as sess:
+        res = await sess.execute(text(f"EXPLAIN QUERY PLAN {query}"))
+        plan = " ".join(str(row[-1]) for row in res.all())
+    assert "USING" in plan and index_name in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_read_top_bids(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    post_token = PostToken("A")
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=post_token,
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    await repo.add_auction(auction)
+    for bidder_id, amount in [("1", 3000), ("2", 5000), ("3", 2000), ("4", 4000)]:
+        bid = Bid(
+            bidder_id=UserID(bidder_id), auction_id=auction.uid, amount=Rial(amount)
+        )
+        await repo.add_bid(bid)
+
+    top_bids = await repo.read_top_bids(auction_id=auction.uid, n=3)
+    assert [bid.amount for bid in top_bids] == [5000, 4000, 3000]
+
+
+@pytest.mark.asyncio
+async def test_upsert_bid(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    post_token = PostToken("A")
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=post_token,
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    await repo.add_auction(auction)
+
+    bidder_id = UserID(divar_mock_data.BIDDER_PHONE_NUMBER)
+    bid = await repo.upsert_bid(
+        auction_id=auction.uid, bidder_id=bidder_id, amount=Rial(14000)
+    )
+    await repo.select_bid(auction=auction, bid_id=bid.uid)
+    changed_bid = await repo.upsert_bid(
+        auction_id=auction.uid, bidder_id=bidder_id, amount=Rial(15000)
+    )
+
+    assert changed_bid.uid == bid.uid
+    updated_bid = await repo.read_bid_by_id(bid_id=bid.uid)
+    assert updated_bid is not None
+    assert updated_bid.amount == Rial(15000)
+    updated_auction = await repo.read_auction_by_post_token(post_token=post_token)
+    assert updated_auction is not None
+    assert updated_auction.bids_count == 1
+    assert updated_auction.selected_bid is None
+
+
+@pytest.mark.asyncio
+async def test_unit_of_work(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    bidder_id = UserID(divar_mock_data.BIDDER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=PostToken("A"),
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    async with repo.unit_of_work():
+        await repo.add_auction(auction)
+        await repo.add_bid(
+            Bid(bidder_id=bidder_id, auction_id=auction.uid, amount=Rial(14000))
+        )
+    committed_auction = await repo.read_auction_by_post_token(PostToken("A"))
+    assert committed_auction is not None
+    assert committed_auction.bids_count == 1
+
+    failed_auction = Auction(
+        post_token=PostToken("B"),
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    with pytest.raises(RuntimeError):
+        async with repo.unit_of_work():
+            await repo.add_auction(failed_auction)
+            await repo.remove_bids_by_auction_id(auction_id=auction.uid)
+            raise RuntimeError()
+    assert await repo.read_auction_by_post_token(PostToken("B")) is None
+    assert await repo.find_bid(auction_id=auction.uid, bidder_id=bidder_id)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pragmas(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    async with sqla_session() as sess:
+        journal_mode = await sess.scalar(text("PRAGMA journal_mode"))
+        synchronous = await sess.scalar(text("PRAGMA synchronous"))
+        busy_timeout = await sess.scalar(text("PRAGMA busy_timeout"))
+    assert journal_mode == "wal"
+    assert synchronous == 1  # NORMAL
+    assert busy_timeout == 5000
+
+
+@pytest.mark.asyncio
+async def test_batch_reads(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    bidder_id = UserID(divar_mock_data.BIDDER_PHONE_NUMBER)
+    auctions = [
+        Auction(
+            post_token=PostToken(post_token),
+            post_title="title",
+            seller_id=seller_id,
+            starting_price=Rial(1000),
+        )
+        for post_token in ["A", "B", "C"]
+    ]
+    for auction in auctions:
+        await repo.add_auction(auction)
+    bids = [
+        Bid(bidder_id=bidder_id, auction_id=auctions[0].uid, amount=Rial(2000)),
+        Bid(bidder_id=bidder_id, auction_id=auctions[1].uid, amount=Rial(3000)),
+        Bid(bidder_id=UserID("2"), auction_id=auctions[1].uid, amount=Rial(4000)),
+    ]
+    for bid in bids:
+        await repo.add_bid(bid)
+
+    found_auctions = await repo.read_auctions_by_post_tokens(
+        [PostToken("A"), PostToken("C"), PostToken("D")]
+    )
+    assert set(found_auctions) == {"A", "C"}
+    assert found_auctions[PostToken("C")].uid == auctions[2].uid
+
+    found_bids = await repo.read_bids_by_ids([bids[0].uid, bids[2].uid])
+    assert set(found_bids) == {bids[0].uid, bids[2].uid}
+
+    bidder_bids = await repo.find_bids_for_bidder(
+        bidder_id=bidder_id, auction_ids=[auction.uid for auction in auctions]
+    )
+    assert set(bidder_bids) == {auctions[0].uid, auctions[1].uid}
+    assert bidder_bids[auctions[1].uid].amount == Rial(3000)
+    assert await repo.read_bids_by_ids([]) == {}
+
+
+@pytest.mark.asyncio
+async def test_read_bids_page(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    post_token = PostToken("A")
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=post_token,
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    await repo.add_auction(auction)
+    amounts = [2000, 5000, 5000, 3000, 5000, 1000, 4000]
+    for bidder_id, amount in enumerate(amounts):
+        bid = Bid(
+            bidder_id=UserID(str(bidder_id)),
+            auction_id=auction.uid,
+            amount=Rial(amount),
+        )
+        await repo.add_bid(bid)
+
+    pages = []
+    after = None
+    while True:
+        page = await repo.read_bids_page(auction_id=auction.uid, limit=3, after=after)
+        if not page:
+            break
+        pages.append(page)
+        after = BidCursor.from_bid(page[-1])
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    bids = [bid for page in pages for bid in page]
+    assert [bid.amount for bid in bids] == sorted(amounts, reverse=True)
+    assert len({bid.uid for bid in bids}) == len(amounts)
+
+
+@pytest.mark.asyncio
+async def test_auction_stats(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    post_token = PostToken("A")
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=post_token,
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    await repo.add_auction(auction)
+
+    async def read_stats() -> tuple:
+        found = await repo.read_auction_by_post_token(
+            post_token=post_token, load=AuctionLoad.BARE
+        )
+        assert found is not None
+        return found.bids_count, found.highest_bid_amount, found.highest_bid_id
+
+    first_bid = Bid(bidder_id=UserID("1"), auction_id=auction.uid, amount=Rial(3000))
+    await repo.add_bid(first_bid)
+    assert await read_stats() == (1, 3000, first_bid.uid)
+
+    second_bid = await repo.upsert_bid(
+        auction_id=auction.uid, bidder_id=UserID("2"), amount=Rial(4000)
+    )
+    assert await read_stats() == (2, 4000, second_bid.uid)
+
+    await repo.upsert_bid(
+        auction_id=auction.uid, bidder_id=UserID("2"), amount=Rial(2000)
+    )
+    assert await read_stats() == (2, 3000, first_bid.uid)
+
+    await repo.change_bid_amount(bid=first_bid, amount=Rial(1000))
+    assert await read_stats() == (2, 2000, second_bid.uid)
+
+    await repo.remove_bid(bid_id=second_bid.uid)
+    assert await read_stats() == (1, 1000, first_bid.uid)
+
+    async with sqla_session() as sess:
+        await sess.execute(text("UPDATE auctions SET bids_count = 10"))
+        await sess.commit()
+    await repo.repair_auction_stats()
+    assert await read_stats() == (1, 1000, first_bid.uid)
+
+    await repo.remove_bids_by_auction_id(auction_id=auction.uid)
+    assert await read_stats() == (0, None, None)
+
+
+@pytest.mark.asyncio
+async def test_stale_update_conflict(
+    sqla_session: async_sessionmaker[AsyncSession],
+) -> None:
+    repo = SQLARepo(session=sqla_session)
+
+    post_token = PostToken("A")
+    seller_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+    auction = Auction(
+        post_token=post_token,
+        post_title="title",
+        seller_id=seller_id,
+        starting_price=Rial(1000),
+    )
+    await repo.add_auction(auction)
+    bid = Bid(bidder_id=UserID("1"), auction_id=auction.uid, amount=Rial(3000))
+    await repo.add_bid(bid)
+
+    first_read = await repo.read_auction_by_id(auction_id=auction.uid)
+    second_read = await repo.read_auction_by_id(auction_id=auction.uid)
+    assert first_read is not None and second_read is not None
+
+    await repo.select_bid(first_read, bid_id=bid.uid)
+    with pytest.raises(exception.ConcurrentUpdate):
+        await repo.select_bid(second_read, bid_id=bid.uid)
+
+    stale_bid = await repo.read_bid_by_id(bid_id=bid.uid)
+    assert stale_bid is not None
+    await repo.upsert_bid(
+        auction_id=auction.uid, bidder_id=UserID("1"), amount=Rial(4000)
+    )
+    with pytest.raises(exception.ConcurrentUpdate):
+        await repo.change_bid_amount(bid=stale_bid, amount=Rial(5000))
+
+
+@pytest.mark.asyncio
+async def test_access_tokens(sqla_session: async_sessionmaker[AsyncSession]) -> None:
+    repo = SQLARepo(session=sqla_session)
+    user_id = UserID(divar_mock_data.SELLER_PHONE_NUMBER)
+
+    def token_data(access_token: str, scope: str, expires_in: int) -> dict:
+        return {
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": expires_in,
+            "scope": scope,
+        }
+
+    await repo.add_user_access_token(
+        user_id, token_data("first", "USER_PHONE USER_POSTS_GET", 3600)
+    )
+    await repo.add_user_access_token(
+        user_id, token_data("second", "USER_POSTS_GET POST_ADDON_CREATE.AB", 3600)
+    )
+    await repo.add_user_access_token(
+        user_id, token_data("expired", "USER_POSTS_GET POST_ADDON_CREATE.A", 0)
+    )
+
+    # a new repo, like a restarted or another worker, reads tokens from the db
+    restarted_repo = SQLARepo(session=sqla_session)
+    for token_repo in [repo, restarted_repo]:
+        token = await token_repo.get_user_access_token_by_scopes(
+            user_id, ["USER_POSTS_GET", "POST_ADDON_CREATE.AB"]
+        )
+        assert token is not None
+        assert token["access_token"] == "second"
+        token = await token_repo.get_user_access_token_by_scope(user_id, "USER_PHONE")
+        assert token is not None
+        assert token["access_token"] == "first"
+        assert (
+            await token_repo.get_user_access_token_by_scope(
+                user_id, "POST_ADDON_CREATE.A"
+            )
+            is None
+        )
+        assert (
+            await token_repo.get_user_access_token_by_scope(UserID("1"), "USER_PHONE")
+            is None
+        )
+    assert len(restarted_repo.access_tokens) == 2
@@ -0,0 +1,137 @@
+import json
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from auction._types import PostToken, Rial, UserID
+from auction.model import Auction
+from auction.repo import JSONFileRepo, SQLARepo
+from auction.repo.snapshot import dump_snapshot
+from auction.repo.transfer import _sql_engine, transfer
+from tests.repo.test_snapshot import make_snapshot
+
+
+@pytest.mark.asyncio
+async def test_transfer_round_trip(
+    tmp_path: Path, sqla_session: async_sessionmaker[AsyncSession]
+) -> None:
+    snapshot = make_snapshot()
+    source = tmp_path / "db.json"
+    source.write_bytes(dump_snapshot(snapshot, "binary"))
+    database = "sql:sqlite+aiosqlite:///./test.db"
+
+    await transfer(f"json:{source}", database, 2, tmp_path / "to_sql.checkpoint")
+    repo = SQLARepo(session=sqla_session)
+    auction = await repo.read_auction_by_id(snapshot.auctions[0].uid)
+    assert auction is not None
+    assert auction.bids_count == 3
+    assert auction.selected_bid == snapshot.bids[0].uid
+
+    ndjson = tmp_path / "db.ndjson"
+    await transfer(database, f"ndjson:{ndjson}", 2, None)
+    target = tmp_path / "back.json"
+    await transfer(f"ndjson:{ndjson}", f"json:{target}", 2, None)
+
+    loaded = JSONFileRepo(db_file_name=str(target))
+    assert sorted(loaded.auctions) == sorted(a.uid for a in snapshot.auctions)
+    assert sorted(loaded.bids) == sorted(b.uid for b in snapshot.bids)
+    assert len(loaded.access_tokens) == 1
+
+
+@pytest.mark.asyncio
+async def test_transfer_resumes_from_checkpoint(tmp_path: Path) -> None:
+    snapshot = make_snapshot()
+    source = tmp_path / "db.json"
+    source.write_bytes(dump_snapshot(snapshot, "binary"))
+    target = tmp_path / "db.ndjson"
+    checkpoint = tmp_path / "checkpoint"
+
+    # as if a previous run crashed after the first bid batch
+    checkpoint.write_text(
+        json.dumps(
+            {
+                "counts": {"auction": 2, "bid": 2},
+                "last_uids": {"auction": "", "bid": str(snapshot.bids[1].uid)},
+            }
+        )
+    )
+    await transfer(f"json:{source}", f"ndjson:{target}", 2, checkpoint)
+
+    records = [json.loads(line) for line in target.read_text().splitlines()]
+    assert [record["type"] for record in records] == ["bid", "access_token"]
+    assert json.loads(checkpoint.read_text())["counts"] == {
+        "auction": 2,
+        "bid": 3,
+        "access_token": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_transfer_reads_json_source_read_only(tmp_path: Path) -> None:
+    source = tmp_path / "db.json"
+    repo = JSONFileRepo(db_file_name=str(source))
+    auction = await repo.add_auction(
+        Auction(
+            post_token=PostToken("A"), seller_id=UserID("1"), starting_price=Rial(1)
+        )
+    )
+    repo.compact()
+    bid = await repo.upsert_bid(auction.uid, UserID("2"), Rial(2000))
+    await repo.remove_auction(auction.uid)
+    journal = tmp_path / "db.json.journal"
+    with open(journal, "ab") as journal_file:
+        journal_file.write(b'{"type": "bid", "uid"')
+    files = {path: path.read_bytes() for path in tmp_path.iterdir()}
+
+    target = tmp_path / "db.ndjson"
+    await transfer(f"json:{source}", f"ndjson:{target}", 2, None)
+
+    records = [json.loads(line) for line in target.read_text().splitlines()]
+    assert [(record["type"], record["uid"]) for record in records] == [
+        ("bid", str(bid.uid))
+    ]
+    # the source is untouched, torn journal record included
+    assert {path: path.read_bytes() for path in files} == files
+
+
+@pytest.mark.asyncio
+async def test_transfer_to_json_takes_no_checkpoint(tmp_path: Path) -> None:
+    source = tmp_path / "db.json"
+    source.write_bytes(dump_snapshot(make_snapshot(), "binary"))
+    target = tmp_path / "back.json"
+    checkpoint = tmp_path / "checkpoint"
+
+    # a resumed run would skip the rows of a run that never wrote them
+    with pytest.raises(ValueError):
+        await transfer(f"json:{source}", f"json:{target}", 2, checkpoint)
+    assert not checkpoint.exists()
+    assert not target.exists()
+
+
+@pytest.mark.asyncio
+async def test_transfer_disposes_its_source_engine(
+    tmp_path: Path, sqla_session: async_sessionmaker[AsyncSession]
+) -> None:
+    repo = SQLARepo(session=sqla_session)
+    await repo.add_auction(
+        Auction(
+            post_token=PostToken("A"), seller_id=UserID("1"), starting_price=Rial(1)
+        )
+    )
+    dispose = AsyncEngine.dispose
+    with (
+        mock.patch("auction.repo.transfer._sql_engine", wraps=_sql_engine) as engine,
+        mock.patch.object(
+            AsyncEngine, "dispose", autospec=True, side_effect=dispose
+        ) as disposed,
+    ):
+        await transfer(
+            "sql:sqlite+aiosqlite:///./test.db", f"ndjson:{tmp_path / 'out'}", 2, None
+        )
+    # one engine for all tables
+    assert engine.call_count == 1
+    assert disposed.call_count == 1